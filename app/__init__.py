@@ -1,44 +1,126 @@
 from flask import Flask
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-import os, secrets
+from collections.abc import Mapping
+import importlib, os, secrets, threading
 
 db = SQLAlchemy()
 login = LoginManager()
 login.login_view = "auth.login"
 
+# (module, url prefix); each module defines `bp`
+BLUEPRINTS = (
+    ('app.routes.auth', '/auth'),
+    ('app.routes.admin', '/admin'),
+    ('app.routes.doctor', '/doctor'),
+    ('app.routes.patient', '/patient'),
+    ('app.routes.api', '/api'),
+)
 
-def create_app():
+# (name, module, attribute) of the `flask` commands; imported when invoked
+CLI_COMMANDS = (
+    ('bootstrap', 'app.bootstrap', 'bootstrap_command'),
+    ('import-csv', 'app.importer', 'import_csv_command'),
+    ('jobs-worker', 'app.jobs', 'jobs_worker_command'),
+    ('analytics-refresh', 'app.analytics', 'analytics_refresh_command'),
+    ('archive', 'app.archive', 'archive_command'),
+)
+
+
+def register_blueprints(app):
+    for module, prefix in BLUEPRINTS:
+        app.register_blueprint(importlib.import_module(module).bp, url_prefix=prefix)
+
+
+class _LazyCLI(AppGroup):
+    """app.cli that imports a command's module (and the models, booking,
+    notify... it pulls in) only when that command is looked up."""
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | {name for name, _, _ in CLI_COMMANDS})
+
+    def get_command(self, ctx, name):
+        for command, module, attr in CLI_COMMANDS:
+            if command == name:
+                return getattr(importlib.import_module(module), attr)
+        return super().get_command(ctx, name)
+
+
+class _RegisterOnFirstRequest:
+    """
+    WSGI wrapper for LAZY_BLUEPRINTS: the route modules (and the models,
+    booking, importer... they pull in) are imported when the first request
+    arrives instead of in create_app(). Flask refuses new blueprints once it
+    has handled a request, so this runs in front of it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if self.app.wsgi_app is self:
+            with self.lock:
+                if self.app.wsgi_app is self:
+                    register_blueprints(self.app)
+                    self.app.wsgi_app = self.wsgi_app
+        return self.wsgi_app(environ, start_response)
+
+
+def create_app(config=None):
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     template_dir = os.path.join(BASE_DIR, 'templates')
     static_dir = os.path.join(BASE_DIR, 'static')
 
     app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
+    app.cli = _LazyCLI()
 
     if os.environ.get('FLASK_SECRET'):
         app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET')
     else:
         # new random secret on each start -> forces logout after restart
         app.config['SECRET_KEY'] = secrets.token_urlsafe(32)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # DB URI, pool and SQLite pragmas come from app/config.py (env vars),
+    # optionally overridden by a config object or dict passed in
+    from app.config import Config, engine_options, apply_sqlite_pragmas, is_sqlite
+    app.config.from_object(Config)
+    if config is not None:
+        if isinstance(config, Mapping):
+            app.config.update(config)
+        else:
+            app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
     print("Database path:", app.config['SQLALCHEMY_DATABASE_URI'])
     print("Instance path:", app.instance_path)
 
     db.init_app(app)
     login.init_app(app)
 
-    from app.routes.auth import bp as auth_bp
-    from app.routes.admin import bp as admin_bp
-    from app.routes.doctor import bp as doctor_bp
-    from app.routes.patient import bp as patient_bp
-    from app.routes.api import bp as api_bp
+    with app.app_context():
+        if is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+            apply_sqlite_pragmas(db.engine, app.config)
 
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(admin_bp, url_prefix='/admin')
-    app.register_blueprint(doctor_bp, url_prefix='/doctor')
-    app.register_blueprint(patient_bp, url_prefix='/patient')
-    app.register_blueprint(api_bp, url_prefix='/api')
+    from app import cache, fragments, metrics, passwords
+    cache.configure(app.config)
+    passwords.configure(app.config)
+    metrics.init_app(app)
+    fragments.init_app(app)
+
+    if app.config.get('TRUSTED_PROXIES'):
+        # client address and scheme from the proxies' X-Forwarded-* headers
+        # (the per-IP login throttle keys on request.remote_addr)
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    # no database I/O from here on: schema, migrations and seed data are
+    # `flask bootstrap` (app/bootstrap.py)
+    if app.config.get('LAZY_BLUEPRINTS'):
+        app.wsgi_app = _RegisterOnFirstRequest(app)
+    else:
+        register_blueprints(app)
 
      # 🔽🔽🔽 ADD THIS BLOCK HERE 🔽🔽🔽
     @app.route('/')
@@ -68,21 +150,20 @@ def create_app():
         return render_template('errors/403.html', user=current_user), 403
 
 
-    with app.app_context():
-        from app import models
-        db.create_all()
-
-        from app.models import User, Department
-        if not User.query.filter_by(username='admin').first():
-            u = User(username='admin', email='admin@example.com')
-            u.set_password('adminpass')
-            u.role = 'admin'
-            db.session.add(u)
-        if Department.query.count() == 0:
-            for name in ['Cardiology','Oncology','General']:
-                db.session.add(Department(name=name, description=f'{name} department'))
-        db.session.commit()
+    if app.config.get('BOOTSTRAP_ON_START'):
+        from app.bootstrap import bootstrap
+        with app.app_context():
+            bootstrap()
+
     # inside create_app(), after app initialization and config
     app.jinja_env.globals['getattr'] = getattr
+    from app.pagination import page_url
+    app.jinja_env.globals['page_url'] = page_url
+
+    if app.config.get('PRELOAD_TEMPLATES'):
+        # compile every template now: forked workers (gunicorn --preload)
+        # inherit them instead of each compiling on its first requests
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
 
     return app
@@ -0,0 +1,392 @@
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, text, func, case, or_
+
+from app import db, jobs
+from app.models import DailyStats, MonthlyStats, DepartmentDailyStats, AnalyticsState, Doctor, User
+
+# Precomputed admin reports, summed over a date range by summary(). Three
+# rollups with the same counters (models.RollupCounters):
+#
+#   daily_stats             per doctor and day, computed from the base tables
+#   monthly_stats           per doctor and month, the sum of daily_stats rows
+#   department_daily_stats  per department and day, likewise
+#
+# A year of 200 doctors is ~73k daily rows -- still tens of milliseconds to
+# add up -- but 2.4k monthly rows, so department/doctor reports read whole
+# months from monthly_stats and only the ragged ends (and the current month,
+# see no-shows below) from daily_stats; per-day reports read
+# department_daily_stats, or daily_stats for a single doctor.
+#
+# Keeping the rollups current:
+#
+#   1. SQLite triggers on appointment, availability and doctor record every
+#      (doctor_id, date) a write touches in analytics_dirty. Triggers see
+#      every write path -- ORM, bulk statements, the CSV importer, raw SQL --
+#      and cost one INSERT OR IGNORE into a small table.
+#   2. refresh() takes a batch of dirty keys, recomputes just those
+#      doctor-days from the base tables and their archives (index range scans
+#      on (doctor_id, date); soft-deleted rows don't count) and then the
+#      months and department-days they fall in. It starts with the DELETE from analytics_dirty, so
+#      it holds the write lock for the whole recompute and a concurrent write
+#      can only re-mark a key after it.
+#   3. The jobs worker runs refresh() whenever its queue is idle; `flask
+#      analytics-refresh` does everything (or --rebuild from scratch). The
+#      report views only read the rollups, and show how many doctor-days
+#      are still queued and when refresh() last ran (analytics_state).
+#
+# Rates are derived at read time: cancellation = cancelled / appointments;
+# a scheduled appointment on a day that has passed was never completed and
+# counts as a no-show (which is why the current month, half past and half
+# future, comes from the daily rows) (no-show rate = no-shows / (completed + no-shows));
+# utilization = booked minutes / (booked minutes + unbooked slot minutes).
+# Lead time is booking to appointment day, for rows with created_at.
+#
+# Like search.py this is SQLite-only; other backends get empty reports.
+
+GROUPS = ('department', 'doctor', 'day')
+MAX_RANGE_DAYS = 3660
+
+COUNTERS = ('appointments', 'scheduled', 'completed', 'cancelled', 'booked_minutes',
+            'open_slots', 'booked_slots', 'open_minutes', 'lead_days_sum', 'lead_count')
+
+_MINUTES = ("CAST(ROUND((julianday('2000-01-01 ' || substr({t}.end_time, 1, 8)) - "
+            "julianday('2000-01-01 ' || substr({t}.start_time, 1, 8))) * 1440) AS INTEGER)")
+
+TRIGGERS = {
+    'analytics_appointment_insert':
+        "AFTER INSERT ON appointment BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT NEW.doctor_id, NEW.date WHERE NEW.doctor_id IS NOT NULL AND NEW.date IS NOT NULL; END",
+    'analytics_appointment_update':
+        "AFTER UPDATE OF doctor_id, date, start_time, end_time, status, created_at ON appointment BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT OLD.doctor_id, OLD.date WHERE OLD.doctor_id IS NOT NULL AND OLD.date IS NOT NULL; "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT NEW.doctor_id, NEW.date WHERE NEW.doctor_id IS NOT NULL AND NEW.date IS NOT NULL; END",
+    'analytics_appointment_delete':
+        "AFTER DELETE ON appointment BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT OLD.doctor_id, OLD.date WHERE OLD.doctor_id IS NOT NULL AND OLD.date IS NOT NULL; END",
+    'analytics_availability_insert':
+        "AFTER INSERT ON availability BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT NEW.doctor_id, NEW.date WHERE NEW.doctor_id IS NOT NULL AND NEW.date IS NOT NULL; END",
+    'analytics_availability_update':
+        "AFTER UPDATE OF doctor_id, date, start_time, end_time, is_booked ON availability BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT OLD.doctor_id, OLD.date WHERE OLD.doctor_id IS NOT NULL AND OLD.date IS NOT NULL; "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT NEW.doctor_id, NEW.date WHERE NEW.doctor_id IS NOT NULL AND NEW.date IS NOT NULL; END",
+    'analytics_availability_delete':
+        "AFTER DELETE ON availability BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT OLD.doctor_id, OLD.date WHERE OLD.doctor_id IS NOT NULL AND OLD.date IS NOT NULL; END",
+    # rows carry the doctor's department: moving a doctor re-files their days
+    'analytics_doctor_department':
+        "AFTER UPDATE OF department_id ON doctor BEGIN "
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT doctor_id, date FROM daily_stats WHERE doctor_id = NEW.id; END",
+}
+
+# CROSS JOIN keeps SQLite from reordering: walk the few keys and probe the
+# (doctor_id, date) indexes rather than scan them
+_RECOMPUTE = f"""
+INSERT INTO daily_stats (doctor_id, date, department_id, {', '.join(COUNTERS)})
+SELECT k.doctor_id, k.date, d.department_id,
+       COALESCE(a.appointments, 0), COALESCE(a.scheduled, 0), COALESCE(a.completed, 0),
+       COALESCE(a.cancelled, 0), COALESCE(a.booked_minutes, 0),
+       COALESCE(s.open_slots, 0), COALESCE(s.booked_slots, 0), COALESCE(s.open_minutes, 0),
+       COALESCE(a.lead_days_sum, 0), COALESCE(a.lead_count, 0)
+FROM temp.analytics_keys k
+LEFT JOIN doctor d ON d.id = k.doctor_id
+LEFT JOIN (
+    SELECT ap.doctor_id, ap.date, COUNT(*) AS appointments,
+           SUM(ap.status = 'scheduled') AS scheduled,
+           SUM(ap.status = 'completed') AS completed,
+           SUM(ap.status = 'cancelled') AS cancelled,
+           SUM(CASE WHEN ap.status != 'cancelled' THEN {_MINUTES.format(t='ap')} ELSE 0 END) AS booked_minutes,
+           SUM(MAX(0, julianday(ap.date) - julianday(date(ap.created_at)))) AS lead_days_sum,
+           COUNT(ap.created_at) AS lead_count
+    FROM (
+        SELECT ap.doctor_id, ap.date, ap.status, ap.start_time, ap.end_time, ap.created_at
+        FROM temp.analytics_keys k2
+        CROSS JOIN appointment ap ON ap.doctor_id = k2.doctor_id AND ap.date = k2.date
+        UNION ALL
+        SELECT ap.doctor_id, ap.date, ap.status, ap.start_time, ap.end_time, ap.created_at
+        FROM temp.analytics_keys k2
+        CROSS JOIN appointment_archive ap ON ap.doctor_id = k2.doctor_id AND ap.date = k2.date
+        WHERE ap.deleted_at IS NULL
+    ) ap
+    GROUP BY ap.doctor_id, ap.date
+) a ON a.doctor_id = k.doctor_id AND a.date = k.date
+LEFT JOIN (
+    SELECT av.doctor_id, av.date,
+           SUM(NOT av.is_booked) AS open_slots,
+           SUM(av.is_booked) AS booked_slots,
+           SUM(CASE WHEN NOT av.is_booked THEN {_MINUTES.format(t='av')} ELSE 0 END) AS open_minutes
+    FROM (
+        SELECT av.doctor_id, av.date, av.is_booked, av.start_time, av.end_time
+        FROM temp.analytics_keys k3
+        CROSS JOIN availability av ON av.doctor_id = k3.doctor_id AND av.date = k3.date
+        UNION ALL
+        SELECT av.doctor_id, av.date, av.is_booked, av.start_time, av.end_time
+        FROM temp.analytics_keys k3
+        CROSS JOIN availability_archive av ON av.doctor_id = k3.doctor_id AND av.date = k3.date
+    ) av
+    GROUP BY av.doctor_id, av.date
+) s ON s.doctor_id = k.doctor_id AND s.date = k.date
+WHERE a.doctor_id IS NOT NULL OR s.doctor_id IS NOT NULL
+"""
+
+
+_SUMS = ', '.join(f'SUM(ds.{c})' for c in COUNTERS)
+
+_TEMP_TABLES = [
+    "CREATE TEMP TABLE IF NOT EXISTS analytics_keys (doctor_id INTEGER, date DATE, PRIMARY KEY (doctor_id, date))",
+    "CREATE TEMP TABLE IF NOT EXISTS analytics_dept_days (department_id INTEGER, date DATE)",
+    "DELETE FROM temp.analytics_keys",
+    "DELETE FROM temp.analytics_dept_days",
+]
+
+_REFRESH = [
+    # department-days the keys belonged to before (a doctor may have moved) ...
+    "INSERT INTO temp.analytics_dept_days SELECT department_id, date FROM daily_stats "
+    "WHERE (doctor_id, date) IN (SELECT doctor_id, date FROM temp.analytics_keys)",
+    "DELETE FROM daily_stats WHERE (doctor_id, date) IN (SELECT doctor_id, date FROM temp.analytics_keys)",
+    _RECOMPUTE,
+    # ... and after
+    "INSERT INTO temp.analytics_dept_days SELECT department_id, date FROM daily_stats "
+    "WHERE (doctor_id, date) IN (SELECT doctor_id, date FROM temp.analytics_keys)",
+
+    "DELETE FROM monthly_stats WHERE (doctor_id, month) IN "
+    "(SELECT doctor_id, date(date, 'start of month') FROM temp.analytics_keys)",
+    f"INSERT INTO monthly_stats (doctor_id, month, department_id, {', '.join(COUNTERS)}) "
+    f"SELECT m.doctor_id, m.month, MAX(ds.department_id), {_SUMS} "
+    "FROM (SELECT DISTINCT doctor_id, date(date, 'start of month') AS month FROM temp.analytics_keys) m "
+    "JOIN daily_stats ds ON ds.doctor_id = m.doctor_id AND ds.date >= m.month AND ds.date < date(m.month, '+1 month') "
+    "GROUP BY m.doctor_id, m.month",
+
+    "DELETE FROM department_daily_stats WHERE (department_id, date) IN "
+    "(SELECT department_id, date FROM temp.analytics_dept_days)",
+    "DELETE FROM department_daily_stats WHERE department_id IS NULL AND date IN "
+    "(SELECT date FROM temp.analytics_dept_days WHERE department_id IS NULL)",
+    f"INSERT INTO department_daily_stats (department_id, date, {', '.join(COUNTERS)}) "
+    f"SELECT t.department_id, t.date, {_SUMS} "
+    "FROM (SELECT DISTINCT department_id, date FROM temp.analytics_dept_days) t "
+    "JOIN daily_stats ds ON ds.department_id IS t.department_id AND ds.date = t.date "
+    "GROUP BY t.department_id, t.date",
+]
+
+
+def _enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def init():
+    """Install the triggers; if they were missing, queue every existing doctor-day for a refresh."""
+    if not _enabled():
+        return
+    existing = {r[0] for r in db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'analytics_%'"))}
+    missing = [name for name in TRIGGERS if name not in existing]
+    for name in missing:
+        db.session.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {TRIGGERS[name]}"))
+    if missing:
+        mark_all()
+    db.session.commit()
+
+
+def mark_all():
+    """Queue every doctor-day with data, and every stale rollup row, for a refresh. Caller commits."""
+    db.session.execute(text(
+        "INSERT OR IGNORE INTO analytics_dirty (doctor_id, date) "
+        "SELECT doctor_id, date FROM appointment WHERE doctor_id IS NOT NULL AND date IS NOT NULL "
+        "UNION SELECT doctor_id, date FROM availability WHERE doctor_id IS NOT NULL AND date IS NOT NULL "
+        "UNION SELECT doctor_id, date FROM appointment_archive "
+        "WHERE doctor_id IS NOT NULL AND date IS NOT NULL AND deleted_at IS NULL "
+        "UNION SELECT doctor_id, date FROM availability_archive WHERE doctor_id IS NOT NULL AND date IS NOT NULL "
+        "UNION SELECT doctor_id, date FROM daily_stats"))
+
+
+def pending():
+    """Number of doctor-days waiting for a refresh."""
+    if not _enabled():
+        return 0
+    return db.session.execute(text("SELECT COUNT(*) FROM analytics_dirty")).scalar()
+
+
+def last_refresh():
+    """When refresh() last recomputed anything, or None."""
+    state = db.session.get(AnalyticsState, 1)
+    return state.refreshed_at if state else None
+
+
+def refresh(limit=None):
+    """Recompute up to `limit` dirty doctor-days (all when None) and commit. Returns how many."""
+    if not _enabled():
+        return 0
+    if db.session.execute(text("SELECT 1 FROM analytics_dirty LIMIT 1")).first() is None:
+        db.session.commit()
+        return 0
+    db.session.commit()     # end the read so the DELETE below starts on a fresh snapshot
+    keys = db.session.execute(
+        text("DELETE FROM analytics_dirty WHERE rowid IN (SELECT rowid FROM analytics_dirty LIMIT :n) "
+             "RETURNING doctor_id, date"),
+        {'n': limit if limit else -1}).all()
+    for ddl in _TEMP_TABLES:
+        db.session.execute(text(ddl))
+    if keys:
+        db.session.execute(text("INSERT INTO temp.analytics_keys (doctor_id, date) VALUES (:d, :day)"),
+                           [{'d': d, 'day': day} for d, day in keys])
+        for sql in _REFRESH:
+            db.session.execute(text(sql))
+        db.session.merge(AnalyticsState(id=1, refreshed_at=datetime.now()))
+    db.session.commit()
+    return len(keys)
+
+
+@jobs.idle_task
+def refresh_rollups():
+    refresh(current_app.config.get('ANALYTICS_REFRESH_BATCH', 5000))
+
+
+# ---------- reports ----------
+
+def parse_range(args):
+    """(date_from, date_to) from ?from=&to= (inclusive), defaulting to the last ANALYTICS_DEFAULT_DAYS.
+    Raises ValueError."""
+    out = {}
+    for name in ('from', 'to'):
+        value = args.get(name)
+        if value:
+            try:
+                out[name] = datetime.fromisoformat(value).date()
+            except ValueError:
+                raise ValueError(f"Invalid {name}; use ISO YYYY-MM-DD")
+    date_to = out.get('to') or date.today()
+    date_from = out.get('from') or date_to - timedelta(days=current_app.config.get('ANALYTICS_DEFAULT_DAYS', 30) - 1)
+    if date_from > date_to:
+        raise ValueError("from must not be after to")
+    if (date_to - date_from).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"range must be under {MAX_RANGE_DAYS} days")
+    return date_from, date_to
+
+
+def _rates(row):
+    row['no_show_rate'] = _ratio(row['no_shows'], row['completed'] + row['no_shows'])
+    row['cancellation_rate'] = _ratio(row['cancelled'], row['appointments'])
+    row['utilization'] = _ratio(row['booked_minutes'], row['booked_minutes'] + row['open_minutes'])
+    row['avg_lead_days'] = round(row['lead_days_sum'] / row['lead_count'], 1) if row['lead_count'] else None
+    del row['lead_days_sum']
+    return row
+
+
+def _ratio(n, d):
+    return round(n / d, 4) if d else None
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _split(date_from, date_to, today):
+    """Whole months inside the range except the current one (monthly_stats), and the day spans left over."""
+    months, spans = [], []
+    current = today.replace(day=1)
+    m = date_from.replace(day=1)
+    while m <= date_to:
+        last = _next_month(m) - timedelta(days=1)
+        if m >= date_from and last <= date_to and m != current:
+            months.append(m)
+        else:
+            spans.append((max(m, date_from), min(last, date_to)))
+        m = _next_month(m)
+    return months, spans
+
+
+def _sums(model, key, when, past, filters):
+    cols = [func.coalesce(func.sum(getattr(model, c)), 0).label(c) for c in COUNTERS]
+    cols.append(func.coalesce(func.sum(case((past, model.scheduled), else_=0)), 0).label('no_shows'))
+    q = select(key.label('key'), *cols).where(when).group_by(key)
+    for name, value in filters.items():
+        if value is not None:
+            q = q.where(getattr(model, name) == value)
+    return db.session.execute(q)
+
+
+def summary(date_from, date_to, group='department', department_id=None, doctor_id=None):
+    """Totals and per-group rows (department, doctor or day) for an inclusive date range."""
+    if group not in GROUPS:
+        raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+    today = date.today()
+    filters = {'department_id': department_id, 'doctor_id': doctor_id}
+    if group == 'day':
+        model = DailyStats if doctor_id is not None else DepartmentDailyStats
+        if model is DepartmentDailyStats:
+            filters = {'department_id': department_id}
+        results = [_sums(model, model.date, model.date.between(date_from, date_to), model.date < today, filters)]
+    else:
+        key = 'department_id' if group == 'department' else 'doctor_id'
+        months, spans = _split(date_from, date_to, today)
+        results = []
+        if months:
+            results.append(_sums(MonthlyStats, getattr(MonthlyStats, key), MonthlyStats.month.in_(months),
+                                 MonthlyStats.month < today.replace(day=1), filters))
+        if spans:
+            results.append(_sums(DailyStats, getattr(DailyStats, key),
+                                 or_(*[DailyStats.date.between(lo, hi) for lo, hi in spans]),
+                                 DailyStats.date < today, filters))
+
+    merged = {}
+    for result in results:
+        for r in result:
+            row = merged.get(r.key)
+            if row is None:
+                merged[r.key] = dict(r._mapping)
+            else:
+                for c in COUNTERS + ('no_shows',):
+                    row[c] += r._mapping[c]
+    rows = [merged[k] for k in sorted(merged, key=lambda k: (k is None, k))]
+
+    totals = {c: sum(r[c] for r in rows) for c in COUNTERS + ('no_shows',)}
+    labels = _labels(group, [r['key'] for r in rows])
+    for r in rows:
+        if group == 'day':
+            r['key'] = r['key'].isoformat()
+        r['label'] = labels.get(r['key'], r['key'])
+        _rates(r)
+    return {'from': date_from.isoformat(), 'to': date_to.isoformat(), 'group': group,
+            'totals': _rates(totals), 'rows': rows}
+
+
+def _labels(group, keys):
+    if group == 'department':
+        from app import cache
+        return {d['id']: d['name'] for d in cache.departments()}
+    if group == 'doctor' and keys:
+        return dict(db.session.execute(
+            select(Doctor.id, User.username).join(User, User.id == Doctor.user_id).where(Doctor.id.in_(keys))).all())
+    return {}
+
+
+@click.command('analytics-refresh')
+@click.option('--rebuild', is_flag=True, help='recompute every doctor-day, not just the changed ones')
+@with_appcontext
+def analytics_refresh_command(rebuild):
+    """Bring the analytics rollups up to date."""
+    if rebuild:
+        for table in ('daily_stats', 'monthly_stats', 'department_daily_stats'):
+            db.session.execute(text(f"DELETE FROM {table}"))
+        mark_all()
+        db.session.commit()
+    total = 0
+    while True:
+        n = refresh(current_app.config.get('ANALYTICS_REFRESH_BATCH', 5000))
+        if not n:
+            break
+        total += n
+    click.echo(f'refreshed {total} doctor-days')
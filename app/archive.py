@@ -0,0 +1,171 @@
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, insert, delete, text
+
+from app import db, cache, jobs
+from app.models import Appointment, Availability, AppointmentArchive, AvailabilityArchive
+
+# Archive tier: keeps appointment and availability down to recent and future
+# rows.
+#
+# Appointments dated more than ARCHIVE_AFTER_DAYS ago, cancelled ones more
+# than ARCHIVE_CANCELLED_AFTER_DAYS ago, and slots past ARCHIVE_AFTER_DAYS
+# move to appointment_archive / availability_archive with their ids (both
+# hot tables are AUTOINCREMENT, so an archived id is never handed out
+# again). archive_batch() moves at most ARCHIVE_BATCH_SIZE rows of each in
+# one short transaction, found through ix_appointment_date,
+# ix_appointment_cancelled (a partial index holding only cancelled rows) and
+# ix_availability_open_time (slots with is_booked NULL included). The jobs
+# worker runs one batch whenever its queue is idle; `flask archive` drains a
+# backlog in one go.
+#
+# Deleting an appointment is a soft delete: soft_delete() moves the rows to
+# the archive with deleted_at set. Nothing reads deleted rows except
+# /api/appointments?archived=deleted.
+#
+# Reads that span years (admin lists, /api/appointments, the doctor calendar
+# API, analytics rollups) go through models.AppointmentRecord, a UNION ALL
+# of both tables. SQLite merges the two index scans in keyset order, so a
+# page costs the same as before. The dashboards, booking and slot search
+# only look at the recent past and the future, so they stay on the hot
+# tables. Moving rows fires the analytics delete triggers; the recompute
+# reads the archive too, so the rollups come out unchanged.
+
+_APPOINTMENT_COLUMNS = ('id', 'patient_id', 'doctor_id', 'department_id', 'date', 'start_time', 'end_time',
+                        'mode', 'status', 'availability_id', 'created_at')
+_AVAILABILITY_COLUMNS = ('id', 'doctor_id', 'date', 'start_time', 'end_time', 'is_booked')
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default)
+
+
+def cutoffs(today=None):
+    """(date, cancelled date): rows dated before these are due for the archive; None when archiving is off."""
+    days = _setting('ARCHIVE_AFTER_DAYS', 365)
+    if not days:
+        return None
+    today = today or date.today()
+    return (today - timedelta(days=days),
+            today - timedelta(days=min(days, _setting('ARCHIVE_CANCELLED_AFTER_DAYS', 14))))
+
+
+def _move_appointments(ids, deleted_at=None):
+    """Copy the appointments to the archive and delete them. Returns the doctors they belonged to."""
+    now = datetime.now()
+    doctors = set(db.session.execute(
+        select(Appointment.doctor_id).where(Appointment.id.in_(ids)).distinct()).scalars())
+    cols = [getattr(Appointment, c) for c in _APPOINTMENT_COLUMNS]
+    if deleted_at is not None:
+        # the slot was released and may be someone else's now
+        cols[_APPOINTMENT_COLUMNS.index('availability_id')] = db.null()
+    db.session.execute(
+        insert(AppointmentArchive).from_select(
+            list(_APPOINTMENT_COLUMNS) + ['archived_at', 'deleted_at'],
+            select(*cols, db.literal(now), db.literal(deleted_at)).where(Appointment.id.in_(ids))))
+    db.session.execute(delete(Appointment).where(Appointment.id.in_(ids))
+                       .execution_options(synchronize_session=False))
+    return {d for d in doctors if d is not None}
+
+
+def soft_delete(ids):
+    """Move appointments to the archive as deleted. Release their slots first; caller commits."""
+    ids = list(ids)
+    doctors = set()
+    for i in range(0, len(ids), 500):
+        doctors |= _move_appointments(ids[i:i + 500], deleted_at=datetime.now())
+    cache.invalidate_on_commit(*[('version', 'appointments', d) for d in doctors])
+    return len(ids)
+
+
+def archive_batch(batch_size=None, today=None):
+    """Move one batch of due appointments and slots. Caller commits. Returns (appointments, slots) moved."""
+    due = cutoffs(today)
+    if due is None:
+        return 0, 0
+    horizon, cancelled = due
+    n = batch_size or _setting('ARCHIVE_BATCH_SIZE', 2000)
+    params = {'horizon': horizon.isoformat(), 'cancelled': cancelled.isoformat(), 'n': n}
+    # literal status so SQLite can use the partial index
+    ids = db.session.execute(text(
+        "SELECT id FROM (SELECT id FROM appointment WHERE date < :horizon LIMIT :n) "
+        "UNION SELECT id FROM (SELECT id FROM appointment WHERE status = 'cancelled' AND date < :cancelled "
+        "LIMIT :n)"), params).scalars().all()[:n]
+    doctors = _move_appointments(ids) if ids else set()
+
+    # is_booked is nullable (legacy and imported slots); each branch is an
+    # ix_availability_open_time range
+    slot_ids = db.session.execute(text(
+        "SELECT id FROM (SELECT id FROM availability WHERE is_booked IN (0, 1) AND date < :horizon LIMIT :n) "
+        "UNION ALL SELECT id FROM (SELECT id FROM availability WHERE is_booked IS NULL AND date < :horizon "
+        "LIMIT :n)"), params).scalars().all()[:n]
+    if slot_ids:
+        doctors |= set(db.session.execute(
+            select(Availability.doctor_id).where(Availability.id.in_(slot_ids)).distinct()).scalars())
+        cols = [getattr(Availability, c) for c in _AVAILABILITY_COLUMNS]
+        db.session.execute(
+            insert(AvailabilityArchive).from_select(
+                list(_AVAILABILITY_COLUMNS) + ['archived_at'],
+                select(*cols, db.literal(datetime.now())).where(Availability.id.in_(slot_ids))))
+        db.session.execute(delete(Availability).where(Availability.id.in_(slot_ids))
+                           .execution_options(synchronize_session=False))
+    doctors.discard(None)
+    cache.invalidate_on_commit(*[('version', 'appointments', d) for d in doctors],
+                               *[('doctor_slots', d) for d in doctors])
+    return len(ids), len(slot_ids)
+
+
+def run(batch_size=None, max_batches=None):
+    """Archive batches, committing each, until nothing is due. Returns (appointments, slots) moved."""
+    moved = [0, 0]
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        appointments, slots = archive_batch(batch_size)
+        db.session.commit()
+        moved[0] += appointments
+        moved[1] += slots
+        batches += 1
+        if not appointments and not slots:
+            break
+    return tuple(moved)
+
+
+def pending(today=None):
+    """Rows due for the archive: {'appointments': n, 'slots': n}."""
+    due = cutoffs(today)
+    if due is None:
+        return {'appointments': 0, 'slots': 0}
+    horizon, cancelled = due
+    appointments = db.session.execute(text(
+        "SELECT (SELECT COUNT(*) FROM appointment WHERE date < :horizon) + "
+        "(SELECT COUNT(*) FROM appointment WHERE status = 'cancelled' AND date >= :horizon AND date < :cancelled)"),
+        {'horizon': horizon.isoformat(), 'cancelled': cancelled.isoformat()}).scalar()
+    slots = db.session.execute(text(
+        "SELECT (SELECT COUNT(*) FROM availability WHERE is_booked IN (0, 1) AND date < :horizon) + "
+        "(SELECT COUNT(*) FROM availability WHERE is_booked IS NULL AND date < :horizon)"),
+        {'horizon': horizon.isoformat()}).scalar()
+    return {'appointments': appointments, 'slots': slots}
+
+
+@jobs.idle_task
+def archive_upkeep():
+    if archive_batch() != (0, 0):
+        db.session.commit()
+    else:
+        db.session.rollback()
+
+
+@click.command('archive')
+@click.option('--batch-size', type=int, default=None, help='rows per table per batch (default: ARCHIVE_BATCH_SIZE)')
+@click.option('--max-batches', type=int, default=None, help='stop after this many batches')
+@with_appcontext
+def archive_command(batch_size, max_batches):
+    """Move appointments and slots past the archive horizon into the archive tables."""
+    if cutoffs() is None:
+        click.echo('archiving is off (ARCHIVE_AFTER_DAYS=0)')
+        return
+    appointments, slots = run(batch_size, max_batches)
+    click.echo(f'archived {appointments} appointments and {slots} slots; still due: {pending()}')
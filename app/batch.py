@@ -0,0 +1,290 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, tuple_
+from sqlalchemy.exc import OperationalError
+from app import db, cache, notify, archive
+from app.booking import SLOT_TAKEN, DOCTOR_BUSY, BUSY
+from app.intervals import DayIntervals
+from app.models import Appointment, Availability, Doctor, Patient
+
+# Batch create / status update / delete for POST /api/appointments/batch.
+#
+# Every item is validated up front with a handful of IN queries (existence,
+# current rows, live appointments on the affected doctor-days), then the
+# accepted ones are written with set-based statements in one transaction:
+# deletes and cancellations first so their slots can be re-booked by creates
+# in the same batch, then status updates, then one multi-row INSERT. Deleted
+# appointments go to the archive as soft deletes (app/archive.py).
+#
+# Per-item results come back in input order: {"index": i, "ok": true, "id": ..}
+# or {"index": i, "ok": false, "error": ".."}. With atomic=True any failed
+# item rolls the whole batch back.
+
+MAX_BATCH_ITEMS = 1000
+STATUSES = ('scheduled', 'completed', 'cancelled')
+IN_CHUNK = 500
+
+
+def _chunks(seq, size=IN_CHUNK):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _ids_in(column, ids):
+    """Subset of `ids` present in `column`, querying IN_CHUNK at a time."""
+    found = set()
+    for part in _chunks(set(ids)):
+        found.update(r[0] for r in db.session.execute(select(column).where(column.in_(part))))
+    return found
+
+
+def _rows_by_id(ids):
+    rows = {}
+    for part in _chunks(set(ids)):
+        for r in db.session.execute(
+                select(Appointment.id, Appointment.doctor_id, Appointment.availability_id,
+                       Appointment.patient_id, Appointment.date, Appointment.start_time, Appointment.status)
+                .where(Appointment.id.in_(part))):
+            rows[r.id] = r
+    return rows
+
+
+def _int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    return int(value)
+
+
+def _parse_create(item):
+    """Validate one create item. Returns (values, error)."""
+    if not isinstance(item, dict):
+        return None, 'item must be an object'
+    try:
+        patient_id = _int(item['patient_id'])
+    except (KeyError, TypeError, ValueError):
+        return None, 'patient_id is required'
+    status = item.get('status', 'scheduled')
+    if status not in STATUSES:
+        return None, f"status must be one of {', '.join(STATUSES)}"
+    values = {'patient_id': patient_id, 'status': status,
+              'department_id': item.get('department_id')}
+    try:
+        if values['department_id'] is not None:
+            values['department_id'] = _int(values['department_id'])
+        if item.get('availability_id'):
+            if status == 'cancelled':
+                return None, 'a cancelled appointment cannot book a slot'
+            values['availability_id'] = _int(item['availability_id'])
+            return values, None
+        values['doctor_id'] = _int(item['doctor_id'])
+    except (KeyError, TypeError, ValueError):
+        return None, 'availability_id or doctor_id is required'
+    try:
+        values['date'] = datetime.fromisoformat(item['date']).date()
+    except (KeyError, TypeError, ValueError):
+        return None, 'Invalid date format; use ISO YYYY-MM-DD'
+    values['start_time'] = values['end_time'] = None
+    if item.get('start_time') or item.get('end_time'):
+        try:
+            values['start_time'] = datetime.strptime(item['start_time'], "%H:%M").time()
+            values['end_time'] = datetime.strptime(item['end_time'], "%H:%M").time()
+        except (KeyError, TypeError, ValueError):
+            return None, 'start_time and end_time must both be HH:MM'
+        if values['end_time'] <= values['start_time']:
+            return None, 'end_time must be after start_time'
+    return values, None
+
+
+def apply(creates=(), updates=(), deletes=(), atomic=False):
+    """
+    Apply one batch. Returns (results, error): results maps 'create'/'update'/
+    'delete' to per-item result lists; error is set when nothing was written
+    (atomic batch with failed items, or the database was busy). Commits.
+    """
+    results = {'create': [None] * len(creates), 'update': [None] * len(updates),
+               'delete': [None] * len(deletes)}
+
+    def fail(kind, i, message):
+        results[kind][i] = {'index': i, 'ok': False, 'error': message}
+
+    def ok(kind, i, appt_id):
+        results[kind][i] = {'index': i, 'ok': True, 'id': appt_id}
+
+    touched_doctors = set()
+    try:
+        # ---------- deletes ----------
+        del_ids = {}
+        for i, value in enumerate(deletes):
+            try:
+                del_ids[i] = _int(value)
+            except (TypeError, ValueError):
+                fail('delete', i, 'id must be an integer')
+        # ---------- updates ----------
+        upd = {}
+        for i, item in enumerate(updates):
+            try:
+                appt_id = _int(item['id'])
+            except (KeyError, TypeError, ValueError):
+                fail('update', i, 'id is required')
+                continue
+            if item.get('status') not in STATUSES:
+                fail('update', i, f"status must be one of {', '.join(STATUSES)}")
+                continue
+            upd[i] = (appt_id, item['status'])
+
+        existing = _rows_by_id(list(del_ids.values()) + [a for a, _ in upd.values()])
+        deleted = set()
+        for i, appt_id in del_ids.items():
+            if appt_id not in existing or appt_id in deleted:
+                fail('delete', i, 'Appointment not found')
+            else:
+                deleted.add(appt_id)
+                ok('delete', i, appt_id)
+        for i, (appt_id, _) in upd.items():
+            if appt_id not in existing or appt_id in deleted:
+                fail('update', i, 'Appointment not found')
+        upd = {i: v for i, v in upd.items() if results['update'][i] is None}
+
+        # slots held by deleted or cancelled appointments go back to free
+        freeing = deleted | {a for a, status in upd.values() if status == 'cancelled'}
+        released = [existing[a].availability_id for a in freeing if existing[a].availability_id]
+        touched_doctors.update(existing[a].doctor_id for a in freeing)
+        for part in _chunks(freeing):
+            db.session.execute(update(Appointment).where(Appointment.id.in_(part))
+                               .values(availability_id=None).execution_options(synchronize_session=False))
+        for part in _chunks(released):
+            db.session.execute(update(Availability).where(Availability.id.in_(part))
+                               .values(is_booked=False).execution_options(synchronize_session=False))
+        archive.soft_delete(deleted)
+        by_status = defaultdict(list)
+        for i, (appt_id, status) in upd.items():
+            by_status[status].append(appt_id)
+            ok('update', i, appt_id)
+        notify.appointment_events('cancelled', [
+            {'id': a, 'patient_id': existing[a].patient_id, 'doctor_id': existing[a].doctor_id,
+             'date': existing[a].date, 'start_time': existing[a].start_time, 'status': 'cancelled'}
+            for a in set(by_status.get('cancelled', ())) if existing[a].status != 'cancelled'])
+        for status, ids in by_status.items():
+            for part in _chunks(ids):
+                db.session.execute(update(Appointment).where(Appointment.id.in_(part))
+                                   .values(status=status).execution_options(synchronize_session=False))
+
+        # ---------- creates ----------
+        parsed = {}
+        for i, item in enumerate(creates):
+            values, error = _parse_create(item)
+            if error:
+                fail('create', i, error)
+            else:
+                parsed[i] = values
+
+        known_patients = _ids_in(Patient.id, [v['patient_id'] for v in parsed.values()])
+        known_doctors = _ids_in(Doctor.id, [v['doctor_id'] for v in parsed.values() if 'doctor_id' in v])
+        for i, v in list(parsed.items()):
+            if v['patient_id'] not in known_patients:
+                fail('create', i, 'Unknown patient_id')
+            elif 'doctor_id' in v and v['doctor_id'] not in known_doctors:
+                fail('create', i, 'Unknown doctor_id')
+            else:
+                continue
+            del parsed[i]
+
+        # claim every requested slot with one conditional UPDATE per chunk
+        wanted = {v['availability_id'] for v in parsed.values() if 'availability_id' in v}
+        claimed = {}
+        for part in _chunks(wanted):
+            got = db.session.execute(
+                update(Availability)
+                .where(Availability.id.in_(part), Availability.is_booked.is_(False))
+                .values(is_booked=True)
+                .returning(Availability.id)
+                .execution_options(synchronize_session=False)).scalars().all()
+            for r in db.session.execute(
+                    select(Availability.id, Availability.doctor_id, Availability.date,
+                           Availability.start_time, Availability.end_time, Doctor.department_id)
+                    .join(Doctor, Doctor.id == Availability.doctor_id, isouter=True)
+                    .where(Availability.id.in_(got))):
+                claimed[r.id] = r
+        used = set()
+        for i, v in list(parsed.items()):
+            if 'availability_id' not in v:
+                continue
+            slot = claimed.get(v['availability_id'])
+            if slot is None or slot.id in used:
+                fail('create', i, SLOT_TAKEN)
+                del parsed[i]
+                continue
+            used.add(slot.id)
+            v.update(doctor_id=slot.doctor_id, date=slot.date, start_time=slot.start_time,
+                     end_time=slot.end_time)
+            if v['department_id'] is None:
+                v['department_id'] = slot.department_id
+
+        # live appointments on every doctor-day the batch touches, in one pass
+        days = {(v['doctor_id'], v['date']) for v in parsed.values() if v['start_time'] is not None}
+        taken = defaultdict(DayIntervals)
+        for part in _chunks(days):
+            for r in db.session.execute(
+                    select(Appointment.doctor_id, Appointment.date, Appointment.start_time, Appointment.end_time)
+                    .where(tuple_(Appointment.doctor_id, Appointment.date).in_(part),
+                           Appointment.status != 'cancelled', Appointment.start_time.isnot(None),
+                           Appointment.end_time.isnot(None))):
+                taken[(r.doctor_id, r.date)].add(r.start_time, r.end_time)
+        unclaim = []
+        for i, v in list(parsed.items()):
+            if v['start_time'] is None or v['status'] == 'cancelled':
+                continue
+            day = taken[(v['doctor_id'], v['date'])]
+            if day.overlaps(v['start_time'], v['end_time']):
+                fail('create', i, DOCTOR_BUSY)
+                if 'availability_id' in v:
+                    unclaim.append(v['availability_id'])
+                del parsed[i]
+            else:
+                day.add(v['start_time'], v['end_time'])
+        for part in _chunks(unclaim):
+            db.session.execute(update(Availability).where(Availability.id.in_(part))
+                               .values(is_booked=False).execution_options(synchronize_session=False))
+
+        if atomic and any(r is not None and not r['ok'] for kind in results.values() for r in kind):
+            db.session.rollback()
+            return _drop_ids(results), 'Batch rejected: some items are invalid'
+
+        order = sorted(parsed)
+        if order:
+            rows = [{'patient_id': parsed[i]['patient_id'], 'doctor_id': parsed[i]['doctor_id'],
+                     'department_id': parsed[i]['department_id'], 'date': parsed[i]['date'],
+                     'start_time': parsed[i]['start_time'], 'end_time': parsed[i]['end_time'],
+                     'status': parsed[i]['status'], 'availability_id': parsed[i].get('availability_id')}
+                    for i in order]
+            new_ids = db.session.execute(
+                insert(Appointment).returning(Appointment.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            for i, appt_id in zip(order, new_ids):
+                ok('create', i, appt_id)
+            notify.appointment_events('booked', [dict(r, id=appt_id) for r, appt_id in zip(rows, new_ids)
+                                                 if r['status'] != 'cancelled'])
+            touched_doctors.update(r['doctor_id'] for r in rows if r['availability_id'])
+
+        touched_doctors.update(s.doctor_id for s in claimed.values())
+        cache.invalidate_on_commit(*[('doctor_slots', d) for d in touched_doctors if d is not None])
+        # appointment tables of every doctor whose rows were written (app/fragments.py)
+        changed = {existing[a].doctor_id for a in deleted} | {existing[a].doctor_id for a, _ in upd.values()}
+        if order:
+            changed.update(r['doctor_id'] for r in rows)
+        cache.invalidate_on_commit(*[('version', 'appointments', d) for d in changed if d is not None])
+        db.session.commit()
+    except OperationalError:
+        # SQLite "database is locked" after the busy timeout
+        db.session.rollback()
+        return _drop_ids(results), BUSY
+    return results, None
+
+
+def _drop_ids(results):
+    """Results of a rolled-back batch: keep the per-item errors, nothing was written."""
+    return {kind: [r if r is not None and not r['ok'] else {'index': i, 'ok': True, 'id': None}
+                   for i, r in enumerate(items)]
+            for kind, items in results.items()}
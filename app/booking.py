@@ -0,0 +1,154 @@
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app import db, cache, intervals, notify
+from app.models import Appointment, Availability
+
+# Slot booking shared by the patient pages and the JSON API.
+#
+# A slot is claimed with one conditional UPDATE (is_booked 0 -> 1); only the
+# request whose UPDATE matched the row gets to create the appointment, so two
+# patients racing for the same slot can't both win. The unique index on
+# Appointment.availability_id backs this up at the schema level.
+#
+# Functions return (appointment, error); error is None on success and a
+# user-facing message otherwise. They commit on success and roll back on error.
+# The patient's notifications are queued in the same transaction (app/notify.py).
+
+SLOT_TAKEN = 'Selected slot no longer available'
+DOCTOR_BUSY = 'The doctor already has an appointment at that time'
+BUSY = 'Booking is busy right now, please try again'
+
+
+def _claim(availability_id):
+    """Atomically mark a free slot booked. Returns the slot, or None if it was taken."""
+    res = db.session.execute(
+        update(Availability)
+        .where(Availability.id == availability_id, Availability.is_booked.is_(False))
+        .values(is_booked=True)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount != 1:
+        return None
+    slot = db.session.get(Availability, availability_id, populate_existing=True)
+    cache.invalidate_on_commit(('doctor_slots', slot.doctor_id))
+    return slot
+
+
+def _finish(appt, event):
+    try:
+        db.session.flush()
+        notify.appointment_event(event, appt)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None, SLOT_TAKEN
+    except OperationalError:
+        # SQLite "database is locked" after the busy timeout
+        db.session.rollback()
+        return None, BUSY
+    return appt, None
+
+
+def book_slot(patient_id, availability_id, department_id=None, status='scheduled'):
+    """Create an appointment for `patient_id` in the given availability slot."""
+    try:
+        slot = _claim(availability_id)
+    except OperationalError:
+        db.session.rollback()
+        return None, BUSY
+    if slot is None:
+        db.session.rollback()
+        return None, SLOT_TAKEN
+    if intervals.appointment_conflict(slot.doctor_id, slot.date, slot.start_time, slot.end_time):
+        db.session.rollback()
+        return None, DOCTOR_BUSY
+
+    if department_id is None and slot.doctor:
+        department_id = slot.doctor.department_id
+    appt = Appointment(patient_id=patient_id, doctor_id=slot.doctor_id, department_id=department_id,
+                       date=slot.date, start_time=slot.start_time, end_time=slot.end_time,
+                       status=status, availability_id=slot.id)
+    db.session.add(appt)
+    return _finish(appt, 'booked')
+
+
+def move_appointment(appt, availability_id):
+    """Move an existing appointment to another free slot, releasing the old one."""
+    try:
+        slot = _claim(availability_id)
+    except OperationalError:
+        db.session.rollback()
+        return None, BUSY
+    if slot is None:
+        db.session.rollback()
+        return None, SLOT_TAKEN
+    if intervals.appointment_conflict(slot.doctor_id, slot.date, slot.start_time, slot.end_time,
+                                      exclude_id=appt.id):
+        db.session.rollback()
+        return None, DOCTOR_BUSY
+
+    release_slot(appt)
+    appt.availability_id = slot.id
+    appt.doctor_id = slot.doctor_id
+    if slot.doctor and slot.doctor.department_id:
+        appt.department_id = slot.doctor.department_id
+    appt.date = slot.date
+    appt.start_time = slot.start_time
+    appt.end_time = slot.end_time
+    appt.status = 'scheduled'
+    return _finish(appt, 'changed')
+
+
+def release_slot(appt):
+    """Free the slot held by `appt` (cancel/delete/move). Caller commits."""
+    if appt.availability_id:
+        slot_doctor = db.session.query(Availability.doctor_id).filter_by(id=appt.availability_id).scalar()
+        cache.invalidate_on_commit(('doctor_slots', slot_doctor))
+        db.session.execute(
+            update(Availability)
+            .where(Availability.id == appt.availability_id)
+            .values(is_booked=False)
+            .execution_options(synchronize_session=False)
+        )
+        appt.availability_id = None
+        # the link column is unique; push the NULL out before another row may take the slot
+        db.session.flush()
+
+
+def overlapping_open_slot(appt, doctor_id, day, start, end):
+    """
+    Slot that would stay on offer across [start, end) if `appt` moved there:
+    a free one of the doctor (or appt's own, which the move frees) that
+    overlaps without having exactly those times. None when the move is clear.
+    """
+    slot = intervals.slot_conflict(doctor_id, day, start, end)
+    if slot is None or (slot.start_time, slot.end_time) == (start, end):
+        return None
+    if slot.is_booked and slot.id != appt.availability_id:
+        return None     # held by another appointment; appointment_conflict() reports that
+    return slot
+
+
+def relink_slot(appt):
+    """Link `appt` to the free slot at its doctor, date and times, if there is one. Caller commits."""
+    slot_id = db.session.execute(
+        select(Availability.id)
+        .where(Availability.doctor_id == appt.doctor_id, Availability.date == appt.date,
+               Availability.start_time == appt.start_time, Availability.end_time == appt.end_time,
+               Availability.is_booked.is_(False))
+        .limit(1)).scalar()
+    if slot_id is not None and _claim(slot_id) is not None:
+        appt.availability_id = slot_id
+
+
+def release_slots_for_patient(patient_id):
+    """Free every slot held by a patient's appointments (bulk delete). Caller commits."""
+    held = select(Appointment.availability_id).where(
+        Appointment.patient_id == patient_id, Appointment.availability_id.isnot(None))
+    db.session.execute(
+        update(Availability)
+        .where(Availability.id.in_(held))
+        .values(is_booked=False)
+        .execution_options(synchronize_session=False)
+    )
+    cache.invalidate_on_commit('doctor_slots')
@@ -0,0 +1,51 @@
+import click
+from flask.cli import with_appcontext
+
+from app import db
+
+# One-time database setup, kept out of create_app() so starting a worker
+# touches no database: create missing tables, apply schema migrations, seed
+# the admin account and the default departments, build the search index and
+# install the analytics triggers. Every step is idempotent, so deploys run
+# `flask bootstrap` each time before starting the web workers; on an
+# up-to-date database it is a handful of cheap reads.
+#
+# `python run.py` (the development server) runs it automatically, and so
+# does create_app() with BOOTSTRAP_ON_START set.
+
+DEFAULT_DEPARTMENTS = ('Cardiology', 'Oncology', 'General')
+
+
+def bootstrap():
+    """Bring the database up to date. Needs an app context."""
+    from app import models, search, analytics
+    from app.migrations import run_migrations
+
+    db.create_all()
+    run_migrations()
+
+    if not models.User.query.filter_by(username='admin').first():
+        u = models.User(username='admin', email='admin@example.com')
+        u.set_password('adminpass')
+        u.role = 'admin'
+        db.session.add(u)
+    if models.Department.query.count() == 0:
+        for name in DEFAULT_DEPARTMENTS:
+            db.session.add(models.Department(name=name, description=f'{name} department'))
+    db.session.commit()
+
+    search.init_index()
+    analytics.init()
+
+    # don't hand bootstrap connections to forked workers (gunicorn --preload)
+    db.session.remove()
+    db.engine.dispose()
+
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap_command():
+    """Create or upgrade the database schema and seed the admin account."""
+    bootstrap()
+    from app.migrations import SCHEMA_VERSION
+    click.echo(f'database is up to date (schema version {SCHEMA_VERSION})')
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# In-process cache for the small lookup lists that nearly every page or
+# dropdown needs: departments, doctors per department, open slots per doctor.
+#
+# Keys are tuples whose first item is a namespace, e.g. ('doctor_slots', 7).
+# Entries expire after CACHE_TTL_SECONDS and the least recently used entry is
+# evicted past CACHE_MAX_ENTRIES. Writes call invalidate_on_commit(); the keys
+# are dropped only once the transaction commits, so a concurrent request can't
+# re-cache the pre-commit rows. The cache is per worker process: other workers
+# catch up when their copy expires, so keep the TTL short.
+
+
+class TTLCache:
+    def __init__(self, ttl=30, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        """Drop one key, or a whole namespace when given a plain string."""
+        with self._lock:
+            if isinstance(key, str):
+                for k in [k for k in self._data if k[0] == key]:
+                    del self._data[k]
+            else:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'entries': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                    'hit_ratio': round(self.hits / total, 3) if total else None,
+                    'ttl_seconds': self.ttl, 'max_entries': self.max_entries}
+
+
+lookup_cache = TTLCache()
+# logged-in users, ('principal', user_id) -> models.Principal; kept apart so a
+# busy day's worth of sessions can't evict the lookup lists
+principal_cache = TTLCache(ttl=60, max_entries=10000)
+# next-available-slot searches (app/slot_search.py): a few seconds only and
+# not invalidated by bookings -- a slot taken meanwhile fails to book with
+# the usual "slot taken" message
+slot_search_cache = TTLCache(ttl=5, max_entries=1024)
+# rendered template fragments, ('fragment', name, *vary) -> Markup ({% cache %}, app/fragments.py)
+fragment_cache = TTLCache(ttl=60, max_entries=512)
+
+
+class DataVersions:
+    """
+    Version counters for the data behind cached fragments, keyed like
+    ('version', 'appointments', doctor_id). Fragment keys include the versions
+    they depend on, so bumping a version makes the old fragments unreachable;
+    they age out of fragment_cache.
+
+    Unlike the caches above, the counters live in the database (data_version
+    table, one row per topic plus '*' for "everything"), so a write in one
+    worker process is seen by all of them. Bumps are written in the writing
+    transaction itself -- at each flush and just before commit -- and roll
+    back with it. Reads are remembered for the rest of the request.
+    """
+
+    ALL = '*'
+
+    @staticmethod
+    def _topic(key):
+        return DataVersions.ALL if isinstance(key, str) else ':'.join(str(k) for k in key[1:])
+
+    def get(self, key):
+        from flask import g
+        from app import db
+        seen = g.setdefault('data_versions', {})
+        if key not in seen:
+            seen[key] = db.session.execute(
+                text("SELECT COALESCE(SUM(version), 0) FROM data_version WHERE topic IN (:topic, :all)"),
+                {'topic': self._topic(key), 'all': self.ALL}).scalar()
+        return seen[key]
+
+    def bump(self, connection, keys):
+        """Bump the given versions (a plain string: all of them) in the connection's transaction."""
+        connection.execute(
+            text("INSERT INTO data_version (topic, version) VALUES (:topic, 1) "
+                 "ON CONFLICT (topic) DO UPDATE SET version = version + 1"),
+            [{'topic': t} for t in sorted({self._topic(k) for k in keys})])
+
+    def invalidate(self, key):
+        # already bumped in the committed transaction (_write_versions)
+        pass
+
+
+data_versions = DataVersions()
+
+
+def data_version(*topic):
+    return data_versions.get(('version',) + topic)
+
+
+def configure(config):
+    lookup_cache.ttl = config.get('CACHE_TTL_SECONDS', lookup_cache.ttl)
+    lookup_cache.max_entries = config.get('CACHE_MAX_ENTRIES', lookup_cache.max_entries)
+    principal_cache.ttl = config.get('PRINCIPAL_CACHE_TTL_SECONDS', principal_cache.ttl)
+    principal_cache.max_entries = config.get('PRINCIPAL_CACHE_MAX_ENTRIES', principal_cache.max_entries)
+    slot_search_cache.ttl = config.get('SLOT_SEARCH_CACHE_SECONDS', slot_search_cache.ttl)
+    fragment_cache.ttl = config.get('FRAGMENT_CACHE_SECONDS', fragment_cache.ttl)
+    fragment_cache.max_entries = config.get('FRAGMENT_CACHE_MAX_ENTRIES', fragment_cache.max_entries)
+
+
+def _cache_for(key):
+    namespace = key if isinstance(key, str) else key[0]
+    if namespace == 'principal':
+        return principal_cache
+    if namespace == 'next_slots':
+        return slot_search_cache
+    if namespace == 'fragment':
+        return fragment_cache
+    if namespace == 'version':
+        return data_versions
+    return lookup_cache
+
+
+# ---------- invalidation tied to the DB transaction ----------
+
+def invalidate_on_commit(*keys):
+    from app import db
+    db.session.info.setdefault('cache_invalidate', set()).update(keys)
+
+
+@event.listens_for(Session, 'after_flush')
+@event.listens_for(Session, 'before_commit')
+def _write_versions(session, *args):
+    keys = session.info.get('cache_invalidate')
+    versions = {k for k in keys or () if (k if isinstance(k, str) else k[0]) == 'version'}
+    if versions:
+        keys -= versions
+        data_versions.bump(session.connection(), versions)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for key in session.info.pop('cache_invalidate', ()):
+        _cache_for(key).invalidate(key)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('cache_invalidate', None)
+
+
+# ---------- cached lookups ----------
+# Values are plain dicts (not ORM rows) so they are safe to share between
+# requests; templates read d.id / d.name from them the same way.
+
+def json_entry(data):
+    """Serialized JSON body plus its ETag, so hits skip both steps."""
+    body = json.dumps(data, separators=(',', ':'))
+    return body, hashlib.sha1(body.encode()).hexdigest()
+
+
+def departments():
+    from app.models import Department
+
+    def load():
+        return [{'id': d.id, 'name': d.name, 'description': d.description}
+                for d in Department.query.order_by(Department.name).all()]
+    return lookup_cache.get_or_set(('departments',), load)
+
+
+def department_doctors(dept_id):
+    from app.models import Doctor
+    from sqlalchemy.orm import joinedload
+
+    def load():
+        docs = Doctor.query.options(joinedload(Doctor.user)).filter_by(department_id=dept_id).all()
+        return json_entry([{"id": d.id, "username": d.user.username if d.user else None} for d in docs])
+    return lookup_cache.get_or_set(('dept_doctors', dept_id), load)
+
+
+def principal(user_id):
+    """User, role and doctor/patient profile id for Flask-Login, in one query per TTL."""
+    from app import db
+    from app.models import User, Doctor, Patient, Principal
+    from sqlalchemy import select
+
+    def load():
+        row = db.session.execute(
+            select(User.id, User.username, User.email, User.role, Doctor.id, Patient.id)
+            .outerjoin(Doctor, Doctor.user_id == User.id)
+            .outerjoin(Patient, Patient.user_id == User.id)
+            .where(User.id == user_id).limit(1)).first()
+        return Principal(*row) if row else None
+    return principal_cache.get_or_set(('principal', user_id), load)
+
+
+def doctor_slots(doc_id):
+    """The doctor's open slots from today on, in date/time order."""
+    from datetime import date
+    from app.models import Availability
+
+    def load():
+        avs = (Availability.query.filter_by(doctor_id=doc_id, is_booked=False)
+               .filter(Availability.date >= date.today())
+               .order_by(Availability.date, Availability.start_time).all())
+        return json_entry([{"id": a.id, "date": str(a.date), "start_time": str(a.start_time) if a.start_time else None}
+                           for a in avs])
+    return lookup_cache.get_or_set(('doctor_slots', doc_id), load)
@@ -0,0 +1,165 @@
+import os
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+class Config:
+    """
+    Default settings, overridable through environment variables.
+    Pass another object or a dict to create_app() to override them in code.
+    """
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///hospital.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 10)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)    # seconds, -1 = never
+    DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', True)
+
+    # SQLite pragmas applied on every new connection; None skips a pragma
+    SQLITE_WAL = _env_bool('SQLITE_WAL', True)
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+    # startup (app/__init__.py); schema and seed data come from `flask bootstrap`
+    BOOTSTRAP_ON_START = _env_bool('BOOTSTRAP_ON_START', False)   # run it in create_app() instead
+    LAZY_BLUEPRINTS = _env_bool('LAZY_BLUEPRINTS', False)         # import the routes on the first request
+    PRELOAD_TEMPLATES = _env_bool('PRELOAD_TEMPLATES', False)     # compile all templates in create_app()
+
+    # in-process lookup cache (app/cache.py)
+    CACHE_TTL_SECONDS = _env_int('CACHE_TTL_SECONDS', 30)
+    CACHE_MAX_ENTRIES = _env_int('CACHE_MAX_ENTRIES', 1024)
+    # logged-in user + profile id; other workers see admin edits after at most this long
+    PRINCIPAL_CACHE_TTL_SECONDS = _env_int('PRINCIPAL_CACHE_TTL_SECONDS', 60)
+    PRINCIPAL_CACHE_MAX_ENTRIES = _env_int('PRINCIPAL_CACHE_MAX_ENTRIES', 10000)
+    # /api/slots/next results; a booked slot can be offered for this long
+    SLOT_SEARCH_CACHE_SECONDS = _env_int('SLOT_SEARCH_CACHE_SECONDS', 5)
+
+    # templates (app/fragments.py): compiled bytecode on disk, {% cache %} fragments in memory
+    TEMPLATE_BYTECODE_CACHE = _env_bool('TEMPLATE_BYTECODE_CACHE', True)
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')       # default: instance/jinja_cache
+    FRAGMENT_CACHE_SECONDS = _env_int('FRAGMENT_CACHE_SECONDS', 60)  # 0 = render every time
+    FRAGMENT_CACHE_MAX_ENTRIES = _env_int('FRAGMENT_CACHE_MAX_ENTRIES', 512)
+
+    # password hashing and login throttling (app/passwords.py)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')   # werkzeug notation, with cost
+    PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)   # 0 = hash inline
+    PASSWORD_HASH_POOL = os.environ.get('PASSWORD_HASH_POOL', 'thread')      # 'thread' or 'process'
+    PASSWORD_HASH_MAX_PENDING = _env_int('PASSWORD_HASH_MAX_PENDING', 64)    # then logins get a 503
+    LOGIN_RATE_PER_USERNAME = _env_int('LOGIN_RATE_PER_USERNAME', 10)        # attempts per window, 0 = no limit
+    LOGIN_RATE_PER_IP = _env_int('LOGIN_RATE_PER_IP', 100)
+    LOGIN_RATE_WINDOW_SECONDS = _env_int('LOGIN_RATE_WINDOW_SECONDS', 60)
+    # reverse proxies in front of the app whose X-Forwarded-For/-Proto are trusted
+    # (werkzeug ProxyFix); without it every client behind a proxy shares its IP bucket
+    TRUSTED_PROXIES = _env_int('TRUSTED_PROXIES', 0)
+
+    # background jobs (app/jobs.py) and appointment notifications (app/notify.py)
+    JOBS_BATCH_SIZE = _env_int('JOBS_BATCH_SIZE', 100)
+    JOBS_POLL_SECONDS = _env_float('JOBS_POLL_SECONDS', 2)
+    JOBS_LEASE_SECONDS = _env_int('JOBS_LEASE_SECONDS', 300)     # a crashed worker's jobs run again after this
+    JOBS_MAX_ATTEMPTS = _env_int('JOBS_MAX_ATTEMPTS', 8)
+    JOBS_BACKOFF_SECONDS = _env_int('JOBS_BACKOFF_SECONDS', 30)   # doubles per attempt
+    JOBS_BACKOFF_MAX_SECONDS = _env_int('JOBS_BACKOFF_MAX_SECONDS', 3600)
+    JOBS_KEEP_DONE_DAYS = _env_int('JOBS_KEEP_DONE_DAYS', 7)
+    NOTIFY_ENABLED = _env_bool('NOTIFY_ENABLED', True)
+    NOTIFY_SINK = os.environ.get('NOTIFY_SINK', 'file')            # 'file' or 'smtp'
+    NOTIFY_FILE = os.environ.get('NOTIFY_FILE')                    # default: instance/notifications.jsonl
+    NOTIFY_FROM = os.environ.get('NOTIFY_FROM', 'hospital@example.com')
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+    SMTP_PORT = _env_int('SMTP_PORT', 25)
+    REMINDER_HOURS = _env_int('REMINDER_HOURS', 24)
+
+    # rolling window of the doctor dashboard / availability page and the
+    # calendar API default (app/doctor_calendar.py); past + ahead must stay under 92 days
+    CALENDAR_PAST_DAYS = _env_int('CALENDAR_PAST_DAYS', 7)
+    CALENDAR_AHEAD_DAYS = _env_int('CALENDAR_AHEAD_DAYS', 28)
+
+    # analytics rollups (app/analytics.py)
+    ANALYTICS_REFRESH_BATCH = _env_int('ANALYTICS_REFRESH_BATCH', 5000)            # doctor-days per worker/CLI pass
+    ANALYTICS_DEFAULT_DAYS = _env_int('ANALYTICS_DEFAULT_DAYS', 30)
+
+    # archive tier (app/archive.py): appointments and slots dated more than
+    # ARCHIVE_AFTER_DAYS ago (cancelled ones after ARCHIVE_CANCELLED_AFTER_DAYS)
+    # move to the archive tables, a batch per idle jobs-worker cycle; 0 = off
+    ARCHIVE_AFTER_DAYS = _env_int('ARCHIVE_AFTER_DAYS', 365)
+    ARCHIVE_CANCELLED_AFTER_DAYS = _env_int('ARCHIVE_CANCELLED_AFTER_DAYS', 14)
+    ARCHIVE_BATCH_SIZE = _env_int('ARCHIVE_BATCH_SIZE', 2000)
+
+    # bulk CSV import (app/importer.py); 0 = one password hashing process per CPU
+    IMPORT_HASH_WORKERS = _env_int('IMPORT_HASH_WORKERS', 0)
+
+    # request metrics (app/metrics.py), scraped from /admin/metrics
+    METRICS_ENABLED = _env_bool('METRICS_ENABLED', True)
+    METRICS_SAMPLE_RATE = _env_float('METRICS_SAMPLE_RATE', 1.0)     # share of requests with SQL/template detail
+    METRICS_SERVER_TIMING = _env_bool('METRICS_SERVER_TIMING', False)
+    METRICS_N_PLUS_ONE_THRESHOLD = _env_int('METRICS_N_PLUS_ONE_THRESHOLD', 10)
+    # lets a scraper in with "Authorization: Bearer <token>" instead of an admin session
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def _is_memory_sqlite(uri):
+    return uri in ('sqlite://', 'sqlite:///', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* settings."""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if is_sqlite(uri) and _is_memory_sqlite(uri):
+        # single shared connection, pool sizing doesn't apply
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def apply_sqlite_pragmas(engine, config):
+    """Run the SQLITE_* pragmas on each connection the engine opens."""
+    from sqlalchemy import event
+
+    wal = config.get('SQLITE_WAL')
+    busy = config.get('SQLITE_BUSY_TIMEOUT_MS')
+    sync = config.get('SQLITE_SYNCHRONOUS')
+    if sync is not None:
+        sync = sync.upper()
+        if sync not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_LEVELS)}")
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        if wal:
+            # readers no longer block the writer (and vice versa); persists in the file
+            cur.execute("PRAGMA journal_mode=WAL")
+        if busy is not None:
+            cur.execute(f"PRAGMA busy_timeout={int(busy)}")
+        if sync is not None:
+            cur.execute(f"PRAGMA synchronous={sync}")
+        cur.close()
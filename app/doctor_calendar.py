@@ -0,0 +1,107 @@
+import heapq
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Appointment, AppointmentRecord, Availability, Patient, User
+
+# A doctor's calendar for a date window: appointments (any status) and open
+# slots, merged in date/time order. Both are range scans of the doctor's date
+# indexes (ix_appointment_doctor_date, ix_availability_open), so the cost
+# follows the size of the window, not the years of history behind it.
+#
+# The doctor dashboard and availability page render a rolling window around
+# today (CALENDAR_PAST_DAYS back, CALENDAR_AHEAD_DAYS ahead) and fetch
+# earlier or later periods from GET /api/doctors/<id>/calendar on demand.
+
+MAX_WINDOW_DAYS = 92
+KINDS = ('appointments', 'slots')
+
+
+def default_window():
+    today = date.today()
+    cfg = current_app.config
+    return (today - timedelta(days=cfg.get('CALENDAR_PAST_DAYS', 7)),
+            today + timedelta(days=cfg.get('CALENDAR_AHEAD_DAYS', 28)))
+
+
+def parse_window(args):
+    """(date_from, date_to) from ?from=&to= (inclusive), defaulting to the rolling window.
+    Raises ValueError."""
+    out = {}
+    for name in ('from', 'to'):
+        value = args.get(name)
+        if value:
+            try:
+                out[name] = datetime.fromisoformat(value).date()
+            except ValueError:
+                raise ValueError(f"Invalid {name}; use ISO YYYY-MM-DD")
+    date_from, date_to = default_window()
+    if 'from' in out and 'to' not in out:
+        date_to = out['from'] + (date_to - date_from)
+    elif 'to' in out and 'from' not in out:
+        date_from = out['to'] - (date_to - date_from)
+    date_from, date_to = out.get('from', date_from), out.get('to', date_to)
+    if date_from > date_to:
+        raise ValueError("from must not be after to")
+    if (date_to - date_from).days >= MAX_WINDOW_DAYS:
+        raise ValueError(f"window must be under {MAX_WINDOW_DAYS} days")
+    return date_from, date_to
+
+
+def appointments(doctor_id, date_from, date_to, newest_first=False):
+    """Unexecuted query for the doctor's appointments in the window, patients loaded with them."""
+    q = (Appointment.query
+         .options(joinedload(Appointment.patient).joinedload(Patient.user))
+         .filter(Appointment.doctor_id == doctor_id, Appointment.date.between(date_from, date_to)))
+    if newest_first:
+        return q.order_by(Appointment.date.desc(), Appointment.start_time)
+    return q.order_by(Appointment.date, Appointment.start_time)
+
+
+def slots(doctor_id, date_from, date_to):
+    """Unexecuted query for all of the doctor's slots in the window, booked or not."""
+    return (Availability.query
+            .filter(Availability.doctor_id == doctor_id, Availability.date.between(date_from, date_to))
+            .order_by(Availability.date, Availability.start_time))
+
+
+def _hhmm(t):
+    return t.strftime('%H:%M') if t else None
+
+
+def entries(doctor_id, date_from, date_to, kinds=KINDS):
+    """Appointments and open slots in the window as JSON-ready dicts, in date/time order."""
+    runs = []
+    if 'appointments' in kinds:
+        # archived appointments too: "load earlier" reaches past the archive horizon
+        rec = AppointmentRecord
+        rows = db.session.execute(
+            select(rec.id, rec.date, rec.start_time, rec.end_time,
+                   rec.status, rec.patient_id, rec.availability_id, User.username)
+            .outerjoin(Patient, Patient.id == rec.patient_id)
+            .outerjoin(User, User.id == Patient.user_id)
+            .where(rec.doctor_id == doctor_id, rec.date.between(date_from, date_to), rec.deleted_at.is_(None))
+            .order_by(rec.date, rec.start_time, rec.id))
+        runs.append([{'type': 'appointment', 'id': r.id, 'date': r.date.isoformat(),
+                      'start_time': _hhmm(r.start_time), 'end_time': _hhmm(r.end_time),
+                      'status': r.status, 'patient_id': r.patient_id, 'patient': r.username,
+                      'availability_id': r.availability_id} for r in rows])
+    if 'slots' in kinds:
+        rows = db.session.execute(
+            select(Availability.id, Availability.date, Availability.start_time, Availability.end_time)
+            .where(Availability.doctor_id == doctor_id, Availability.is_booked.is_(False),
+                   Availability.date.between(date_from, date_to))
+            .order_by(Availability.date, Availability.start_time, Availability.id))
+        runs.append([{'type': 'slot', 'id': r.id, 'date': r.date.isoformat(),
+                      'start_time': _hhmm(r.start_time), 'end_time': _hhmm(r.end_time)} for r in rows])
+    # appointments without a time sort first in their day
+    return list(heapq.merge(*runs, key=lambda e: (e['date'], e['start_time'] or '')))
+
+
+def calendar(doctor_id, date_from, date_to, kinds=KINDS):
+    return {'doctor_id': doctor_id, 'from': date_from.isoformat(), 'to': date_to.isoformat(),
+            'entries': entries(doctor_id, date_from, date_to, kinds)}
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from app import db
+from app.models import PatientHistory, Doctor
+
+# Streaming export of the PatientHistory table.
+#
+# Rows are read in primary-key order with plain column selects (no ORM
+# objects, no identity map) and fetched from the cursor EXPORT_BATCH_SIZE at
+# a time via yield_per, so memory stays flat however many rows go out.
+# Every EXPORT_SEGMENT_ROWS rows the read transaction is ended and the next
+# segment starts again from the last id: a long export never pins one SQLite
+# snapshot (which would stop WAL checkpoints) or holds a pooled connection
+# for the whole download. The same "id > after" cursor lets a client resume
+# an interrupted export from the last id it received.
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SEGMENT_ROWS = 50000
+
+COLUMNS = ('id', 'patient_id', 'doctor_id', 'visit_date', 'visit_type', 'diagnosis',
+           'prescription', 'tests_done', 'medicines', 'notes')
+
+
+def parse_filters(args):
+    """Filters from query args (doctor_id, department_id, date_from, date_to, after). Raises ValueError."""
+    filters = {}
+    for name in ('doctor_id', 'department_id', 'after'):
+        value = args.get(name)
+        if value:
+            if not value.isdigit():
+                raise ValueError(f"{name} must be an integer")
+            filters[name] = int(value)
+    for name in ('date_from', 'date_to'):
+        value = args.get(name)
+        if value:
+            try:
+                filters[name] = datetime.fromisoformat(value).date()
+            except ValueError:
+                raise ValueError(f"Invalid {name}; use ISO YYYY-MM-DD")
+    return filters
+
+
+def _query(filters, after, limit):
+    cols = [getattr(PatientHistory, c) for c in COLUMNS]
+    q = select(*cols).where(PatientHistory.id > after)
+    if 'doctor_id' in filters:
+        q = q.where(PatientHistory.doctor_id == filters['doctor_id'])
+    if 'department_id' in filters:
+        q = q.where(PatientHistory.doctor_id.in_(
+            select(Doctor.id).where(Doctor.department_id == filters['department_id'])))
+    if 'date_from' in filters:
+        q = q.where(PatientHistory.visit_date >= datetime.combine(filters['date_from'], datetime.min.time()))
+    if 'date_to' in filters:
+        # inclusive: everything before the start of the next day
+        q = q.where(PatientHistory.visit_date <
+                    datetime.combine(filters['date_to'] + timedelta(days=1), datetime.min.time()))
+    return q.order_by(PatientHistory.id).limit(limit)
+
+
+def history_batches(filters):
+    """Yield lists of rows (tuples in COLUMNS order), segment by segment."""
+    after = filters.get('after', 0)
+    while True:
+        result = db.session.execute(
+            _query(filters, after, EXPORT_SEGMENT_ROWS).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        seen = 0
+        for partition in result.partitions():
+            seen += len(partition)
+            after = partition[-1][0]
+            yield partition
+        # end the read transaction and give the connection back between segments
+        db.session.rollback()
+        if seen < EXPORT_SEGMENT_ROWS:
+            return
+
+
+def _value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def as_csv(filters):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    for rows in history_batches(filters):
+        writer.writerows([_value(v) for v in r] for r in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        # nothing matched: still send the header row
+        yield buf.getvalue()
+
+
+def as_ndjson(filters):
+    for rows in history_batches(filters):
+        yield ''.join(json.dumps(dict(zip(COLUMNS, map(_value, r)))) + '\n' for r in rows)
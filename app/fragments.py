@@ -0,0 +1,76 @@
+import os
+from itertools import chain
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import cache
+
+# Template rendering costs: compiled templates on disk, and a fragment cache
+# for the expensive blocks.
+#
+# TEMPLATE_BYTECODE_CACHE keeps Jinja's compiled bytecode in
+# TEMPLATE_CACHE_DIR (default instance/jinja_cache), so a fresh worker loads
+# templates instead of parsing and compiling them. Entries are checked against
+# the template source, so edited templates recompile.
+#
+# {% cache name, key... %} ... {% endcache %} stores the rendered block in
+# cache.fragment_cache under (name, key...). Keys include the data versions
+# the block shows, e.g. data_version('appointments', doctor_id): writes bump
+# those with cache.invalidate_on_commit(('version', ...)) and the next render
+# misses. Appointment rows are written from many places, so ORM changes to
+# them bump their doctor's version at flush; Core statements (batch,
+# importer) bump it themselves. The fragments are cached per worker, but the
+# versions are kept in the database (cache.DataVersions), so a write made
+# through any worker -- or the jobs worker and CLI -- is seen by all of them
+# on their next render.
+#
+# Only cache markup that is the same for every viewer of the key -- no
+# flashed messages, no per-user tokens. A block whose data comes from a query
+# passed in unexecuted skips the query too on a hit.
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cached', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, caller):
+        key = ('fragment',) + tuple(key)
+        html = cache.fragment_cache.get(key)
+        if html is None:
+            html = caller()
+            cache.fragment_cache.set(key, html)
+        return html
+
+
+@event.listens_for(Session, 'before_flush')
+def _appointment_versions(session, flush_context, instances):
+    from app.models import Appointment
+    doctors = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Appointment):
+            doctors.add(obj.doctor_id)
+            # moved to another doctor: the old one's table changes too
+            doctors.update(inspect(obj).attrs.doctor_id.history.deleted)
+    if doctors:
+        session.info.setdefault('cache_invalidate', set()).update(
+            ('version', 'appointments', d) for d in doctors if d is not None)
+
+
+def init_app(app):
+    env = app.jinja_env
+    env.add_extension(FragmentCacheExtension)
+    env.globals['data_version'] = cache.data_version
+    if app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        directory = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+        os.makedirs(directory, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(directory)
@@ -0,0 +1,147 @@
+import json
+import re
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import db, pagination
+from app.models import PatientHistory, PatientSummary, Doctor
+
+# Patient treatment history, summary first.
+#
+# History lists load only the summary columns (date, visit type, doctor and
+# an 80-character diagnosis_preview); the free-text columns are deferred in
+# the model and a full record is fetched when someone opens it
+# (GET /api/history/<id>). Lists page through (visit_date, id) newest first
+# on ix_patient_history_patient_visit, so a patient with hundreds of visits
+# costs one page per view.
+#
+# PatientSummary keeps a digest per patient -- visit count, first/last visit,
+# the last RECENT_DIAGNOSES diagnoses and the medicines prescribed within
+# ACTIVE_MEDICINE_DAYS of the latest visit. record_visit() folds each new
+# visit in as it is saved; a patient without a row (history written before
+# the table existed, or by bench.datagen) gets one built from the history on
+# first read.
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+RECENT_DIAGNOSES = 5
+ACTIVE_MEDICINE_DAYS = 90
+SORT_COLUMNS = (PatientHistory.visit_date, PatientHistory.id)
+
+
+def _as_datetime(value):
+    # complete_appointment stores the appointment's date in the DateTime column
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.min)
+
+
+def _iso(value):
+    value = _as_datetime(value)
+    return value.isoformat() if value else None
+
+
+# ---------- lists and records ----------
+
+def page(patient_id, after=None, before=None, per_page=PAGE_SIZE):
+    """One pagination.Page of the patient's visits, newest first; bad cursors raise ValueError."""
+    query = (PatientHistory.query
+             .options(joinedload(PatientHistory.doctor).joinedload(Doctor.user))
+             .filter(PatientHistory.patient_id == patient_id))
+    return pagination.paginate(query, SORT_COLUMNS, per_page, after=after, before=before, descending=True)
+
+
+def recent(patient_id, limit):
+    return page(patient_id, per_page=limit).items
+
+
+def summary_row(h):
+    return {'id': h.id, 'patient_id': h.patient_id, 'doctor_id': h.doctor_id,
+            'doctor': h.doctor.user.username if h.doctor and h.doctor.user else None,
+            'visit_date': _iso(h.visit_date), 'visit_type': h.visit_type,
+            'diagnosis_preview': h.diagnosis_preview}
+
+
+def full_row(h):
+    row = summary_row(h)
+    del row['diagnosis_preview']
+    row.update(diagnosis=h.diagnosis, prescription=h.prescription, tests_done=h.tests_done,
+               medicines=h.medicines, notes=h.notes)
+    return row
+
+
+# ---------- per-patient summary ----------
+
+def _medicine_items(text):
+    """'PARA 1-0-1, DOLA 1-0-0' -> ['PARA 1-0-1', 'DOLA 1-0-0'] (commas, semicolons or lines)."""
+    return [m.strip()[:200] for m in re.split(r'[,;\n]', text or '') if m.strip()]
+
+
+def _fold(summary, visits):
+    """Add (history id, visit datetime, doctor id, diagnosis, medicines) tuples to a summary row."""
+    diagnoses = json.loads(summary.recent_diagnoses or '[]')
+    medicines = {m['name'].lower(): m for m in json.loads(summary.active_medicines or '[]')}
+    for hid, visit, doctor_id, diagnosis, meds in visits:
+        summary.visits = (summary.visits or 0) + 1
+        if visit is not None:
+            if summary.last_visit is None or visit >= summary.last_visit:
+                summary.last_visit, summary.last_doctor_id = visit, doctor_id
+            if summary.first_visit is None or visit < summary.first_visit:
+                summary.first_visit = visit
+        if diagnosis:
+            diagnoses.append({'history_id': hid, 'date': _iso(visit), 'diagnosis': diagnosis[:200]})
+        for name in _medicine_items(meds):
+            seen = medicines.get(name.lower())
+            if seen is None or (seen['date'] or '') <= (_iso(visit) or ''):
+                medicines[name.lower()] = {'name': name, 'date': _iso(visit), 'history_id': hid}
+    diagnoses.sort(key=lambda d: (d['date'] or '', d['history_id']), reverse=True)
+    summary.recent_diagnoses = json.dumps(diagnoses[:RECENT_DIAGNOSES])
+    if summary.last_visit is not None:
+        cutoff = (summary.last_visit - timedelta(days=ACTIVE_MEDICINE_DAYS)).isoformat()
+        medicines = {k: m for k, m in medicines.items() if (m['date'] or '') >= cutoff}
+    summary.active_medicines = json.dumps(sorted(medicines.values(), key=lambda m: m['name'].lower()))
+
+
+def rebuild(patient_id):
+    """Recompute the patient's summary row from their whole history. Caller commits."""
+    summary = db.session.get(PatientSummary, patient_id)
+    if summary is None:
+        summary = PatientSummary(patient_id=patient_id)
+        db.session.add(summary)
+    summary.visits, summary.first_visit, summary.last_visit, summary.last_doctor_id = 0, None, None, None
+    summary.recent_diagnoses = summary.active_medicines = '[]'
+    rows = db.session.execute(
+        select(PatientHistory.id, PatientHistory.visit_date, PatientHistory.doctor_id,
+               PatientHistory.diagnosis, PatientHistory.medicines)
+        .where(PatientHistory.patient_id == patient_id)
+        .order_by(PatientHistory.visit_date, PatientHistory.id)).all()
+    _fold(summary, [(r.id, _as_datetime(r.visit_date), r.doctor_id, r.diagnosis, r.medicines) for r in rows])
+    return summary
+
+
+def record_visit(h):
+    """Fold a new PatientHistory row into its patient's summary. Caller commits."""
+    if h.patient_id is None:
+        return
+    # the insert takes SQLite's write lock before the summary is read, so two
+    # doctors saving visits for one patient can't both start from the old row
+    db.session.flush()
+    summary = db.session.get(PatientSummary, h.patient_id)
+    if summary is None:
+        rebuild(h.patient_id)
+        return
+    _fold(summary, [(h.id, _as_datetime(h.visit_date), h.doctor_id, h.diagnosis, h.medicines)])
+
+
+def summary(patient_id):
+    """The patient's summary as a dict, building (and committing) the row if it is missing."""
+    row = db.session.get(PatientSummary, patient_id)
+    if row is None:
+        row = rebuild(patient_id)
+        db.session.commit()
+    return {'patient_id': patient_id, 'visits': row.visits, 'first_visit': _iso(row.first_visit),
+            'last_visit': _iso(row.last_visit), 'last_doctor_id': row.last_doctor_id,
+            'recent_diagnoses': json.loads(row.recent_diagnoses),
+            'active_medicines': json.loads(row.active_medicines)}
@@ -0,0 +1,447 @@
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, insert, tuple_
+from sqlalchemy.exc import OperationalError, IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app import db, cache, search, passwords
+from app.batch import STATUSES
+from app.booking import DOCTOR_BUSY, BUSY
+from app.intervals import DayIntervals
+from app.models import User, Patient, Doctor, Appointment
+
+# Bulk CSV import for onboarding a clinic: patients, doctors and historical
+# appointments (`flask import-csv` and the admin upload page).
+#
+# The file is streamed and handled IMPORT_CHUNK_ROWS rows at a time. Each
+# chunk is validated in Python, checked against the database with a few IN
+# queries (taken usernames/emails, referenced patients and doctors, live
+# appointments on the touched doctor-days), then written with multi-row
+# INSERTs and committed on its own -- a bad row only costs that row, a
+# failed chunk only that chunk.
+#
+# Password hashing is what limits throughput: one hash is deliberately slow,
+# so plaintext passwords are hashed in a process pool across all cores. The
+# pool's workers are spawned, not forked: the upload page runs inside a
+# threaded web worker, and a fork can copy a lock some other thread holds.
+# Files exported from another system can carry a `password_hash` column
+# instead (werkzeug format), which skips hashing entirely.
+#
+# Usernames and emails seen earlier in the run are remembered, so duplicates
+# within the file are rejected the same way as ones already in the database.
+
+IMPORT_CHUNK_ROWS = 5000
+IN_CHUNK = 500
+MAX_REPORTED_ERRORS = 1000
+POOL_MIN_PASSWORDS = 16         # fewer than this are hashed inline, not worth starting the pool
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+KINDS = ('patients', 'doctors', 'appointments')
+REQUIRED_COLUMNS = {
+    'patients': ({'username'}, {'email'}),
+    'doctors': ({'username'}, {'email'}, {'department', 'department_id'}),
+    'appointments': ({'patient', 'patient_id'}, {'doctor', 'doctor_id'}, {'date'}),
+}
+
+
+class ImportReport:
+    """Counts and per-row errors of one file; errors are capped at MAX_REPORTED_ERRORS."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {'kind': self.kind, 'rows': self.rows, 'created': self.created, 'failed': self.failed,
+                'seconds': round(self.seconds, 2), 'errors': self.errors}
+
+
+def _chunks(seq, size=IN_CHUNK):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _read(stream, kind):
+    """
+    Yield (line, row, error) with lower-cased column names; error is set (and
+    row None) for a record the csv module cannot parse. Raises ValueError for
+    a bad header.
+    """
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames
+    except csv.Error as ex:
+        raise ValueError(f'Malformed CSV header: {ex}')
+    if not fieldnames:
+        raise ValueError('The file is empty')
+    reader.fieldnames = [(f or '').strip().lower() for f in reader.fieldnames]
+    missing = [' or '.join(sorted(group)) for group in REQUIRED_COLUMNS[kind]
+               if not group & set(reader.fieldnames)]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as ex:
+            # the reader resumes at the next record; DictReader.line_num is
+            # only updated for good rows, the underlying reader's is current
+            yield reader.reader.line_num, None, f'Malformed CSV: {ex}'
+            continue
+        yield reader.line_num, {k: (v or '').strip() for k, v in row.items() if k}, None
+
+
+def _optional_int(row, name, error):
+    value = row.get(name, '')
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(error)
+    return int(value)
+
+
+class Importer:
+    """
+    One import run: owns the hashing pool and the usernames/emails taken so far.
+    Use as a context manager so the pool is shut down afterwards.
+    """
+
+    def __init__(self, hash_workers=None, chunk_rows=IMPORT_CHUNK_ROWS, progress=None):
+        self.hash_workers = hash_workers or os.cpu_count() or 1
+        self.chunk_rows = chunk_rows
+        self.progress = progress
+        self._pool = None
+        self.usernames = set()
+        self.emails = set()
+        self._departments = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def run(self, kind, stream):
+        """Import one CSV stream of `kind`. Returns an ImportReport; raises ValueError for a bad header."""
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        handle = {'patients': self._users_chunk, 'doctors': self._users_chunk,
+                  'appointments': self._appointments_chunk}[kind]
+        report = ImportReport(kind)
+        t0 = time.perf_counter()
+        chunk = []
+        for line, row, error in _read(stream, kind):
+            if error is not None:
+                # rows before it first, so the report stays in file order
+                if chunk:
+                    self._run_chunk(handle, kind, chunk, report)
+                    chunk = []
+                report.rows += 1
+                report.error(line, error)
+                continue
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_rows:
+                self._run_chunk(handle, kind, chunk, report)
+                report.seconds = time.perf_counter() - t0
+                chunk = []
+        if chunk:
+            self._run_chunk(handle, kind, chunk, report)
+        report.seconds = time.perf_counter() - t0
+        return report
+
+    def _run_chunk(self, handle, kind, chunk, report):
+        report.rows += len(chunk)
+        failed, reported = report.failed, len(report.errors)
+        try:
+            report.created += handle(kind, chunk, report)
+            db.session.commit()
+            # checks run phase by phase; list this chunk's errors in file order
+            report.errors[reported:] = sorted(report.errors[reported:], key=lambda e: e['line'])
+        except (OperationalError, IntegrityError) as ex:
+            # locked database, or a concurrent registration took a name we had checked
+            db.session.rollback()
+            message = BUSY if isinstance(ex, OperationalError) else \
+                'Conflicting change made while importing; this chunk was not imported'
+            report.failed = failed
+            del report.errors[reported:]
+            for line, _ in chunk:
+                report.error(line, message)
+        if self.progress is not None:
+            self.progress(report)
+
+    # ---------- passwords ----------
+
+    def _hash_all(self, plain):
+        # same cost as everywhere else (PASSWORD_HASH_METHOD), but a pool of its own:
+        # a big import must not take the login pool away from users signing in
+        generate = partial(generate_password_hash, method=passwords.method())
+        if len(plain) < POOL_MIN_PASSWORDS or self.hash_workers < 2:
+            return [generate(p) for p in plain]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.hash_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        chunksize = max(1, len(plain) // (self.hash_workers * 4))
+        return list(self._pool.map(generate, plain, chunksize=chunksize))
+
+    # ---------- patients and doctors ----------
+
+    def _department_ids(self):
+        if self._departments is None:
+            self._departments = {d['name'].lower(): d['id'] for d in cache.departments()}
+        return self._departments
+
+    def _parse_user(self, kind, row):
+        """Validated values for one patient/doctor row. Raises ValueError."""
+        username, email = row.get('username', ''), row.get('email', '')
+        password, password_hash = row.get('password', ''), row.get('password_hash', '')
+        if not username:
+            raise ValueError('Username required')
+        if not email or '@' not in email:
+            raise ValueError('Valid email required')
+        if password_hash:
+            if not password_hash.startswith(HASH_PREFIXES) or password_hash.count('$') != 2:
+                raise ValueError('password_hash is not a werkzeug password hash')
+        elif len(password) < 4:
+            raise ValueError('Password required (min 4 characters)')
+        values = {'username': username, 'email': email, 'password': password,
+                  'password_hash': password_hash or None}
+        if kind == 'patients':
+            values['age'] = _optional_int(row, 'age', 'age must be a whole number')
+            values['gender'] = row.get('gender') or None
+            return values
+        dept = row.get('department_id', '')
+        if dept:
+            if not dept.isdigit() or int(dept) not in self._department_ids().values():
+                raise ValueError('Unknown department_id')
+            values['department_id'] = int(dept)
+        else:
+            values['department_id'] = self._department_ids().get(row.get('department', '').lower())
+            if values['department_id'] is None:
+                raise ValueError('Unknown department' if row.get('department') else 'Department required')
+        values['specialization'] = row.get('specialization') or None
+        values['experience_years'] = _optional_int(row, 'experience_years',
+                                                   'experience_years must be a whole number')
+        return values
+
+    def _users_chunk(self, kind, chunk, report):
+        parsed = []
+        for line, row in chunk:
+            try:
+                values = self._parse_user(kind, row)
+            except ValueError as ex:
+                report.error(line, str(ex))
+                continue
+            if values['username'] in self.usernames:
+                report.error(line, 'Username already exists')
+            elif values['email'] in self.emails:
+                report.error(line, 'Email already registered')
+            else:
+                self.usernames.add(values['username'])
+                self.emails.add(values['email'])
+                parsed.append((line, values))
+
+        # one IN query per few hundred names instead of filter_by(...).first() per row
+        taken_names, taken_emails = set(), set()
+        for part in _chunks([v['username'] for _, v in parsed]):
+            taken_names.update(db.session.execute(select(User.username).where(User.username.in_(part))).scalars())
+        for part in _chunks([v['email'] for _, v in parsed]):
+            taken_emails.update(db.session.execute(select(User.email).where(User.email.in_(part))).scalars())
+        accepted = []
+        for line, v in parsed:
+            if v['username'] in taken_names:
+                report.error(line, 'Username already exists')
+            elif v['email'] in taken_emails:
+                report.error(line, 'Email already registered')
+            else:
+                accepted.append(v)
+        if not accepted:
+            return 0
+
+        plain = [v for v in accepted if v['password_hash'] is None]
+        for v, hashed in zip(plain, self._hash_all([v['password'] for v in plain])):
+            v['password_hash'] = hashed
+
+        role = 'patient' if kind == 'patients' else 'doctor'
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{'username': v['username'], 'email': v['email'], 'password_hash': v['password_hash'], 'role': role}
+             for v in accepted]).scalars().all()
+        if kind == 'patients':
+            db.session.execute(insert(Patient), [{'user_id': uid, 'age': v['age'], 'gender': v['gender']}
+                                                 for uid, v in zip(user_ids, accepted)])
+            search.put_many('patient', [{'ref_id': uid, 'username': v['username'], 'email': v['email']}
+                                        for uid, v in zip(user_ids, accepted)])
+            return len(accepted)
+
+        doctor_ids = db.session.execute(
+            insert(Doctor).returning(Doctor.id, sort_by_parameter_order=True),
+            [{'user_id': uid, 'department_id': v['department_id'], 'specialization': v['specialization'],
+              'experience_years': v['experience_years']} for uid, v in zip(user_ids, accepted)]).scalars().all()
+        dept_names = {d['id']: d['name'] for d in cache.departments()}
+        search.put_many('doctor', [{'ref_id': did, 'username': v['username'], 'email': v['email'],
+                                    'specialization': v['specialization'],
+                                    'department': dept_names.get(v['department_id'])}
+                                   for did, v in zip(doctor_ids, accepted)])
+        cache.invalidate_on_commit(*{('dept_doctors', v['department_id']) for v in accepted}, ('version', 'doctors'))
+        return len(accepted)
+
+    # ---------- appointments ----------
+
+    def _parse_appointment(self, row):
+        values = {}
+        for name in ('patient', 'doctor'):
+            ref = row.get(name + '_id', '')
+            if ref:
+                if not ref.isdigit():
+                    raise ValueError(f'{name}_id must be an integer')
+                values[name] = ('id', int(ref))
+            elif row.get(name):
+                values[name] = ('username', row[name])
+            else:
+                raise ValueError(f'{name} or {name}_id is required')
+        try:
+            values['date'] = datetime.fromisoformat(row.get('date', '')).date()
+        except ValueError:
+            raise ValueError('Invalid date format; use ISO YYYY-MM-DD')
+        values['start_time'] = values['end_time'] = None
+        if row.get('start_time') or row.get('end_time'):
+            try:
+                values['start_time'] = datetime.strptime(row.get('start_time', ''), '%H:%M').time()
+                values['end_time'] = datetime.strptime(row.get('end_time', ''), '%H:%M').time()
+            except ValueError:
+                raise ValueError('start_time and end_time must both be HH:MM')
+            if values['end_time'] <= values['start_time']:
+                raise ValueError('end_time must be after start_time')
+        values['status'] = row.get('status') or 'scheduled'
+        if values['status'] not in STATUSES:
+            raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+        values['mode'] = row.get('mode') or None
+        return values
+
+    def _resolve(self, refs, *columns):
+        """{('id'|'username', value): row of `columns`} for the patient/doctor refs that exist."""
+        model = columns[0].class_
+        found = {}
+        for part in _chunks(v for how, v in refs if how == 'id'):
+            for row in db.session.execute(select(*columns).where(model.id.in_(part))):
+                found[('id', row[0])] = row
+        for part in _chunks(v for how, v in refs if how == 'username'):
+            for row in db.session.execute(select(User.username, *columns)
+                                          .join(model, model.user_id == User.id).where(User.username.in_(part))):
+                found[('username', row[0])] = row[1:]
+        return found
+
+    def _appointments_chunk(self, kind, chunk, report):
+        parsed = []
+        for line, row in chunk:
+            try:
+                parsed.append((line, self._parse_appointment(row)))
+            except ValueError as ex:
+                report.error(line, str(ex))
+
+        patients = self._resolve({v['patient'] for _, v in parsed}, Patient.id)
+        doctors = self._resolve({v['doctor'] for _, v in parsed}, Doctor.id, Doctor.department_id)
+        resolved = []
+        for line, v in parsed:
+            if v['patient'] not in patients:
+                report.error(line, 'Unknown patient')
+            elif v['doctor'] not in doctors:
+                report.error(line, 'Unknown doctor')
+            else:
+                v['patient_id'] = patients[v['patient']][0]
+                v['doctor_id'], v['department_id'] = doctors[v['doctor']]
+                resolved.append((line, v))
+
+        # same overlap rule as booking, against the database and earlier rows of the file
+        days = {(v['doctor_id'], v['date']) for _, v in resolved
+                if v['start_time'] is not None and v['status'] != 'cancelled'}
+        taken = {}
+        for part in _chunks(days):
+            for r in db.session.execute(
+                    select(Appointment.doctor_id, Appointment.date, Appointment.start_time, Appointment.end_time)
+                    .where(tuple_(Appointment.doctor_id, Appointment.date).in_(part),
+                           Appointment.status != 'cancelled', Appointment.start_time.isnot(None),
+                           Appointment.end_time.isnot(None))):
+                taken.setdefault((r.doctor_id, r.date), DayIntervals()).add(r.start_time, r.end_time)
+        rows = []
+        for line, v in resolved:
+            if v['start_time'] is not None and v['status'] != 'cancelled':
+                day = taken.setdefault((v['doctor_id'], v['date']), DayIntervals())
+                if day.overlaps(v['start_time'], v['end_time']):
+                    report.error(line, DOCTOR_BUSY)
+                    continue
+                day.add(v['start_time'], v['end_time'])
+            rows.append({'patient_id': v['patient_id'], 'doctor_id': v['doctor_id'],
+                         'department_id': v['department_id'], 'date': v['date'], 'start_time': v['start_time'],
+                         'end_time': v['end_time'], 'mode': v['mode'], 'status': v['status'],
+                         'created_at': None})       # booking time of imported history is unknown
+        if rows:
+            db.session.execute(insert(Appointment), rows)
+            cache.invalidate_on_commit(*{('version', 'appointments', r['doctor_id']) for r in rows})
+        return len(rows)
+
+
+# ---------- CLI ----------
+
+@click.command('import-csv')
+@click.option('--patients', type=click.Path(exists=True, dir_okay=False), help='CSV of patients')
+@click.option('--doctors', type=click.Path(exists=True, dir_okay=False), help='CSV of doctors')
+@click.option('--appointments', type=click.Path(exists=True, dir_okay=False),
+              help='CSV of appointments (imported after the patients and doctors)')
+@click.option('--workers', type=int, default=0, help='password hashing processes (default: IMPORT_HASH_WORKERS)')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='write every reported row error to this CSV')
+@with_appcontext
+def import_csv_command(patients, doctors, appointments, workers, errors_path):
+    """Bulk-import patients, doctors and historical appointments from CSV files."""
+    files = [(kind, path) for kind, path in
+             (('patients', patients), ('doctors', doctors), ('appointments', appointments)) if path]
+    if not files:
+        raise click.UsageError('Pass at least one of --patients, --doctors, --appointments')
+
+    def progress(report):
+        click.echo(f'  {report.kind}: {report.rows} rows, {report.created} created, '
+                   f'{report.failed} failed ({report.seconds:.1f}s)', err=True)
+
+    reports = []
+    workers = workers or current_app.config.get('IMPORT_HASH_WORKERS') or None
+    with Importer(hash_workers=workers, progress=progress) as importer:
+        for kind, path in files:
+            click.echo(f'Importing {kind} from {path}', err=True)
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                try:
+                    reports.append(importer.run(kind, f))
+                except ValueError as ex:
+                    raise click.ClickException(f'{path}: {ex}')
+    for r in reports:
+        rate = r.rows / r.seconds if r.seconds else 0
+        click.echo(f'{r.kind}: {r.created} created, {r.failed} failed of {r.rows} rows '
+                   f'in {r.seconds:.1f}s ({rate:.0f} rows/s)')
+    if errors_path:
+        with open(errors_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('kind', 'line', 'error'))
+            for r in reports:
+                writer.writerows((r.kind, e['line'], e['error']) for e in r.errors)
@@ -0,0 +1,71 @@
+from bisect import bisect_left
+from sqlalchemy import select
+from app import db
+from app.models import Availability, Appointment
+
+# Overlap checks for a doctor's time intervals on one day.
+#
+# Every write path keeps each doctor's slots (and live appointments) free of
+# overlaps per day. With that invariant, intervals sorted by start are also
+# sorted by end, so the only interval that can overlap a new [start, end) is
+# the one with the greatest start before `end`. _find_conflict() asks the
+# (doctor_id, date, start_time) index for exactly that row: one index seek,
+# O(log n) in the doctor's total number of rows. (Rows saved before these
+# checks existed may overlap each other; only the nearest one is looked at.)
+#
+# DayIntervals is the in-memory version for bulk work (recurring schedules):
+# a sorted list per day, checked with bisect.
+
+
+def _find_conflict(model, doctor_id, day, start, end, exclude_id=None, live_only=False):
+    q = (select(model)
+         .where(model.doctor_id == doctor_id, model.date == day, model.start_time < end)
+         .order_by(model.start_time.desc())
+         .limit(1))
+    if exclude_id is not None:
+        q = q.where(model.id != exclude_id)
+    if live_only:
+        q = q.where(model.status != 'cancelled')
+    prev = db.session.execute(q).scalar()
+    if prev is not None and prev.end_time is not None and prev.end_time > start:
+        return prev
+    return None
+
+
+def slot_conflict(doctor_id, day, start, end, exclude_id=None):
+    """Availability row of this doctor overlapping [start, end) on `day`, or None."""
+    return _find_conflict(Availability, doctor_id, day, start, end, exclude_id)
+
+
+def appointment_conflict(doctor_id, day, start, end, exclude_id=None):
+    """Non-cancelled appointment of this doctor overlapping [start, end) on `day`, or None."""
+    return _find_conflict(Appointment, doctor_id, day, start, end, exclude_id, live_only=True)
+
+
+def describe(row):
+    return f"{row.date} {row.start_time.strftime('%H:%M')}-{row.end_time.strftime('%H:%M')}"
+
+
+class DayIntervals:
+    """Sorted intervals for one doctor-day, for checking many candidates at once."""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.hi = []        # running max of ends, so older overlapping rows are still caught
+        for s, e in sorted(intervals):
+            self.starts.append(s)
+            self.hi.append(e if not self.hi or e > self.hi[-1] else self.hi[-1])
+
+    def overlaps(self, start, end):
+        i = bisect_left(self.starts, end)
+        return bool(i) and self.hi[i - 1] > start
+
+    def add(self, start, end):
+        """Insert an interval (batch callers keep accepted items here to catch overlaps within the batch)."""
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.hi.insert(i, end if not i or end > self.hi[i - 1] else self.hi[i - 1])
+        for j in range(i + 1, len(self.hi)):
+            if self.hi[j] >= self.hi[j - 1]:
+                break
+            self.hi[j] = self.hi[j - 1]
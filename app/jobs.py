@@ -0,0 +1,219 @@
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, delete, insert, or_, and_
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Job
+
+# Durable background jobs, queued in the app's own database.
+#
+# enqueue() only adds a row to the caller's transaction, so a job exists if
+# and only if the change that caused it was committed, and the request pays
+# for one INSERT however far behind delivery is. A separate worker process
+# (`flask jobs-worker`) does the slow part:
+#
+#   1. claims up to JOBS_BATCH_SIZE due rows with one UPDATE ... RETURNING
+#      (status -> running, lease until now + JOBS_LEASE_SECONDS) and commits,
+#      so several workers never get the same job;
+#   2. hands each kind's jobs to its handler as one batch;
+#   3. marks the successes done in one UPDATE and puts failures back to
+#      pending with exponential backoff, or to failed after JOBS_MAX_ATTEMPTS.
+#
+# A worker that dies mid-batch leaves its rows running with an expired
+# lease; they are claimed again. Handlers must therefore tolerate running a
+# job twice. Times are naive local time, like the appointment columns.
+#
+# Handlers are registered with @handler(kind) and get a list of ClaimedJob;
+# they return {job_id: error message} for the jobs that failed (empty dict
+# when all went through) or raise to fail the whole batch. Functions
+# registered with @idle_task run whenever the queue has nothing due
+# (periodic upkeep such as the analytics rollups and the archive pass).
+
+log = logging.getLogger(__name__)
+
+_handlers = {}
+_idle_tasks = []
+
+
+class ClaimedJob:
+    __slots__ = ('id', 'kind', 'payload', 'attempts')
+
+    def __init__(self, id, kind, payload, attempts):
+        self.id = id
+        self.kind = kind
+        self.payload = json.loads(payload)
+        self.attempts = attempts
+
+
+def handler(kind):
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def idle_task(fn):
+    _idle_tasks.append(fn)
+    return fn
+
+
+def enqueue(kind, payload, run_at=None):
+    """Queue one job in the current transaction. Caller commits."""
+    db.session.add(Job(kind=kind, payload=json.dumps(payload), run_at=run_at or datetime.now()))
+
+
+def enqueue_many(kind, jobs):
+    """Queue (payload, run_at) pairs with one multi-row INSERT. Caller commits."""
+    now = datetime.now()
+    rows = [{'kind': kind, 'payload': json.dumps(payload), 'run_at': run_at or now, 'status': 'pending',
+             'attempts': 0, 'created_at': now} for payload, run_at in jobs]
+    if rows:
+        db.session.execute(insert(Job), rows)
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default)
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts` + 1: doubling from JOBS_BACKOFF_SECONDS, capped, with jitter."""
+    base = _setting('JOBS_BACKOFF_SECONDS', 30)
+    cap = _setting('JOBS_BACKOFF_MAX_SECONDS', 3600)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    # jitter so a failed burst doesn't come back as one burst
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(batch_size):
+    """Lease up to batch_size due jobs to this worker and commit. Returns [ClaimedJob]."""
+    now = datetime.now()
+    due = (select(Job.id)
+           .where(or_(and_(Job.status == 'pending', Job.run_at <= now),
+                      and_(Job.status == 'running', Job.locked_until < now)))
+           .order_by(Job.run_at).limit(batch_size))
+    rows = db.session.execute(
+        update(Job).where(Job.id.in_(due.scalar_subquery()))
+        .values(status='running', attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=_setting('JOBS_LEASE_SECONDS', 300)))
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts)
+        .execution_options(synchronize_session=False)).all()
+    db.session.commit()
+    return [ClaimedJob(*r) for r in rows]
+
+
+def _finish(jobs, errors):
+    ok = [j.id for j in jobs if j.id not in errors]
+    if ok:
+        db.session.execute(update(Job).where(Job.id.in_(ok))
+                           .values(status='done', locked_until=None, last_error=None)
+                           .execution_options(synchronize_session=False))
+    max_attempts = _setting('JOBS_MAX_ATTEMPTS', 8)
+    now = datetime.now()
+    for job in jobs:
+        if job.id not in errors:
+            continue
+        failed = job.attempts >= max_attempts
+        db.session.execute(
+            update(Job).where(Job.id == job.id)
+            .values(status='failed' if failed else 'pending', locked_until=None,
+                    last_error=str(errors[job.id])[:2000],
+                    run_at=now if failed else now + timedelta(seconds=backoff(job.attempts)))
+            .execution_options(synchronize_session=False))
+        log.warning("job %s (%s) attempt %d failed%s: %s", job.id, job.kind, job.attempts,
+                    ', giving up' if failed else '', errors[job.id])
+    db.session.commit()
+
+
+def run_once(batch_size=None):
+    """Claim and run one batch. Returns the number of jobs claimed."""
+    jobs = claim(batch_size or _setting('JOBS_BATCH_SIZE', 100))
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+    errors = {}
+    for kind, group in by_kind.items():
+        fn = _handlers.get(kind)
+        if fn is None:
+            errors.update({j.id: f'no handler for job kind {kind!r}' for j in group})
+            continue
+        try:
+            errors.update(fn(group) or {})
+        except Exception as ex:
+            db.session.rollback()
+            log.exception("job handler %s failed", kind)
+            errors.update({j.id: f'{type(ex).__name__}: {ex}' for j in group})
+    if jobs:
+        _finish(jobs, errors)
+    return len(jobs)
+
+
+def purge(keep_days):
+    """Delete done jobs older than keep_days. Returns the number removed."""
+    cutoff = datetime.now() - timedelta(days=keep_days)
+    res = db.session.execute(delete(Job).where(Job.status == 'done', Job.run_at < cutoff)
+                             .execution_options(synchronize_session=False))
+    db.session.commit()
+    return res.rowcount
+
+
+def stats():
+    rows = db.session.execute(select(Job.status, db.func.count()).group_by(Job.status)).all()
+    return {status: n for status, n in rows}
+
+
+def _run_idle_tasks():
+    for fn in _idle_tasks:
+        try:
+            fn()
+        except OperationalError:
+            db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            log.exception("idle task %s failed", fn.__name__)
+
+
+def work(once=False, batch_size=None):
+    """Worker loop: run batches back to back while there is work, idle tasks and poll when not."""
+    poll = _setting('JOBS_POLL_SECONDS', 2)
+    keep_days = _setting('JOBS_KEEP_DONE_DAYS', 7)
+    last_purge = 0.0
+    while True:
+        try:
+            claimed = run_once(batch_size)
+        except OperationalError:
+            # SQLite "database is locked" after the busy timeout: back off and retry
+            db.session.rollback()
+            claimed = 0
+        if once:
+            if not claimed:
+                _run_idle_tasks()
+                return
+            continue
+        if not claimed:
+            _run_idle_tasks()
+            if time.monotonic() - last_purge > 3600:
+                purge(keep_days)
+                last_purge = time.monotonic()
+            db.session.remove()
+            time.sleep(poll)
+
+
+@click.command('jobs-worker')
+@click.option('--once', is_flag=True, help='run until the queue has nothing due, then exit')
+@click.option('--batch-size', type=int, default=None, help='jobs per claim (default: JOBS_BATCH_SIZE)')
+@with_appcontext
+def jobs_worker_command(once, batch_size):
+    """Run queued background jobs (notifications, reminders), analytics and archive upkeep."""
+    from app import notify, analytics, archive     # register the handlers and idle tasks
+    notify.configure(current_app)
+    logging.basicConfig(level=logging.INFO)
+    click.echo(f'jobs worker started, queue: {stats()}', err=True)
+    work(once=once, batch_size=batch_size)
@@ -0,0 +1,261 @@
+import random
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request instrumentation, exported in Prometheus text format.
+#
+# Every request is timed and counted. A sampled fraction (METRICS_SAMPLE_RATE)
+# also gets the detail: number of SQL statements and time spent in them
+# (engine cursor events), template render time (Flask's template signals) and
+# N+1 detection -- the same statement run METRICS_N_PLUS_ONE_THRESHOLD times
+# or more in one request, which is what a lazy-loaded relationship in a loop
+# looks like.
+#
+# Counters are not shared between threads: each thread writes to its own
+# shard without locking, and render() adds the shards up. Shards of finished
+# threads are folded into one so thread-per-request servers don't pile them up.
+# Like the lookup cache, numbers are per worker process.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+MAX_LIVE_SHARDS = 64
+
+_local = threading.local()
+_shards = []            # (weakref to thread, shard)
+_retired = None         # totals from threads that have exited
+_shards_lock = threading.Lock()
+
+
+class _Shard:
+    def __init__(self):
+        self.counters = defaultdict(float)      # (name, labels) -> value
+        self.histograms = {}                    # (name, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, name, labels, value=1):
+        self.counters[(name, labels)] += value
+
+    def observe(self, name, labels, value, buckets):
+        h = self.histograms.get((name, labels))
+        if h is None:
+            h = self.histograms[(name, labels)] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                h[i] += 1
+                break
+        h[-2] += value
+        h[-1] += 1
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] += value
+        for key, h in list(other.histograms.items()):
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(h)
+            else:
+                for i, v in enumerate(h):
+                    mine[i] += v
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            if len(_shards) >= MAX_LIVE_SHARDS:
+                _fold_dead()
+            _shards.append((weakref.ref(threading.current_thread()), shard))
+    return shard
+
+
+def _fold_dead():
+    """Merge shards of exited threads into _retired. Caller holds _shards_lock."""
+    global _retired
+    alive = []
+    for ref, shard in _shards:
+        thread = ref()
+        if thread is not None and thread.is_alive():
+            alive.append((ref, shard))
+        else:
+            if _retired is None:
+                _retired = _Shard()
+            _retired.merge(shard)
+    _shards[:] = alive
+
+
+def reset():
+    global _retired
+    with _shards_lock:
+        for _, shard in _shards:
+            shard.counters.clear()
+            shard.histograms.clear()
+        _retired = None
+
+
+# ---------- per-request collection ----------
+
+class _RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'template_seconds', 'statements', '_query_start', '_render_start')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = defaultdict(int)
+        self._query_start = None
+        self._render_start = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'request', None)
+    if stats is not None:
+        stats._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, 'request', None)
+    if stats is not None and stats._query_start is not None:
+        stats.sql_seconds += time.perf_counter() - stats._query_start
+        stats._query_start = None
+        stats.queries += 1
+        stats.statements[statement] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    stats = getattr(_local, 'request', None)
+    if stats is not None:
+        stats._render_start.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = getattr(_local, 'request', None)
+    if stats is not None and stats._render_start:
+        stats.template_seconds += time.perf_counter() - stats._render_start.pop()
+
+
+def init_app(app):
+    """Hook request timing into `app` according to the METRICS_* settings."""
+    from flask import request, before_render_template, template_rendered
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    sample_rate = float(app.config.get('METRICS_SAMPLE_RATE', 1.0))
+    server_timing = app.config.get('METRICS_SERVER_TIMING', False)
+    threshold = app.config.get('METRICS_N_PLUS_ONE_THRESHOLD', 10)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def _start():
+        _local.started = time.perf_counter()
+        _local.request = _RequestStats() if sample_rate >= 1 or random.random() < sample_rate else None
+
+    @app.after_request
+    def _add_server_timing(response):
+        stats = getattr(_local, 'request', None)
+        _local.status = response.status_code
+        if server_timing and stats is not None:
+            total = (time.perf_counter() - _local.started) * 1000
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.queries} queries", '
+                f'tpl;dur={stats.template_seconds * 1000:.2f}, app;dur={total:.2f}')
+        return response
+
+    @app.teardown_request
+    def _finish(exc):
+        started = getattr(_local, 'started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats, _local.request, _local.started = getattr(_local, 'request', None), None, None
+        status = getattr(_local, 'status', None) if exc is None else 500
+        _local.status = None
+        # unmatched URLs share one label so 404 scans can't blow up the series count
+        endpoint = request.endpoint or 'unmatched'
+
+        shard = _shard()
+        shard.inc('hms_requests_total', (endpoint, request.method, str(status or 500)))
+        shard.observe('hms_request_duration_seconds', (endpoint,), elapsed, LATENCY_BUCKETS)
+        if stats is None:
+            return
+        shard.inc('hms_sampled_requests_total', (endpoint,))
+        shard.observe('hms_sql_queries_per_request', (endpoint,), stats.queries, QUERY_BUCKETS)
+        shard.inc('hms_sql_seconds_total', (endpoint,), stats.sql_seconds)
+        shard.inc('hms_template_seconds_total', (endpoint,), stats.template_seconds)
+        repeated = [(n, s) for s, n in stats.statements.items() if n >= threshold]
+        if repeated:
+            shard.inc('hms_n_plus_one_total', (endpoint,))
+            n, statement = max(repeated)
+            app.logger.warning("possible N+1 in %s: %d x %s", endpoint, n, ' '.join(statement.split())[:200])
+
+
+# ---------- Prometheus text export ----------
+
+HELP = {
+    'hms_requests_total': ('counter', 'Requests by endpoint, method and status', ('endpoint', 'method', 'status')),
+    'hms_request_duration_seconds': ('histogram', 'Request latency', ('endpoint',)),
+    'hms_sampled_requests_total': ('counter', 'Requests that got SQL/template detail', ('endpoint',)),
+    'hms_sql_queries_per_request': ('histogram', 'SQL statements per sampled request', ('endpoint',)),
+    'hms_sql_seconds_total': ('counter', 'Time spent in SQL, sampled requests', ('endpoint',)),
+    'hms_template_seconds_total': ('counter', 'Time spent rendering templates, sampled requests', ('endpoint',)),
+    'hms_n_plus_one_total': ('counter', 'Sampled requests that repeated one statement past the threshold',
+                             ('endpoint',)),
+}
+BUCKETS = {'hms_request_duration_seconds': LATENCY_BUCKETS, 'hms_sql_queries_per_request': QUERY_BUCKETS}
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def snapshot():
+    """All shards added up into one _Shard."""
+    total = _Shard()
+    with _shards_lock:
+        _fold_dead()
+        shards = [s for _, s in _shards] + ([_retired] if _retired is not None else [])
+    for shard in shards:
+        total.merge(shard)
+    return total
+
+
+def render():
+    """Current values in Prometheus text exposition format."""
+    total = snapshot()
+    out = []
+    for name, (kind, help_text, label_names) in HELP.items():
+        out.append(f'# HELP {name} {help_text}')
+        out.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (n, labels), value in sorted(total.counters.items()):
+                if n == name:
+                    out.append(f'{name}{_labels(label_names, labels)} {_num(value)}')
+            continue
+        buckets = BUCKETS[name]
+        for (n, labels), h in sorted(total.histograms.items()):
+            if n != name:
+                continue
+            running = 0
+            for bound, count in zip(buckets, h):
+                running += count
+                le = 'le="%s"' % bound
+                out.append(f'{name}_bucket{_labels(label_names, labels, le)} {running}')
+            le = 'le="+Inf"'
+            out.append(f'{name}_bucket{_labels(label_names, labels, le)} {h[-1]}')
+            out.append(f'{name}_sum{_labels(label_names, labels)} {_num(h[-2])}')
+            out.append(f'{name}_count{_labels(label_names, labels)} {h[-1]}')
+    return '\n'.join(out) + '\n'
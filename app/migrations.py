@@ -0,0 +1,121 @@
+from sqlalchemy import text
+from app import db
+from app.models import Appointment, Availability
+
+# Schema changes for databases created by an older version of the app.
+# `db.create_all()` only creates missing tables, so anything added to an
+# existing table (indexes, columns) goes here as a numbered step.
+# The applied version is kept in SQLite's `PRAGMA user_version`.
+# Steps must be idempotent: fresh databases already got the objects from create_all().
+# A step is either a SQL string or a callable run inside the migration transaction.
+
+
+def _add_column(table, column, ddl):
+    def step():
+        cols = [r[1] for r in db.session.execute(text(f"PRAGMA table_info({table})"))]
+        if column not in cols:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+def _autoincrement(model):
+    """Rebuild a table as INTEGER PRIMARY KEY AUTOINCREMENT so deleted ids are never handed out again."""
+    def step():
+        from sqlalchemy.schema import CreateTable
+        table = model.__table__
+        name = table.name
+        sql = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :n"),
+                                 {'n': name}).scalar()
+        if sql is None or 'AUTOINCREMENT' in sql.upper():
+            return
+        # indexes and triggers go with the old table; put them back afterwards
+        extras = [r[0] for r in db.session.execute(
+            text("SELECT sql FROM sqlite_master WHERE tbl_name = :n AND type IN ('index', 'trigger') "
+                 "AND sql IS NOT NULL ORDER BY type"), {'n': name})]
+        old_cols = {r[1] for r in db.session.execute(text(f"PRAGMA table_info({name})"))}
+        cols = ', '.join(c.name for c in table.columns if c.name in old_cols)
+        ddl = str(CreateTable(table).compile(db.engine)).replace(f'CREATE TABLE {name} (',
+                                                                 f'CREATE TABLE _{name}_new (', 1)
+        db.session.execute(text(ddl))
+        db.session.execute(text(f"INSERT INTO _{name}_new ({cols}) SELECT {cols} FROM {name}"))
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.execute(text(f"ALTER TABLE _{name}_new RENAME TO {name}"))
+        for sql in extras:
+            db.session.execute(text(sql))
+    return step
+
+
+MIGRATIONS = [
+    # 1: indexes for the hot lookup paths
+    [
+        "CREATE INDEX IF NOT EXISTS ix_user_role ON user (role)",
+        "CREATE INDEX IF NOT EXISTS ix_doctor_user_id ON doctor (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_doctor_department_id ON doctor (department_id)",
+        "CREATE INDEX IF NOT EXISTS ix_patient_user_id ON patient (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_appointment_doctor_date ON appointment (doctor_id, date, start_time)",
+        "CREATE INDEX IF NOT EXISTS ix_appointment_patient_date ON appointment (patient_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_appointment_date ON appointment (date)",
+        "CREATE INDEX IF NOT EXISTS ix_availability_open ON availability (doctor_id, is_booked, date, start_time)",
+        "CREATE INDEX IF NOT EXISTS ix_availability_doctor_date ON availability (doctor_id, date, start_time)",
+        "CREATE INDEX IF NOT EXISTS ix_patient_history_patient_visit ON patient_history (patient_id, visit_date)",
+        "ANALYZE",
+    ],
+    # 2: link appointments to the slot they hold
+    [
+        _add_column('appointment', 'availability_id', 'INTEGER REFERENCES availability (id)'),
+        # back-fill from the old doctor/date/start_time match, one live appointment per slot
+        "UPDATE appointment SET availability_id = ("
+        " SELECT av.id FROM availability av"
+        " WHERE av.doctor_id = appointment.doctor_id AND av.date = appointment.date"
+        " AND av.start_time = appointment.start_time AND av.is_booked = 1"
+        " ORDER BY av.id LIMIT 1)"
+        " WHERE availability_id IS NULL AND status != 'cancelled' AND id = ("
+        " SELECT MIN(a2.id) FROM appointment a2"
+        " WHERE a2.doctor_id = appointment.doctor_id AND a2.date = appointment.date"
+        " AND a2.start_time = appointment.start_time AND a2.status != 'cancelled')",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_appointment_availability ON appointment (availability_id)",
+    ],
+    # 3: admin lists sorted by username within a role
+    [
+        "CREATE INDEX IF NOT EXISTS ix_user_role_username ON user (role, username)",
+    ],
+    # 4: booking time, for lead times in analytics (unknown for older rows)
+    [
+        _add_column('appointment', 'created_at', 'DATETIME'),
+    ],
+    # 5: earliest open slots across all doctors
+    [
+        "CREATE INDEX IF NOT EXISTS ix_availability_open_time ON availability (is_booked, date, start_time)",
+    ],
+    # 6: archive tier (app/archive.py) -- archived ids must stay unique, and
+    # the pass finds cancelled rows through a small partial index
+    [
+        _autoincrement(Appointment),
+        _autoincrement(Availability),
+        "CREATE INDEX IF NOT EXISTS ix_appointment_cancelled ON appointment (date) WHERE status = 'cancelled'",
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version():
+    return db.session.execute(text("PRAGMA user_version")).scalar()
+
+
+def run_migrations():
+    """Apply every migration newer than the database's user_version."""
+    if db.engine.dialect.name != 'sqlite':
+        # other backends start from create_all(), which already has every index/column
+        return
+    version = current_version()
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for step in statements:
+            if callable(step):
+                step()
+            else:
+                db.session.execute(text(step))
+        # PRAGMA doesn't take bound parameters
+        db.session.execute(text(f"PRAGMA user_version = {number}"))
+        db.session.commit()
+        print(f"Applied schema migration {number}")
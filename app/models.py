@@ -1,27 +1,49 @@
 from datetime import datetime
 from app import db, login
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import passwords
 
 class User(UserMixin, db.Model):
+    # admin patient/doctor lists page through one role ordered by username
+    __table_args__ = (
+        db.Index('ix_user_role_username', 'role', 'username'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
-    role = db.Column(db.String(20), default='patient')
+    role = db.Column(db.String(20), default='patient', index=True)
 
     doctor_profile = db.relationship('Doctor', backref='user', uselist=False)
     patient_profile = db.relationship('Patient', backref='user', uselist=False)
 
+    # both run on the hashing pool and may raise passwords.PoolBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+class Principal(UserMixin):
+    """
+    The logged-in user as Flask-Login's current_user: plain values, no DB
+    session, so it can be cached between requests (cache.principal).
+    """
+
+    def __init__(self, id, username, email, role, doctor_id=None, patient_id=None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.doctor_id = doctor_id
+        self.patient_id = patient_id
+
 
 @login.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app import cache
+    return cache.principal(int(user_id))
 
 class Department(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,19 +52,33 @@ class Department(db.Model):
 
 class Doctor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     specialization = db.Column(db.String(120))
     experience_years = db.Column(db.Integer)
-    department_id = db.Column(db.Integer, db.ForeignKey('department.id'))
+    department_id = db.Column(db.Integer, db.ForeignKey('department.id'), index=True)
     department = db.relationship('Department', backref='doctors')
 
 class Patient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     age = db.Column(db.Integer)
     gender = db.Column(db.String(20))
 
 class Appointment(db.Model):
+    # doctor/patient dashboards filter by owner and sort by date+time;
+    # admin list and /api/appointments page through (date, id)
+    __table_args__ = (
+        db.Index('ix_appointment_doctor_date', 'doctor_id', 'date', 'start_time'),
+        db.Index('ix_appointment_patient_date', 'patient_id', 'date'),
+        db.Index('ix_appointment_date', 'date'),
+        # a slot can back at most one live appointment (NULLs are not compared)
+        db.Index('ux_appointment_availability', 'availability_id', unique=True),
+        # cancelled rows waiting for the archive pass (app/archive.py)
+        db.Index('ix_appointment_cancelled', 'date', sqlite_where=db.text("status = 'cancelled'")),
+        # ids are never reused: archived rows keep theirs (app/archive.py)
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'))
@@ -52,8 +88,27 @@ class Appointment(db.Model):
     end_time = db.Column(db.Time)
     mode = db.Column(db.String(20))
     status = db.Column(db.String(20), default='scheduled')
+    # slot this appointment holds; cleared when the appointment is cancelled
+    availability_id = db.Column(db.Integer, db.ForeignKey('availability.id'))
+    # when it was booked (lead time in analytics); NULL for imported history
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    patient = db.relationship('Patient')
+    doctor = db.relationship('Doctor')
+    department = db.relationship('Department')
+    availability = db.relationship('Availability')
 
 class Availability(db.Model):
+    # open-slot lookups (doctor_id, is_booked=False) ordered by date/time,
+    # the earliest open slots of any doctor (slot_search), and the doctor's
+    # own calendar ordered by date/time
+    __table_args__ = (
+        db.Index('ix_availability_open', 'doctor_id', 'is_booked', 'date', 'start_time'),
+        db.Index('ix_availability_open_time', 'is_booked', 'date', 'start_time'),
+        db.Index('ix_availability_doctor_date', 'doctor_id', 'date', 'start_time'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'))
     date = db.Column(db.Date)
@@ -61,7 +116,83 @@ class Availability(db.Model):
     end_time = db.Column(db.Time)
     is_booked = db.Column(db.Boolean, default=False)
 
+    doctor = db.relationship('Doctor')
+
+class AppointmentArchive(db.Model):
+    # appointments past the archive horizon, and soft-deleted ones, moved out
+    # of the hot table with their ids (app/archive.py). No foreign keys: the
+    # patient or doctor may be gone. Indexes end in (date, id) so the
+    # AppointmentRecord union merges in keyset order.
+    __tablename__ = 'appointment_archive'
+    __table_args__ = (
+        db.Index('ix_appointment_archive_doctor_date', 'doctor_id', 'date'),
+        db.Index('ix_appointment_archive_patient_date', 'patient_id', 'date'),
+        db.Index('ix_appointment_archive_date', 'date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer)
+    doctor_id = db.Column(db.Integer)
+    department_id = db.Column(db.Integer)
+    date = db.Column(db.Date)
+    start_time = db.Column(db.Time)
+    end_time = db.Column(db.Time)
+    mode = db.Column(db.String(20))
+    status = db.Column(db.String(20))
+    availability_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    deleted_at = db.Column(db.DateTime)                     # set when an admin deleted it
+
+
+class AvailabilityArchive(db.Model):
+    __tablename__ = 'availability_archive'
+    __table_args__ = (
+        db.Index('ix_availability_archive_doctor_date', 'doctor_id', 'date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    doctor_id = db.Column(db.Integer)
+    date = db.Column(db.Date)
+    start_time = db.Column(db.Time)
+    end_time = db.Column(db.Time)
+    is_booked = db.Column(db.Boolean)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+_RECORD_COLUMNS = ('id', 'patient_id', 'doctor_id', 'department_id', 'date', 'start_time', 'end_time',
+                   'mode', 'status', 'availability_id', 'created_at')
+# typed NULLs: SQLite only flattens the union (and merges the index scans)
+# when both arms' columns have the same affinity
+_appointment_records = db.union_all(
+    db.select(*[getattr(Appointment, c) for c in _RECORD_COLUMNS],
+              db.cast(db.null(), db.DateTime).label('archived_at'),
+              db.cast(db.null(), db.DateTime).label('deleted_at')),
+    db.select(*[getattr(AppointmentArchive, c) for c in _RECORD_COLUMNS],
+              AppointmentArchive.archived_at, AppointmentArchive.deleted_at),
+).subquery('appointment_record')
+
+
+class AppointmentRecord(db.Model):
+    # read-only: live and archived appointments as one (admin lists,
+    # /api/appointments, rollups). archived_at is NULL for live rows.
+    __table__ = _appointment_records
+    __mapper_args__ = {'primary_key': [_appointment_records.c.id]}
+
+    patient = db.relationship('Patient', primaryjoin='foreign(AppointmentRecord.patient_id) == Patient.id',
+                              viewonly=True)
+    doctor = db.relationship('Doctor', primaryjoin='foreign(AppointmentRecord.doctor_id) == Doctor.id',
+                             viewonly=True)
+    department = db.relationship('Department',
+                                 primaryjoin='foreign(AppointmentRecord.department_id) == Department.id',
+                                 viewonly=True)
+
+
 class PatientHistory(db.Model):
+    __table_args__ = (
+        db.Index('ix_patient_history_patient_visit', 'patient_id', 'visit_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
@@ -70,11 +201,122 @@ class PatientHistory(db.Model):
     visit_date = db.Column(db.DateTime, default=datetime.utcnow)
     visit_type = db.Column(db.String(50))
 
-    diagnosis = db.Column(db.Text)
-    prescription = db.Column(db.Text)
+    # the free-text record is only loaded when one of these is read (all
+    # five in one query); history lists show diagnosis_preview instead
+    diagnosis = db.deferred(db.Column(db.Text), group='detail')
+    prescription = db.deferred(db.Column(db.Text), group='detail')
+
+    tests_done = db.deferred(db.Column(db.Text), group='detail')        # ✅ new
+    medicines = db.deferred(db.Column(db.Text), group='detail')         # ✅ new
+    notes = db.deferred(db.Column(db.Text), group='detail')             # ✅ new
 
-    tests_done = db.Column(db.Text)        # ✅ new
-    medicines = db.Column(db.Text)         # ✅ new
-    notes = db.Column(db.Text)             # ✅ new
+    diagnosis_preview = db.column_property(db.func.substr(diagnosis, 1, 80))
 
+    patient = db.relationship('Patient')
+    doctor = db.relationship('Doctor')
 
+
+class PatientSummary(db.Model):
+    # per-patient digest of PatientHistory, updated as each visit is saved
+    # and rebuilt from the history when missing (app/history.py)
+    __tablename__ = 'patient_summary'
+
+    patient_id = db.Column(db.Integer, primary_key=True)
+    visits = db.Column(db.Integer, nullable=False, default=0)
+    first_visit = db.Column(db.DateTime)
+    last_visit = db.Column(db.DateTime)
+    last_doctor_id = db.Column(db.Integer)
+    recent_diagnoses = db.Column(db.Text, nullable=False, default='[]')    # JSON, newest first
+    active_medicines = db.Column(db.Text, nullable=False, default='[]')    # JSON
+
+
+class Job(db.Model):
+    # background job queue (app/jobs.py); workers claim due rows in run_at order
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False)           # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/running/done/failed
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime)                   # lease of the worker running it
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class RollupCounters:
+    # counters shared by the analytics rollups (app/analytics.py)
+    appointments = db.Column(db.Integer, nullable=False, default=0)
+    scheduled = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    booked_minutes = db.Column(db.Integer, nullable=False, default=0)     # appointments not cancelled
+    open_slots = db.Column(db.Integer, nullable=False, default=0)
+    booked_slots = db.Column(db.Integer, nullable=False, default=0)
+    open_minutes = db.Column(db.Integer, nullable=False, default=0)       # slots nobody booked
+    lead_days_sum = db.Column(db.Float, nullable=False, default=0)
+    lead_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyStats(RollupCounters, db.Model):
+    # one row per doctor and day with any appointment or slot, recomputed
+    # from the base tables; the two rollups below are sums of these rows
+    __tablename__ = 'daily_stats'
+    __table_args__ = (
+        db.Index('ix_daily_stats_date', 'date'),
+        db.Index('ix_daily_stats_department_date', 'department_id', 'date'),
+    )
+
+    doctor_id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    department_id = db.Column(db.Integer)                   # the doctor's, at refresh time
+
+
+class MonthlyStats(RollupCounters, db.Model):
+    __tablename__ = 'monthly_stats'
+    __table_args__ = (
+        db.Index('ix_monthly_stats_month', 'month'),
+    )
+
+    doctor_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)            # first day of the month
+    department_id = db.Column(db.Integer)
+
+
+class DepartmentDailyStats(RollupCounters, db.Model):
+    __tablename__ = 'department_daily_stats'
+    __table_args__ = (
+        db.Index('ux_department_daily_stats', 'department_id', 'date', unique=True),
+        db.Index('ix_department_daily_stats_date', 'date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    department_id = db.Column(db.Integer)                   # NULL: doctors without a department
+    date = db.Column(db.Date, nullable=False)
+
+
+class AnalyticsDirty(db.Model):
+    # doctor-days whose rollups are out of date; filled by triggers
+    __tablename__ = 'analytics_dirty'
+
+    doctor_id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+
+
+class DataVersion(db.Model):
+    # fragment cache versions shared by all worker processes (cache.DataVersions)
+    __tablename__ = 'data_version'
+
+    topic = db.Column(db.String(100), primary_key=True)     # 'appointments:7', 'doctors', '*'
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnalyticsState(db.Model):
+    # one row (id 1): when analytics.refresh() last recomputed anything
+    __tablename__ = 'analytics_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    refreshed_at = db.Column(db.DateTime)
@@ -0,0 +1,177 @@
+import json
+import os
+import smtplib
+from datetime import datetime, time, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db, jobs
+from app.models import Appointment, Patient, Doctor, User
+
+# Appointment notifications: confirmation, change, cancellation and a
+# reminder REMINDER_HOURS before the start.
+#
+# Views call appointment_event() before they commit; it only queues jobs
+# (app/jobs.py), so a slow or unreachable mail server never shows up in
+# request latency. The worker delivers them in batches through the sink
+# chosen by NOTIFY_SINK: 'file' appends JSON lines to NOTIFY_FILE (a stand-in
+# for a real provider), 'smtp' sends mail through SMTP_HOST over one
+# connection per batch.
+#
+# Payloads carry the appointment time as it was when the event happened.
+# A reminder whose appointment has since been cancelled or moved is dropped
+# at delivery; moving it queued a new one.
+
+KIND = 'notify'
+EVENTS = ('booked', 'changed', 'cancelled', 'reminder')
+SUBJECTS = {
+    'booked': 'Appointment confirmed',
+    'changed': 'Appointment changed',
+    'cancelled': 'Appointment cancelled',
+    'reminder': 'Appointment reminder',
+}
+BODIES = {
+    'booked': 'Hello {patient}, your appointment with Dr. {doctor} on {when} is confirmed.',
+    'changed': 'Hello {patient}, your appointment with Dr. {doctor} has been moved to {when}.',
+    'cancelled': 'Hello {patient}, your appointment with Dr. {doctor} on {when} has been cancelled.',
+    'reminder': 'Hello {patient}, this is a reminder of your appointment with Dr. {doctor} on {when}.',
+}
+
+
+def _when(day, start):
+    return datetime.combine(day, start or time.min) if day else None
+
+
+def _jobs_for(event, appt_id, patient_id, doctor_id, day, start, status):
+    """(payload, run_at) pairs for one event; nothing for appointments already in the past."""
+    when = _when(day, start)
+    if when is None or when < datetime.now():
+        return []
+    if event in ('booked', 'changed') and status != 'scheduled':
+        return []
+    payload = {'event': event, 'appointment_id': appt_id, 'patient_id': patient_id,
+               'doctor_id': doctor_id, 'at': when.isoformat(timespec='minutes')}
+    out = [(payload, None)]
+    if event in ('booked', 'changed'):
+        remind_at = when - timedelta(hours=current_app.config.get('REMINDER_HOURS', 24))
+        if remind_at > datetime.now():
+            out.append((dict(payload, event='reminder'), remind_at))
+    return out
+
+
+def appointment_event(event, appt):
+    """Queue notifications for `appt` (which must have an id). Caller commits."""
+    if not current_app.config.get('NOTIFY_ENABLED', True):
+        return
+    for payload, run_at in _jobs_for(event, appt.id, appt.patient_id, appt.doctor_id,
+                                     appt.date, appt.start_time, appt.status):
+        jobs.enqueue(KIND, payload, run_at)
+
+
+def appointment_events(event, rows):
+    """Bulk appointment_event() for dicts with id, patient_id, doctor_id, date, start_time, status."""
+    if not current_app.config.get('NOTIFY_ENABLED', True):
+        return
+    pending = []
+    for r in rows:
+        pending.extend(_jobs_for(event, r['id'], r['patient_id'], r['doctor_id'],
+                                 r['date'], r['start_time'], r['status']))
+    jobs.enqueue_many(KIND, pending)
+
+
+# ---------- delivery (worker side) ----------
+
+class FileSink:
+    """Appends one JSON line per message; stands in for an email/SMS provider."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send_many(self, messages):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(m) + '\n' for m in messages))
+            f.flush()
+            os.fsync(f.fileno())
+        return {}
+
+
+class SmtpSink:
+    def __init__(self, host, port, sender, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send_many(self, messages):
+        """One connection for the batch. Returns {index: error} for refused messages."""
+        errors = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for i, m in enumerate(messages):
+                msg = EmailMessage()
+                msg['From'], msg['To'], msg['Subject'] = self.sender, m['to'], m['subject']
+                msg.set_content(m['body'])
+                try:
+                    smtp.send_message(msg)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as ex:
+                    errors[i] = str(ex)
+        return errors
+
+
+_sink = None
+
+
+def configure(app):
+    """Build the delivery sink from NOTIFY_SINK (worker start-up)."""
+    global _sink
+    kind = app.config.get('NOTIFY_SINK', 'file')
+    if kind == 'smtp':
+        _sink = SmtpSink(app.config.get('SMTP_HOST', 'localhost'), app.config.get('SMTP_PORT', 25),
+                         app.config.get('NOTIFY_FROM', 'hospital@example.com'))
+    elif kind == 'file':
+        _sink = FileSink(app.config.get('NOTIFY_FILE') or os.path.join(app.instance_path, 'notifications.jsonl'))
+    else:
+        raise ValueError("NOTIFY_SINK must be 'file' or 'smtp'")
+
+
+@jobs.handler(KIND)
+def deliver(batch):
+    """Render and send a batch of notifications: three lookups, one sink call."""
+    if _sink is None:
+        configure(current_app)
+    appt_ids = {j.payload['appointment_id'] for j in batch}
+    patient_ids = {j.payload['patient_id'] for j in batch}
+    doctor_ids = {j.payload['doctor_id'] for j in batch}
+    appts = {r.id: r for r in db.session.execute(
+        select(Appointment.id, Appointment.status, Appointment.date, Appointment.start_time)
+        .where(Appointment.id.in_(appt_ids)))}
+    patients = {r.id: r for r in db.session.execute(
+        select(Patient.id, User.username, User.email).join(User, User.id == Patient.user_id)
+        .where(Patient.id.in_(patient_ids)))}
+    doctors = {r.id: r.username for r in db.session.execute(
+        select(Doctor.id, User.username).join(User, User.id == Doctor.user_id)
+        .where(Doctor.id.in_(doctor_ids)))}
+
+    messages, sent_jobs = [], []
+    for job in batch:
+        p = job.payload
+        patient = patients.get(p['patient_id'])
+        if patient is None or not patient.email:
+            continue        # account deleted since: nobody to tell
+        if p['event'] == 'reminder':
+            appt = appts.get(p['appointment_id'])
+            if appt is None or appt.status != 'scheduled' or \
+                    _when(appt.date, appt.start_time).isoformat(timespec='minutes') != p['at']:
+                continue
+        when = datetime.fromisoformat(p['at']).strftime('%Y-%m-%d %H:%M')
+        messages.append({'to': patient.email, 'subject': SUBJECTS[p['event']],
+                         'body': BODIES[p['event']].format(patient=patient.username,
+                                                           doctor=doctors.get(p['doctor_id'], 'unknown'), when=when),
+                         'event': p['event'], 'appointment_id': p['appointment_id']})
+        sent_jobs.append(job)
+    if not messages:
+        return {}
+    errors = _sink.send_many(messages)
+    return {sent_jobs[i].id: error for i, error in errors.items()}
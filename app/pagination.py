@@ -0,0 +1,87 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime, time
+
+from sqlalchemy import tuple_
+
+# Keyset ("seek") pagination for the admin tables.
+#
+# A page is fetched with WHERE (sort columns) > (values of the last row shown)
+# instead of OFFSET, so page 1000 costs the same index seek as page 1. The
+# cursor is the last/first row's sort values, JSON + urlsafe base64. The last
+# sort column must be unique (the primary key) so the order is total, and
+# sort columns must be NOT NULL in practice (row value comparisons skip NULLs).
+#
+# `after` walks forward; `before` walks back from the first row of the current
+# page (query reversed, then flipped back), which is what the Previous link uses.
+
+Page = namedtuple('Page', 'items next_cursor prev_cursor')
+
+
+def _dump(value):
+    return value.isoformat() if isinstance(value, (date, time)) else value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_dump(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if len(values) != len(columns):
+            raise ValueError
+        out = []
+        for col, v in zip(columns, values):
+            kind = col.type.python_type
+            out.append(kind.fromisoformat(v) if v is not None and kind in (date, time, datetime) else v)
+        return out
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def paginate(query, columns, per_page, after=None, before=None, descending=False):
+    """
+    One page of a legacy Query ordered by `columns`.
+    Returns Page(items, next_cursor, prev_cursor); bad cursors raise ValueError.
+    """
+    key = tuple_(*columns)
+    backwards = before is not None
+    if backwards:
+        values = decode_cursor(before, columns)
+        query = query.filter(key > tuple_(*values) if descending else key < tuple_(*values))
+    elif after is not None:
+        values = decode_cursor(after, columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    # walking back reads the reversed order, so flip the direction for that query
+    desc = descending != backwards
+    query = query.order_by(*[c.desc() if desc else c.asc() for c in columns])
+    rows = query.add_columns(*columns).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [r[0] for r in rows]
+    first = encode_cursor(rows[0][1:]) if rows else None
+    last = encode_cursor(rows[-1][1:]) if rows else None
+    if backwards:
+        return Page(items, last, first if more else None)
+    return Page(items, last if more else None, first if after is not None and rows else None)
+
+
+def page_url(**changes):
+    """
+    URL of the current view with some query args replaced (None drops one).
+    Changing sort/dir also drops every cursor, since they belong to the old order.
+    """
+    from flask import request, url_for
+    args = request.args.to_dict()
+    if 'sort' in changes or 'dir' in changes:
+        args = {k: v for k, v in args.items() if not k.endswith(('after', 'before'))}
+    args.update(changes)
+    args = {k: v for k, v in args.items() if v is not None}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
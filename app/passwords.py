@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Password hashing and login throttling.
+#
+# A password hash is deliberately expensive, and a burst of logins used to
+# run one per request worker at once, starving every other page. Hashes now
+# run on a bounded pool of PASSWORD_HASH_WORKERS threads (hashlib's scrypt
+# and pbkdf2 release the GIL, so threads use every core) or processes. At
+# most PASSWORD_HASH_MAX_PENDING hashes may wait for the pool; past that the
+# caller gets PoolBusy straight away and the login page answers 503 instead
+# of queueing more work. PASSWORD_HASH_WORKERS = 0 hashes inline.
+#
+# The cost is PASSWORD_HASH_METHOD in werkzeug's notation ("scrypt",
+# "scrypt:16384:8:1", "pbkdf2:sha256:600000"). Stored hashes record the
+# parameters they were made with; after a successful login a hash with
+# other parameters is replaced (rehash_if_needed), so a cost change rolls
+# out as users sign in.
+#
+# Login attempts are throttled per username and per client IP with token
+# buckets before any hashing happens, so credential stuffing costs a dict
+# lookup rather than a hash. Like the lookup cache, pools and buckets are
+# per worker process.
+
+
+class PoolBusy(Exception):
+    """Too many hashes already waiting for the pool."""
+
+
+_settings = {'method': 'scrypt', 'workers': 0, 'kind': 'thread', 'max_pending': 64}
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_pending = None
+_method_prefix = None
+
+
+def configure(config):
+    global _pending, _method_prefix
+    shutdown()
+    _settings.update(method=config.get('PASSWORD_HASH_METHOD') or 'scrypt',
+                     workers=config.get('PASSWORD_HASH_WORKERS', 0),
+                     kind=config.get('PASSWORD_HASH_POOL', 'thread'),
+                     max_pending=config.get('PASSWORD_HASH_MAX_PENDING', 64))
+    if _settings['kind'] not in ('thread', 'process'):
+        raise ValueError("PASSWORD_HASH_POOL must be 'thread' or 'process'")
+    _pending = threading.BoundedSemaphore(_settings['workers'] + _settings['max_pending'])
+    _method_prefix = _normalize(_settings['method'])
+    login_limits.configure(config)
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _normalize(method):
+    """The prefix werkzeug stores for `method`, e.g. 'scrypt' -> 'scrypt:32768:8:1'."""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(args or ['32768', '8', '1'])
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f"Unsupported PASSWORD_HASH_METHOD {method!r}")
+
+
+def method():
+    return _settings['method']
+
+
+def _pool():
+    global _executor, _executor_pid
+    with _lock:
+        # a pool inherited through fork() has no live workers; start a new one
+        if _executor is None or _executor_pid != os.getpid():
+            cls = ProcessPoolExecutor if _settings['kind'] == 'process' else ThreadPoolExecutor
+            _executor, _executor_pid = cls(max_workers=_settings['workers']), os.getpid()
+        return _executor
+
+
+def _run(fn, *args):
+    if not _settings['workers']:
+        return fn(*args)
+    if not _pending.acquire(blocking=False):
+        raise PoolBusy()
+    try:
+        return _pool().submit(fn, *args).result()
+    finally:
+        _pending.release()
+
+
+def hash_password(password):
+    return _run(partial(generate_password_hash, method=_settings['method']), password)
+
+
+def verify(stored, password):
+    if not stored:
+        return False
+    return _run(check_password_hash, stored, password)
+
+
+def needs_rehash(stored):
+    return bool(stored) and stored.split('$', 1)[0] != _method_prefix
+
+
+def rehash_if_needed(user, password):
+    """After a successful login: re-hash with the current cost if it changed. Caller commits."""
+    if needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        return True
+    return False
+
+
+# ---------- login throttling ----------
+
+class TokenBuckets:
+    """
+    `rate` attempts per `per` seconds for each key, refilled continuously.
+    Least recently used keys are dropped past max_keys.
+    """
+
+    def __init__(self, rate=10, per=60, max_keys=100000):
+        self.rate = rate
+        self.per = per
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()       # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Spend one attempt. Returns 0 if allowed, else seconds until the next one is."""
+        if not self.rate:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * self.rate / self.per)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) * self.per / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class LoginLimits:
+    def __init__(self):
+        self.by_username = TokenBuckets()
+        self.by_ip = TokenBuckets(rate=100)
+
+    def configure(self, config):
+        per = config.get('LOGIN_RATE_WINDOW_SECONDS', 60)
+        self.by_username.rate, self.by_username.per = config.get('LOGIN_RATE_PER_USERNAME', 10), per
+        self.by_ip.rate, self.by_ip.per = config.get('LOGIN_RATE_PER_IP', 100), per
+        self.by_username.clear()
+        self.by_ip.clear()
+
+    def check(self, username, ip):
+        """Charge one attempt to both keys. Returns seconds to wait, 0 if the attempt may go ahead."""
+        return max(self.by_ip.take(ip), self.by_username.take(username.lower()))
+
+    def succeeded(self, username):
+        # the IP bucket keeps counting: a shared clinic NAT still has its own limit
+        self.by_username.reset(username.lower())
+
+
+login_limits = LoginLimits()
@@ -1,14 +1,34 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, abort
 from flask_login import current_user
 from app.models import User, Department, Doctor
-from app import db
+from app import db, search, booking, cache, intervals, pagination, metrics, export, importer, notify, analytics, archive
 # --- Admin: Manage Appointments ---
 from flask import jsonify
-from app.models import Appointment, Patient, Doctor, Department, Availability
+from app.models import Appointment, AppointmentRecord, Patient, Doctor, Department, Availability
 from datetime import datetime, time
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('admin', __name__)
 
+DASHBOARD_PAGE_SIZE = 20
+APPOINTMENTS_PAGE_SIZE = 50
+LOOKUP_LIMIT = 10
+
+# sortable columns per list: ?sort=<key>&dir=asc|desc, ending in the primary key
+# so keyset cursors are unambiguous
+APPOINTMENT_SORTS = {
+    'date': (AppointmentRecord.date, AppointmentRecord.id),
+    'id': (AppointmentRecord.id,),
+}
+DOCTOR_SORTS = {
+    'id': (Doctor.id,),
+    'username': (User.username, Doctor.id),
+}
+PATIENT_SORTS = {
+    'id': (User.id,),
+    'username': (User.username, User.id),
+}
+
 def admin_required(fn):
     from functools import wraps
     @wraps(fn)
@@ -18,13 +38,68 @@ def admin_required(fn):
         return fn(*a, **k)
     return wrapper
 
+
+def _sort_arg(options, default, default_dir='asc'):
+    """(key, columns, descending) from ?sort= / ?dir=, falling back to the defaults."""
+    key = request.args.get('sort', default)
+    if key not in options:
+        key = default
+    direction = request.args.get('dir', default_dir)
+    return key, options[key], direction == 'desc'
+
+
+def _keyset_page(query, columns, per_page, descending, prefix=''):
+    """pagination.paginate() driven by ?<prefix>after= / ?<prefix>before=; bad cursors restart at page 1."""
+    after = request.args.get(prefix + 'after')
+    before = request.args.get(prefix + 'before')
+    try:
+        return pagination.paginate(query, columns, per_page, after=after, before=before, descending=descending)
+    except ValueError:
+        return pagination.paginate(query, columns, per_page, descending=descending)
+
 @bp.route('/')
 @admin_required
 def dashboard():
-    users = User.query.all()
-    departments = Department.query.all()
-    doctors = Doctor.query.all()
-    return render_template('admin/dashboard.html', users=users, departments=departments, doctors=doctors)
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = DASHBOARD_PAGE_SIZE
+    sort = request.args.get('sort', 'id')
+    doctor_page = patient_page = None
+
+    if q:
+        # ranked matches from the full-text index, one page per panel
+        doc_ids, doc_more = search.search(q, 'doctor', page, per_page)
+        pat_ids, pat_more = search.search(q, 'patient', page, per_page)
+        dep_ids, _ = search.search(q, 'department', 1, per_page)
+        doctors = search.load_ordered(Doctor, doc_ids,
+                                      joinedload(Doctor.user), joinedload(Doctor.department))
+        patients = search.load_ordered(User, pat_ids)
+        departments = search.load_ordered(Department, dep_ids)
+        has_next = doc_more or pat_more
+    else:
+        # each panel pages on its own keyset cursor (doctors_after=..., patients_after=...)
+        sort, doc_cols, desc = _sort_arg(DOCTOR_SORTS, 'id')
+        doctor_q = Doctor.query.options(joinedload(Doctor.user), joinedload(Doctor.department))
+        if sort == 'username':
+            doctor_q = doctor_q.join(User, User.id == Doctor.user_id).filter(User.role == 'doctor')
+        doctor_page = _keyset_page(doctor_q, doc_cols, per_page, desc, prefix='doctors_')
+        _, pat_cols, desc = _sort_arg(PATIENT_SORTS, 'id')
+        patient_page = _keyset_page(User.query.filter_by(role='patient'),
+                                    pat_cols, per_page, desc, prefix='patients_')
+        doctors, patients = doctor_page.items, patient_page.items
+        departments = None
+        has_next = False
+
+    # full list is still needed for the "add doctor" dropdown
+    all_departments = cache.departments()
+    if departments is None:
+        departments = all_departments
+
+    return render_template('admin/dashboard.html', q=q, page=page, sort=sort,
+                           doctors=doctors, patients=patients, departments=departments,
+                           all_departments=all_departments,
+                           doctor_page=doctor_page, patient_page=patient_page,
+                           has_next=has_next)
 
 @bp.route('/departments/add', methods=['POST'])
 @admin_required
@@ -38,6 +113,9 @@ def add_department():
         return redirect(url_for('admin.dashboard'))
     d = Department(name=name, description=request.form.get('description',''))
     db.session.add(d)
+    db.session.flush()
+    search.index_department(d)
+    cache.invalidate_on_commit(('departments',), ('version', 'departments'))
     db.session.commit()
     flash('Department added')
     return redirect(url_for('admin.dashboard'))
@@ -84,6 +162,9 @@ def add_doctor():
                     specialization=specialization or None,
                     experience_years=int(exp) if exp.isdigit() else None)
     db.session.add(doctor)
+    db.session.flush()
+    search.index_doctor(doctor)
+    cache.invalidate_on_commit(('dept_doctors', doctor.department_id), ('version', 'doctors'))
     db.session.commit()
 
     flash('Doctor account created.')
@@ -98,7 +179,7 @@ def add_doctor():
 def edit_doctor(doctor_id):
     doc = Doctor.query.get_or_404(doctor_id)
     user = User.query.get(doc.user_id)
-    departments = Department.query.all()
+    departments = cache.departments()
 
     if request.method == 'POST':
         # gather fields
@@ -142,6 +223,10 @@ def edit_doctor(doctor_id):
         doc.specialization = specialization or None
         doc.experience_years = int(exp) if exp.isdigit() else None
         db.session.add(doc)
+        db.session.flush()
+        search.index_doctor(doc)
+        # name and/or department may have changed: drop every per-department list
+        cache.invalidate_on_commit('dept_doctors', ('principal', user.id), ('version', 'doctors'))
 
         db.session.commit()
         flash('Doctor updated.')
@@ -160,9 +245,13 @@ def delete_doctor(doctor_id):
     user = User.query.get(doc.user_id)
 
     # remove doctor row
+    search.remove('doctor', doc.id)
+    cache.invalidate_on_commit(('dept_doctors', doc.department_id), ('doctor_slots', doc.id),
+                               ('version', 'doctors'))
     db.session.delete(doc)
     # remove user row
     if user:
+        cache.invalidate_on_commit(('principal', user.id))
         db.session.delete(user)
     db.session.commit()
     flash('Doctor account deleted.')
@@ -213,6 +302,8 @@ def edit_patient(user_id):
         # apply changes
         user.username = username
         user.email = email
+        search.index_patient(user)
+        cache.invalidate_on_commit(('principal', user.id), ('version', 'patients'))
         db.session.commit()
         flash('Patient details updated.', 'success')
         return redirect(url_for('admin.dashboard'))
@@ -235,12 +326,15 @@ def delete_patient(user_id):
     patient = Patient.query.filter_by(user_id=user.id).first()
 
     if patient:
-        # delete this patient's appointments
-        Appointment.query.filter_by(patient_id=patient.id).delete()
+        # free the slots they held, then move this patient's appointments to the archive as deleted
+        booking.release_slots_for_patient(patient.id)
+        archive.soft_delete([i for (i,) in db.session.query(Appointment.id).filter_by(patient_id=patient.id)])
         # delete patient profile
         db.session.delete(patient)
 
     # finally delete user account
+    search.remove('patient', user.id)
+    cache.invalidate_on_commit(('principal', user.id), ('version', 'patients'))
     db.session.delete(user)
     db.session.commit()
     flash('Patient deleted successfully.', 'success')
@@ -251,18 +345,19 @@ def delete_patient(user_id):
 @bp.route('/doctors/<int:doctor_id>/appointments')
 @admin_required
 def manage_doctor_appointments(doctor_id):
-    """Admin view of all appointments for a given doctor."""
+    """Admin view of all appointments for a given doctor, archived ones included."""
     doctor = Doctor.query.get_or_404(doctor_id)
-    appts = (
-        Appointment.query
-        .filter_by(doctor_id=doctor.id)
-        .order_by(Appointment.date, Appointment.start_time)
-        .all()
-    )
+    sort, columns, desc = _sort_arg(APPOINTMENT_SORTS, 'date')
+    page = _keyset_page(
+        AppointmentRecord.query
+        .options(joinedload(AppointmentRecord.patient).joinedload(Patient.user))
+        .filter(AppointmentRecord.doctor_id == doctor.id, AppointmentRecord.deleted_at.is_(None)),
+        columns, APPOINTMENTS_PAGE_SIZE, desc)
     return render_template(
         'admin/manage_appointments.html',
         doctor=doctor,
-        appointments=appts
+        appointments=page.items,
+        page=page, sort=sort, descending=desc
     )
 
 
@@ -276,6 +371,8 @@ def admin_cancel_appointment(appt_id):
     doctor_id = appt.doctor_id
 
     appt.status = 'cancelled'
+    booking.release_slot(appt)
+    notify.appointment_event('cancelled', appt)
     db.session.commit()
     flash('Appointment cancelled.', 'success')
 
@@ -285,18 +382,26 @@ def admin_cancel_appointment(appt_id):
 @bp.route('/appointments')
 @admin_required
 def appointments_list():
-    # show all appointments with related user info
-    appts = Appointment.query.order_by(Appointment.date.desc(), Appointment.start_time).all()
-    # eager fetch helper via templates
-    return render_template('admin/appointments.html', appointments=appts)
+    # show all appointments with related user info, one keyset page at a time
+    # load patient/doctor users and department in the same query as the appointments
+    # live and archived rows together; SQLite merges the two index scans
+    sort, columns, desc = _sort_arg(APPOINTMENT_SORTS, 'date', 'desc')
+    page = _keyset_page(
+        AppointmentRecord.query
+        .options(joinedload(AppointmentRecord.patient).joinedload(Patient.user),
+                 joinedload(AppointmentRecord.doctor).joinedload(Doctor.user),
+                 joinedload(AppointmentRecord.department))
+        .filter(AppointmentRecord.deleted_at.is_(None)),
+        columns, APPOINTMENTS_PAGE_SIZE, desc)
+    return render_template('admin/appointments.html', appointments=page.items,
+                           page=page, sort=sort, descending=desc)
 
 @bp.route('/appointments/<int:appt_id>/edit', methods=['GET','POST'])
 @admin_required
 def edit_appointment(appt_id):
-    appt = Appointment.query.get_or_404(appt_id)
-    patients = Patient.query.all()
-    doctors = Doctor.query.all()
-    departments = Department.query.all()
+    appt = Appointment.query.options(joinedload(Appointment.patient).joinedload(Patient.user),
+                                     joinedload(Appointment.doctor).joinedload(Doctor.user)).get_or_404(appt_id)
+    departments = cache.departments()
 
     if request.method == 'POST':
         # gather fields
@@ -319,6 +424,11 @@ def edit_appointment(appt_id):
             errors.append('Date required.')
         if not start_str or not end_str:
             errors.append('Start and end time required.')
+        if patient_id and doctor_id and department_id:
+            try:
+                patient_id, doctor_id, department_id = int(patient_id), int(doctor_id), int(department_id)
+            except ValueError:
+                errors.append('Patient, doctor and department must be numeric ids.')
 
         # parse date/time
         date_obj = None
@@ -331,20 +441,47 @@ def edit_appointment(appt_id):
         except Exception:
             errors.append('Invalid date/time format.')
 
+        if not errors:
+            if end_obj <= start_obj:
+                errors.append('End time must be after start time.')
+            elif status != 'cancelled':
+                clash = intervals.appointment_conflict(doctor_id, date_obj, start_obj, end_obj,
+                                                       exclude_id=appt.id)
+                if clash:
+                    errors.append(f'Doctor already has appointment #{clash.id} at {intervals.describe(clash)}.')
+                elif (appt.doctor_id, appt.date, appt.start_time, appt.end_time) != (doctor_id, date_obj,
+                                                                                     start_obj, end_obj):
+                    slot = booking.overlapping_open_slot(appt, doctor_id, date_obj, start_obj, end_obj)
+                    if slot:
+                        errors.append(f'Overlaps the open slot at {intervals.describe(slot)}; '
+                                      f'use its times or remove the slot first.')
+
         if errors:
             for e in errors:
                 flash(e)
             return render_template('admin/edit_appointment.html',
-                                   appt=appt, patients=patients, doctors=doctors, departments=departments)
+                                   appt=appt, departments=departments)
 
         # apply updates
-        appt.patient_id = int(patient_id)
-        appt.doctor_id = int(doctor_id)
-        appt.department_id = int(department_id)
+        before = (appt.status, appt.patient_id, appt.doctor_id, appt.date, appt.start_time)
+        moved = (appt.doctor_id, appt.date, appt.start_time, appt.end_time) != (doctor_id, date_obj,
+                                                                               start_obj, end_obj)
+        if moved or status == 'cancelled':
+            # the old slot goes back on offer; a moved appointment takes the slot at its new time, if any
+            booking.release_slot(appt)
+        appt.patient_id = patient_id
+        appt.doctor_id = doctor_id
+        appt.department_id = department_id
         appt.date = date_obj
         appt.start_time = start_obj
         appt.end_time = end_obj
         appt.status = status
+        if moved and status != 'cancelled':
+            booking.relink_slot(appt)
+        if status == 'cancelled' and before[0] != 'cancelled':
+            notify.appointment_event('cancelled', appt)
+        elif before != (appt.status, appt.patient_id, appt.doctor_id, appt.date, appt.start_time):
+            notify.appointment_event('changed', appt)
 
         db.session.add(appt)
         db.session.commit()
@@ -352,14 +489,140 @@ def edit_appointment(appt_id):
         return redirect(url_for('admin.appointments_list'))
 
     return render_template('admin/edit_appointment.html',
-                           appt=appt, patients=patients, doctors=doctors, departments=departments)
+                           appt=appt, departments=departments)
 
 
 @bp.route('/appointments/<int:appt_id>/delete', methods=['POST'])
 @admin_required
 def delete_appointment(appt_id):
     appt = Appointment.query.get_or_404(appt_id)
-    db.session.delete(appt)
+    booking.release_slot(appt)
+    archive.soft_delete([appt.id])
     db.session.commit()
     flash('Appointment deleted.')
     return redirect(url_for('admin.appointments_list'))
+
+
+@bp.route('/history/export')
+@admin_required
+def export_history():
+    """Stream PatientHistory as CSV (default) or NDJSON; resume with ?after=<last id>."""
+    from flask import Response, stream_with_context
+    try:
+        filters = export.parse_filters(request.args)
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+    if request.args.get('format') == 'ndjson':
+        body, mimetype, name = export.as_ndjson(filters), 'application/x-ndjson', 'patient_history.ndjson'
+    else:
+        body, mimetype, name = export.as_csv(filters), 'text/csv', 'patient_history.csv'
+    resp = Response(stream_with_context(body), mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename={name}'
+    return resp
+
+
+@bp.route('/import', methods=['GET', 'POST'])
+@admin_required
+def import_csv():
+    """Upload a CSV of patients, doctors or appointments; shows counts and row errors."""
+    import io
+    from flask import current_app
+    report = None
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in importer.KINDS:
+            flash('Please choose what the file contains.')
+        elif not upload or not upload.filename:
+            flash('Please choose a CSV file.')
+        else:
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            try:
+                with importer.Importer(hash_workers=current_app.config.get('IMPORT_HASH_WORKERS') or None) as run:
+                    report = run.run(kind, stream)
+            except (ValueError, UnicodeDecodeError) as ex:
+                flash(f'Could not import {upload.filename}: {ex}')
+    return render_template('admin/import.html', report=report, kinds=importer.KINDS)
+
+
+def _analytics_report():
+    """Summarise the rollups for ?from=&to=&group=&department_id=&doctor_id= (read-only; see analytics.refresh)."""
+    date_from, date_to = analytics.parse_range(request.args)
+    ids = {}
+    for name in ('department_id', 'doctor_id'):
+        value = request.args.get(name)
+        if value:
+            if not value.isdigit():
+                raise ValueError(f"{name} must be an integer")
+            ids[name] = int(value)
+    report = analytics.summary(date_from, date_to, request.args.get('group', 'department'), **ids)
+    report['pending'] = analytics.pending()
+    refreshed = analytics.last_refresh()
+    report['refreshed_at'] = refreshed.isoformat(timespec='seconds') if refreshed else None
+    return report
+
+
+@bp.route('/analytics')
+@admin_required
+def analytics_dashboard():
+    """Utilization, cancellation/no-show rates and lead times from the daily rollups."""
+    try:
+        report = _analytics_report()
+    except ValueError as ex:
+        flash(str(ex))
+        return redirect(url_for('admin.analytics_dashboard'))
+    return render_template('admin/analytics.html', report=report, groups=analytics.GROUPS,
+                           departments=cache.departments(), args=request.args)
+
+
+@bp.route('/analytics/data')
+@admin_required
+def analytics_data():
+    """JSON form of the analytics dashboard."""
+    try:
+        return jsonify(_analytics_report())
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+
+
+@bp.route('/metrics')
+def metrics_export():
+    """Request/SQL metrics of this worker in Prometheus text format."""
+    from flask import current_app, Response
+    import hmac
+    token = current_app.config.get('METRICS_TOKEN')
+    header = request.headers.get('Authorization', '')
+    by_token = bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+    if not by_token and (not current_user.is_authenticated or current_user.role != 'admin'):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/cache/stats')
+@admin_required
+def cache_stats():
+    """Hit/miss counters of this worker's lookup cache."""
+    return jsonify(cache.lookup_cache.stats())
+
+
+@bp.route('/lookup/<kind>')
+@admin_required
+def lookup(kind):
+    """Top matches for the patient/doctor pickers: [{"id": ..., "label": ...}]."""
+    q = request.args.get('q', '').strip()
+    if kind not in ('patient', 'doctor'):
+        abort(404)
+    if not q:
+        return jsonify([])
+    ids, _ = search.search(q, kind, 1, LOOKUP_LIMIT)
+    if kind == 'doctor':
+        doctors = search.load_ordered(Doctor, ids, joinedload(Doctor.user), joinedload(Doctor.department))
+        return jsonify([{"id": d.id,
+                         "label": (d.user.username if d.user else f"Doctor {d.id}")
+                                  + (f" ({d.department.name})" if d.department else "")}
+                        for d in doctors])
+    # patient entries in the index are keyed by user id; the form wants Patient.id
+    users = search.load_ordered(User, ids)
+    profiles = {p.user_id: p.id for p in Patient.query.filter(Patient.user_id.in_(ids))} if ids else {}
+    return jsonify([{"id": profiles[u.id], "label": f"{u.username} <{u.email}>"}
+                    for u in users if u.id in profiles])
@@ -1,73 +1,324 @@
-from flask import Blueprint, request, jsonify
-from app.models import Appointment, db, Doctor, Availability, Department, User
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from app.models import Appointment, AppointmentRecord, db, Doctor, Department, Patient, PatientHistory
+from app import booking, cache, intervals, batch, notify, slot_search, doctor_calendar, history, archive
 from datetime import datetime
+from sqlalchemy import select, and_, or_
+import base64, json
 
 bp = Blueprint('api', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 1000
+
+# live and archived rows alike (app/archive.py)
+APPT_COLUMNS = (AppointmentRecord.id, AppointmentRecord.patient_id, AppointmentRecord.doctor_id,
+                AppointmentRecord.department_id, AppointmentRecord.date, AppointmentRecord.status,
+                AppointmentRecord.archived_at)
+ARCHIVED_FILTERS = ('include', 'exclude', 'deleted')
+
+
+# ---------- keyset pagination helpers ----------
+# cursor = urlsafe base64 of "<date>|<id>" for the last row of the previous page;
+# rows are ordered by (date, id) so the next page is simply "everything after it".
+
+def _encode_cursor(row):
+    raw = f"{row.date.isoformat() if row.date else ''}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        date_str, id_str = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(date_str).date(), int(id_str)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value).date()
+    except Exception:
+        raise ValueError(f"Invalid {name}; use ISO YYYY-MM-DD")
+
+
+def _filtered_appointments(args):
+    """Build the ordered SELECT for GET /api/appointments from query params."""
+    archived = args.get('archived', 'include')
+    if archived not in ARCHIVED_FILTERS:
+        raise ValueError(f"archived must be one of {', '.join(ARCHIVED_FILTERS)}")
+    rec = AppointmentRecord
+    q = select(*APPT_COLUMNS)
+    if archived == 'deleted':
+        q = q.where(rec.deleted_at.isnot(None))
+    else:
+        q = q.where(rec.deleted_at.is_(None))
+        if archived == 'exclude':
+            q = q.where(rec.archived_at.is_(None))
+    for name, col in (('doctor_id', rec.doctor_id),
+                      ('patient_id', rec.patient_id),
+                      ('department_id', rec.department_id)):
+        if args.get(name):
+            if not args.get(name).isdigit():
+                raise ValueError(f"{name} must be an integer")
+            q = q.where(col == int(args.get(name)))
+    if args.get('status'):
+        q = q.where(rec.status == args.get('status'))
+    if args.get('date_from'):
+        q = q.where(rec.date >= _parse_date(args.get('date_from'), 'date_from'))
+    if args.get('date_to'):
+        q = q.where(rec.date <= _parse_date(args.get('date_to'), 'date_to'))
+    if args.get('cursor'):
+        c_date, c_id = _decode_cursor(args.get('cursor'))
+        q = q.where(or_(rec.date > c_date,
+                        and_(rec.date == c_date, rec.id > c_id)))
+    return q.order_by(rec.date, rec.id)
+
+
+def _appt_row(r):
+    return {
+        "id": r.id,
+        "patient_id": r.patient_id,
+        "doctor_id": r.doctor_id,
+        "department_id": r.department_id,
+        "date": r.date.isoformat() if r.date else None,
+        "status": r.status,
+        "archived": r.archived_at is not None
+    }
+
+
+def _stream_ndjson(query):
+    result = db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    for partition in result.partitions():
+        yield ''.join(json.dumps(_appt_row(r)) + '\n' for r in partition)
+
 @bp.route('/appointments', methods=['GET', 'POST'])
 def appointments():
     if request.method == 'GET':
-        appts = Appointment.query.all()
-        data = []
-        for a in appts:
-            data.append({
-                "id": a.id,
-                "patient_id": a.patient_id,
-                "doctor_id": a.doctor_id,
-                "department_id": a.department_id,
-                "date": a.date.isoformat() if a.date else None,
-                "status": a.status
-            })
-        return jsonify(data), 200
+        try:
+            query = _filtered_appointments(request.args)
+        except ValueError as ex:
+            return jsonify({"error": str(ex)}), 400
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        if limit < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        if request.args.get('format') == 'ndjson':
+            # full export: rows are pulled from the DB cursor in batches, never all at once
+            return Response(stream_with_context(_stream_ndjson(query)),
+                            mimetype='application/x-ndjson')
+
+        rows = db.session.execute(query.limit(limit + 1)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1])
+        return jsonify({"items": [_appt_row(r) for r in rows], "next_cursor": next_cursor}), 200
 
     if request.method == 'POST':
         payload = request.get_json() or {}
+        ids = {}
+        for k in ('patient_id', 'doctor_id', 'department_id', 'availability_id'):
+            if payload.get(k) is not None and payload.get(k) != '':
+                try:
+                    ids[k] = int(payload[k])
+                except (TypeError, ValueError):
+                    return jsonify({"error": f"{k} must be an integer"}), 400
+        if ids.get('availability_id'):
+            # book a published slot: doctor/date/times come from the slot itself
+            if 'patient_id' not in ids:
+                return jsonify({"error": "patient_id is required"}), 400
+            a, error = booking.book_slot(ids['patient_id'], ids['availability_id'],
+                                         department_id=ids.get('department_id') or None)
+            if error:
+                return jsonify({"error": error}), 409
+            return jsonify({"id": a.id}), 201
+
         required = ['patient_id', 'doctor_id', 'date']
         for k in required:
-            if k not in payload:
+            if k not in payload or (k != 'date' and k not in ids):
                 return jsonify({"error": f"{k} is required"}), 400
         try:
             date = datetime.fromisoformat(payload['date']).date()
         except Exception:
             return jsonify({"error": "Invalid date format; use ISO YYYY-MM-DD"}), 400
+        start = end = None
+        if payload.get('start_time') or payload.get('end_time'):
+            try:
+                start = datetime.strptime(payload['start_time'], "%H:%M").time()
+                end = datetime.strptime(payload['end_time'], "%H:%M").time()
+            except Exception:
+                return jsonify({"error": "start_time and end_time must both be HH:MM"}), 400
+            if end <= start:
+                return jsonify({"error": "end_time must be after start_time"}), 400
+            status = payload.get('status', 'scheduled')
+            clash = status != 'cancelled' and intervals.appointment_conflict(
+                ids['doctor_id'], date, start, end)
+            if clash:
+                return jsonify({"error": f"Doctor already has appointment {clash.id} at that time"}), 409
         a = Appointment(
-            patient_id=int(payload['patient_id']),
-            doctor_id=int(payload['doctor_id']),
-            department_id=int(payload.get('department_id')) if payload.get('department_id') else None,
+            patient_id=ids['patient_id'],
+            doctor_id=ids['doctor_id'],
+            department_id=ids.get('department_id') or None,
             date=date,
+            start_time=start,
+            end_time=end,
             status=payload.get('status','scheduled')
         )
         db.session.add(a)
+        db.session.flush()
+        notify.appointment_event('booked', a)
         db.session.commit()
         return jsonify({"id": a.id}), 201
 
+@bp.route('/appointments/batch', methods=['POST'])
+def appointments_batch():
+    """Many creates / status updates / deletes in one transaction, see app/batch.py. Admin only."""
+    from flask_login import current_user
+    if not current_user.is_authenticated:
+        return jsonify({"error": "login required"}), 401
+    if current_user.role != 'admin':
+        return jsonify({"error": "admin only"}), 403
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "JSON object body required"}), 400
+    parts = {}
+    for key in ('create', 'update', 'delete'):
+        parts[key] = payload.get(key) if payload.get(key) is not None else []
+        if not isinstance(parts[key], list):
+            return jsonify({"error": f"{key} must be a list"}), 400
+    total = sum(len(v) for v in parts.values())
+    if total > batch.MAX_BATCH_ITEMS:
+        return jsonify({"error": f"At most {batch.MAX_BATCH_ITEMS} items per batch"}), 413
+    results, error = batch.apply(parts['create'], parts['update'], parts['delete'],
+                                 atomic=bool(payload.get('atomic')))
+    if error:
+        return jsonify({"error": error, "results": results}), 409
+    return jsonify({"results": results}), 200
+
 @bp.route('/appointments/<int:id>', methods=['PUT', 'DELETE'])
 def appointment_detail(id):
     a = Appointment.query.get_or_404(id)
     if request.method == 'PUT':
         payload = request.get_json() or {}
         if 'status' in payload:
+            was = a.status
             a.status = payload['status']
+            if a.status == 'cancelled':
+                booking.release_slot(a)
+                if was != 'cancelled':
+                    notify.appointment_event('cancelled', a)
         db.session.commit()
         return jsonify({"msg":"updated"}), 200
     if request.method == 'DELETE':
-        db.session.delete(a)
+        booking.release_slot(a)
+        archive.soft_delete([a.id])
         db.session.commit()
         return jsonify({"msg":"deleted"}), 200
 
+def _cached_json(entry):
+    """JSON response for a (body, etag) cache entry; 304 when the browser's copy matches."""
+    body, etag = entry
+    resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    # always revalidate: the data changes on every booking
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
+
 @bp.route('/departments/<int:dept_id>/doctors', methods=['GET'])
 def dept_doctors(dept_id):
-    docs = Doctor.query.filter_by(department_id=dept_id).all()
-    out = []
-    for d in docs:
-        u = User.query.get(d.user_id)
-        out.append({"id": d.id, "username": u.username if u else None})
-    return jsonify(out), 200
+    return _cached_json(cache.department_doctors(dept_id))
 
 @bp.route('/doctors/<int:doc_id>/availability', methods=['GET'])
 def doctor_availability(doc_id):
-    avs = Availability.query.filter_by(doctor_id=doc_id, is_booked=False).all()
-    out = []
-    for a in avs:
-        out.append({"id": a.id, "date": str(a.date), "start_time": str(a.start_time) if a.start_time else None})
-    return jsonify(out), 200
+    return _cached_json(cache.doctor_slots(doc_id))
+
+@bp.route('/doctors/<int:doc_id>/calendar', methods=['GET'])
+def doctor_calendar_window(doc_id):
+    """The doctor's appointments and open slots between ?from= and ?to= (app/doctor_calendar.py)."""
+    from flask_login import current_user
+    # lists patients by name: the doctor themselves or an admin only
+    if not current_user.is_authenticated:
+        return jsonify({"error": "login required"}), 401
+    if current_user.role != 'admin' and current_user.doctor_id != doc_id:
+        return jsonify({"error": "not your calendar"}), 403
+    if db.session.get(Doctor, doc_id) is None:
+        return jsonify({"error": "doctor not found"}), 404
+    try:
+        date_from, date_to = doctor_calendar.parse_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    kinds = request.args.get('include', ','.join(doctor_calendar.KINDS)).split(',')
+    if not set(kinds) <= set(doctor_calendar.KINDS):
+        return jsonify({"error": f"include must list {' and/or '.join(doctor_calendar.KINDS)}"}), 400
+    return _cached_json(cache.json_entry(doctor_calendar.calendar(doc_id, date_from, date_to, kinds)))
+
+@bp.route('/slots/next', methods=['GET'])
+def next_slots():
+    """Earliest open slots across a department, a specialization or every doctor."""
+    args = request.args
+    try:
+        after = datetime.fromisoformat(args['after']) if args.get('after') else None
+    except ValueError:
+        return jsonify({"error": "Invalid after; use ISO YYYY-MM-DDTHH:MM"}), 400
+    if after is not None and after.tzinfo is not None:
+        # slot times are naive local time
+        after = after.astimezone().replace(tzinfo=None)
+    limit = args.get('limit', str(slot_search.DEFAULT_LIMIT))
+    if not limit.isdigit() or not 1 <= int(limit) <= slot_search.MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {slot_search.MAX_LIMIT}"}), 400
+    department_id = args.get('department_id')
+    if department_id is not None:
+        if not department_id.isdigit():
+            return jsonify({"error": "department_id must be an integer"}), 400
+        department_id = int(department_id)
+    return _cached_json(slot_search.next_open(after, int(limit), department_id, args.get('specialization')))
+
+def _history_access(patient_id):
+    """Error response unless the caller may read the patient's history: staff, or the patient themselves."""
+    from flask_login import current_user
+    if not current_user.is_authenticated:
+        return jsonify({"error": "login required"}), 401
+    if current_user.role not in ('admin', 'doctor') and current_user.patient_id != patient_id:
+        return jsonify({"error": "not your history"}), 403
+    if db.session.get(Patient, patient_id) is None:
+        return jsonify({"error": "patient not found"}), 404
+    return None
+
+@bp.route('/patients/<int:patient_id>/history', methods=['GET'])
+def patient_history(patient_id):
+    """One page of the patient's visits, newest first, summary columns only (app/history.py)."""
+    denied = _history_access(patient_id)
+    if denied:
+        return denied
+    limit = request.args.get('limit', str(history.PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= history.MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {history.MAX_PAGE_SIZE}"}), 400
+    try:
+        page = history.page(patient_id, request.args.get('after'), request.args.get('before'), int(limit))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [history.summary_row(h) for h in page.items],
+                    "next_cursor": page.next_cursor, "prev_cursor": page.prev_cursor}), 200
+
+@bp.route('/patients/<int:patient_id>/summary', methods=['GET'])
+def patient_summary(patient_id):
+    denied = _history_access(patient_id)
+    if denied:
+        return denied
+    return jsonify(history.summary(patient_id)), 200
+
+@bp.route('/history/<int:history_id>', methods=['GET'])
+def history_record(history_id):
+    """One full visit record, free-text fields included."""
+    from flask_login import current_user
+    if not current_user.is_authenticated:
+        return jsonify({"error": "login required"}), 401
+    h = db.session.get(PatientHistory, history_id)
+    if h is None:
+        return jsonify({"error": "record not found"}), 404
+    denied = _history_access(h.patient_id)
+    if denied:
+        return denied
+    return jsonify(history.full_row(h)), 200
@@ -1,6 +1,6 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
-from app.models import User, Patient, Doctor, Department
-from app import db
+from flask import Blueprint, render_template, redirect, url_for, request, flash, make_response
+from app.models import User, Patient, Doctor
+from app import db, search, cache, passwords
 from flask_login import login_user, logout_user, login_required, current_user
 
 bp = Blueprint('auth', __name__)
@@ -17,7 +17,7 @@ def register():
         return redirect(url_for('patient.dashboard'))
 
     # load departments for the form (used when registering doctor)
-    departments = Department.query.all()
+    departments = cache.departments()
 
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
@@ -59,11 +59,15 @@ def register():
         if role == 'patient':
             p = Patient(user_id=user.id)
             db.session.add(p)
+            search.index_patient(user)
             db.session.commit()
         elif role == 'doctor':
             # create doctor with department assignment if provided
             d = Doctor(user_id=user.id, department_id=int(dept_id) if dept_id else None)
             db.session.add(d)
+            db.session.flush()
+            search.index_doctor(d)
+            cache.invalidate_on_commit(('dept_doctors', d.department_id), ('version', 'doctors'))
             db.session.commit()
 
         flash("Registration successful. Please log in.")
@@ -79,9 +83,25 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username','').strip()
         password = request.form.get('password','').strip()
+        # throttle before the expensive hash check
+        wait = passwords.login_limits.check(username, request.remote_addr or '')
+        if wait:
+            resp = make_response(render_template(
+                'auth/login.html', error='Too many login attempts, please try again in a minute'), 429)
+            resp.headers['Retry-After'] = str(int(wait) + 1)
+            return resp
         user = User.query.filter_by(username=username).first()
-        if user is None or not user.check_password(password):
-            return render_template('auth/login.html', error='Invalid credentials')
+        try:
+            if user is None or not user.check_password(password):
+                return render_template('auth/login.html', error='Invalid credentials')
+            if passwords.rehash_if_needed(user, password):
+                db.session.commit()
+        except passwords.PoolBusy:
+            resp = make_response(render_template(
+                'auth/login.html', error='Login is busy right now, please try again'), 503)
+            resp.headers['Retry-After'] = '1'
+            return resp
+        passwords.login_limits.succeeded(username)
         login_user(user)
         if user.role == 'admin':
             return redirect(url_for('admin.dashboard'))
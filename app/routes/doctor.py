@@ -1,11 +1,14 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, abort
 from flask_login import current_user
 from datetime import datetime
-from app.models import Patient, Department, Doctor, Appointment, Availability, PatientHistory
-from app import db
+from app.models import Patient, Department, Appointment, Availability, PatientHistory
+from app import db, cache, schedule, intervals, doctor_calendar, history
 
 bp = Blueprint('doctor', __name__)
 
+# previous visits listed beside the completion form
+RECENT_VISITS = 5
+
 def doctor_required(fn):
     from functools import wraps
     @wraps(fn)
@@ -18,20 +21,22 @@ def doctor_required(fn):
 @bp.route('/')
 @doctor_required
 def dashboard():
-    # get doctor by logged-in user's id (user.id)
-    doc = Doctor.query.filter_by(user_id=current_user.id).first()
+    # doctor profile id comes with the cached login (cache.principal)
+    doc_id = current_user.doctor_id
+    # a rolling window around today; the page loads other periods from the calendar API
+    date_from, date_to = doctor_calendar.default_window()
     appts = []
-    if doc:
-        appts = Appointment.query.filter_by(doctor_id=doc.id).order_by(
-            Appointment.date.desc(), Appointment.start_time
-        ).all()
-    return render_template('doctor/dashboard.html', appointments=appts)
+    if doc_id:
+        # left unexecuted: the template's fragment cache only runs it on a miss
+        appts = doctor_calendar.appointments(doc_id, date_from, date_to, newest_first=True)
+    return render_template('doctor/dashboard.html', appointments=appts, doctor_id=doc_id,
+                           date_from=date_from, date_to=date_to)
 
 @bp.route('/availability', methods=['GET', 'POST'])
 @doctor_required
 def availability():
-    doc = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doc:
+    doc_id = current_user.doctor_id
+    if not doc_id:
         return abort(403)
 
     if request.method == 'POST':
@@ -46,38 +51,67 @@ def availability():
             errors.append('Start and end time required')
 
         if errors:
-            avails = Availability.query.filter_by(doctor_id=doc.id).all()
-            return render_template('doctor/availability.html', errors=errors, avails=avails)
+            return _availability_page(doc_id, errors)
 
         try:
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
             start_obj = datetime.strptime(start_str, "%H:%M").time()
             end_obj = datetime.strptime(end_str, "%H:%M").time()
         except ValueError:
-            avails = Availability.query.filter_by(doctor_id=doc.id).all()
-            return render_template(
-                'doctor/availability.html',
-                errors=["Invalid date or time format"],
-                avails=avails,
-            )
+            return _availability_page(doc_id, ["Invalid date or time format"])
+
+        if end_obj <= start_obj:
+            errors.append('End time must be after start time')
+        else:
+            clash = intervals.slot_conflict(doc_id, date_obj, start_obj, end_obj)
+            if clash:
+                errors.append(f'Overlaps your existing slot {intervals.describe(clash)}')
+        if errors:
+            return _availability_page(doc_id, errors)
 
         a = Availability(
-            doctor_id=doc.id,
+            doctor_id=doc_id,
             date=date_obj,
             start_time=start_obj,
             end_time=end_obj,
             is_booked=False,
         )
         db.session.add(a)
+        cache.invalidate_on_commit(('doctor_slots', doc_id))
         db.session.commit()
 
         flash('Availability saved')
         return redirect(url_for('doctor.availability'))
 
-    avails = Availability.query.filter_by(doctor_id=doc.id).order_by(
-        Availability.date, Availability.start_time
-    ).all()
-    return render_template('doctor/availability.html', avails=avails)
+    return _availability_page(doc_id)
+
+
+def _availability_page(doc_id, errors=None):
+    """The slots of the rolling window; the page loads other periods from the calendar API."""
+    date_from, date_to = doctor_calendar.default_window()
+    avails = doctor_calendar.slots(doc_id, date_from, date_to).all()
+    return render_template('doctor/availability.html', errors=errors, avails=avails,
+                           doctor_id=doc_id, date_from=date_from, date_to=date_to)
+
+
+@bp.route('/availability/recurring', methods=['POST'])
+@doctor_required
+def availability_recurring():
+    """Publish a weekly schedule in one go instead of one slot per POST."""
+    doc_id = current_user.doctor_id
+    if not doc_id:
+        return abort(403)
+
+    template, errors = schedule.parse_form(request.form)
+    if errors:
+        return _availability_page(doc_id, errors)
+
+    created, skipped = schedule.generate([doc_id], **template)
+    msg = f'{created} slots added'
+    if skipped:
+        msg += f', {skipped} skipped because they overlap existing availability'
+    flash(msg)
+    return redirect(url_for('doctor.availability'))
 
 
 @bp.route('/appointments/<int:appt_id>/complete', methods=['GET', 'POST'])
@@ -89,25 +123,21 @@ def complete_appointment(appt_id):
     Also shows previous history for this patient.
     """
     appt = Appointment.query.get_or_404(appt_id)
-    doc = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doc:
+    doc_id = current_user.doctor_id
+    if not doc_id:
         return abort(403)
 
     # ensure appointment belongs to this doctor
-    if appt.doctor_id != doc.id:
+    if appt.doctor_id != doc_id:
         return abort(403)
 
     patient = Patient.query.get(appt.patient_id)
 
-    # fetch previous history for this patient (most recent first)
-    histories = []
+    # latest visits (summary columns only) and the patient's summary
+    histories, summary = [], None
     if patient:
-        histories = (
-            PatientHistory.query
-            .filter_by(patient_id=patient.id)
-            .order_by(PatientHistory.visit_date.desc())
-            .all()
-        )
+        histories = history.recent(patient.id, RECENT_VISITS)
+        summary = history.summary(patient.id)
 
     if request.method == 'POST':
         visit_type   = request.form.get('visit_type', '').strip()
@@ -131,13 +161,14 @@ def complete_appointment(appt_id):
                 appt=appt,
                 patient=patient,
                 histories=histories,
+                summary=summary,
             )
 
         # create patient history entry — store each field in its own column
         try:
             ph = PatientHistory(
                 patient_id  = patient.id if patient else None,
-                doctor_id   = doc.id,
+                doctor_id   = doc_id,
                 visit_date  = appt.date if getattr(appt, 'date', None) else datetime.utcnow(),
                 visit_type  = visit_type,
                 diagnosis   = diagnosis,
@@ -148,6 +179,7 @@ def complete_appointment(appt_id):
             )
 
             db.session.add(ph)
+            history.record_visit(ph)
 
             # mark appointment completed
             appt.status = 'completed'
@@ -170,6 +202,7 @@ def complete_appointment(appt_id):
                 appt=appt,
                 patient=patient,
                 histories=histories,
+                summary=summary,
             )
 
     # GET: render form
@@ -178,6 +211,7 @@ def complete_appointment(appt_id):
         appt=appt,
         patient=patient,
         histories=histories,
+        summary=summary,
     )
 
 
@@ -186,14 +220,13 @@ def complete_appointment(appt_id):
 @doctor_required
 def patient_history(patient_id):
     patient = Patient.query.get_or_404(patient_id)
-    histories = (
-        PatientHistory.query
-        .filter_by(patient_id=patient.id)
-        .order_by(PatientHistory.visit_date.desc())
-        .all()
-    )
+    try:
+        page = history.page(patient.id, request.args.get('after'), request.args.get('before'))
+    except ValueError:
+        page = history.page(patient.id)
     return render_template(
         'doctor/patient_history.html',
         patient=patient,
-        histories=histories,
+        page=page,
+        summary=history.summary(patient.id),
     )
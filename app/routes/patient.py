@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import current_user
-from app.models import Patient, Department, Doctor, Appointment, Availability, PatientHistory
-from app import db
+from app.models import Patient, Doctor, Appointment, Availability
+from app import booking, cache, history as visits
 from datetime import datetime
 from flask import abort
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('patient', __name__)
 
@@ -19,17 +20,19 @@ def patient_required(fn):
 @bp.route('/')
 @patient_required
 def dashboard():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    patient_id = current_user.patient_id
     appts = []
-    if patient:
-        appts = Appointment.query.filter_by(patient_id=patient.id).all()
-    departments = Department.query.all()
+    if patient_id:
+        appts = (Appointment.query
+                 .options(joinedload(Appointment.doctor).joinedload(Doctor.user))
+                 .filter_by(patient_id=patient_id).all())
+    departments = cache.departments()
     return render_template('patient/dashboard.html', appointments=appts, departments=departments)
 
 @bp.route('/book', methods=['GET','POST'])
 @patient_required
 def book():
-    departments = Department.query.all()
+    departments = cache.departments()
     if request.method == 'POST':
         dept_id = request.form.get('department_id')
         doctor_id = request.form.get('doctor_id')
@@ -43,16 +46,11 @@ def book():
             errors.append('Availability slot required')
         if errors:
             return render_template('patient/book.html', errors=errors, departments=departments)
-        avail = Availability.query.get(int(avail_id))
-        if not avail or avail.is_booked:
-            errors.append('Selected slot no longer available')
+        # claim + insert happen in one transaction; a lost race comes back as an error
+        appt, error = booking.book_slot(current_user.patient_id, int(avail_id), department_id=int(dept_id))
+        if error:
+            errors.append(error)
             return render_template('patient/book.html', errors=errors, departments=departments)
-        patient = Patient.query.filter_by(user_id=current_user.id).first()
-        appt = Appointment(patient_id=patient.id, doctor_id=avail.doctor_id, department_id=int(dept_id),
-                           date=avail.date, start_time=avail.start_time, end_time=avail.end_time, status='scheduled')
-        avail.is_booked = True
-        db.session.add(appt)
-        db.session.commit()
         flash('Appointment booked')
         return redirect(url_for('patient.dashboard'))
     return render_template('patient/book.html', departments=departments)
@@ -61,21 +59,19 @@ def book():
 @patient_required
 def history():
     """
-    Show the logged-in patient's treatment / visit history.
-    Works even if PatientHistory fields vary across your model.
+    Show the logged-in patient's treatment / visit history, newest first,
+    a page at a time under a summary of the whole history.
     """
     patient = Patient.query.filter_by(user_id=current_user.id).first()
     if not patient:
         return redirect(url_for('auth.login'))
 
-    # Try to order by created_at if it exists, otherwise by id desc
-    # Use getattr checks to avoid attribute errors if model differs.
     try:
-        histories = PatientHistory.query.filter_by(patient_id=patient.id).order_by(PatientHistory.created_at.desc()).all()
-    except Exception:
-        histories = PatientHistory.query.filter_by(patient_id=patient.id).order_by(PatientHistory.id.desc()).all()
+        page = visits.page(patient.id, request.args.get('after'), request.args.get('before'))
+    except ValueError:
+        page = visits.page(patient.id)
 
-    return render_template('patient/history.html', histories=histories, patient=patient)
+    return render_template('patient/history.html', page=page, summary=visits.summary(patient.id), patient=patient)
 
 
 @bp.route('/appointments/<int:appt_id>/reschedule', methods=['GET','POST'])
@@ -84,17 +80,17 @@ def reschedule_appointment(appt_id):
     """
     Patient reschedules by selecting an available slot for a chosen doctor.
     """
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    if not patient:
+    patient_id = current_user.patient_id
+    if not patient_id:
         return abort(403)
 
     appt = Appointment.query.get_or_404(appt_id)
     # ensure this appointment belongs to the logged-in patient
-    if appt.patient_id != patient.id:
+    if appt.patient_id != patient_id:
         return abort(403)
 
-    departments = Department.query.all()
-    doctors = Doctor.query.all()
+    departments = cache.departments()
+    doctors = Doctor.query.options(joinedload(Doctor.user)).all()
 
     # If POST -> user submitted chosen availability_id
     if request.method == 'POST':
@@ -103,39 +99,12 @@ def reschedule_appointment(appt_id):
             flash('Please select an available slot.')
             return render_template('patient/reschedule.html', appt=appt, departments=departments, doctors=doctors, slots=[])
 
-        avail = Availability.query.get(int(avail_id))
-        if not avail or avail.is_booked:
-            flash('Selected slot is no longer available. Choose another.')
+        # claims the new slot and frees the one linked to this appointment
+        moved, error = booking.move_appointment(appt, int(avail_id))
+        if error:
+            flash(error + '. Choose another.')
             return render_template('patient/reschedule.html', appt=appt, departments=departments, doctors=doctors, slots=[])
 
-        # ensure we have doctor object for this availability
-        avail_doctor = Doctor.query.get(avail.doctor_id)
-        # Free previous availability if we can find it (match by doctor/date/start_time)
-        try:
-            prev_avail = Availability.query.filter_by(doctor_id=appt.doctor_id, date=appt.date, start_time=appt.start_time).first()
-            if prev_avail:
-                prev_avail.is_booked = False
-                db.session.add(prev_avail)
-        except Exception:
-            # ignore if previous slot not found
-            pass
-
-        # Book new availability
-        avail.is_booked = True
-
-        # update appointment fields using avail + avail_doctor
-        appt.doctor_id = avail.doctor_id
-        if avail_doctor:
-            appt.department_id = avail_doctor.department_id if hasattr(avail_doctor, 'department_id') else appt.department_id
-        appt.date = avail.date
-        appt.start_time = avail.start_time
-        appt.end_time = avail.end_time
-        appt.status = 'scheduled'
-
-        db.session.add(avail)
-        db.session.add(appt)
-        db.session.commit()
-
         flash('Appointment rescheduled to selected available slot.')
         return redirect(url_for('patient.dashboard'))
 
@@ -144,10 +113,10 @@ def reschedule_appointment(appt_id):
     selected_doc_id = request.args.get('doctor_id', type=int)
     slots = []
     if selected_doc_id:
-        slots = Availability.query.filter_by(doctor_id=selected_doc_id, is_booked=False).order_by(Availability.date, Availability.start_time).all()
-        # attach doctor object to each slot so template can use slot.doctor safely
-        for s in slots:
-            s.doctor = Doctor.query.get(s.doctor_id)
+        slots = (Availability.query
+                 .options(joinedload(Availability.doctor).joinedload(Doctor.user))
+                 .filter_by(doctor_id=selected_doc_id, is_booked=False)
+                 .order_by(Availability.date, Availability.start_time).all())
 
     return render_template('patient/reschedule.html',
                            appt=appt, doctors=doctors, departments=departments, slots=slots, selected_doc_id=selected_doc_id)
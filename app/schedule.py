@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, time
+
+from sqlalchemy import select
+from app import db, cache
+from app.intervals import DayIntervals
+from app.models import Availability
+
+# Recurring availability: a weekly template (days of week, working hours,
+# slot length, breaks, exception dates) expanded into Availability rows.
+#
+# Existing slots for all target doctors in the date range are read with one
+# query into per-day DayIntervals, candidates that overlap them are dropped
+# with a bisect per slot, and the rest go in with a single executemany INSERT
+# and one commit.
+
+MAX_DAYS = 366
+MIN_SLOT_MINUTES = 5
+MAX_SLOT_MINUTES = 240
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def _time(m):
+    return time(m // 60, m % 60)
+
+
+def expand(start_date, end_date, weekdays, day_start, day_end, slot_minutes,
+           breaks=(), exceptions=()):
+    """
+    Yield (date, start_time, end_time) for every slot the template describes.
+    weekdays uses date.weekday() numbering (Mon=0); breaks is a list of
+    (start_time, end_time) pairs no slot may overlap.
+    """
+    weekdays = set(weekdays)
+    exceptions = set(exceptions)
+    br = [(_minutes(a), _minutes(b)) for a, b in breaks]
+    day_slots = []
+    m, stop = _minutes(day_start), _minutes(day_end)
+    while m + slot_minutes <= stop:
+        end = m + slot_minutes
+        clash = next((b_end for b_start, b_end in br if m < b_end and end > b_start), None)
+        if clash is not None:
+            # jump to the end of the break and keep the slot grid from there
+            m = clash
+            continue
+        day_slots.append((_time(m), _time(end)))
+        m = end
+
+    d = start_date
+    while d <= end_date:
+        if d.weekday() in weekdays and d not in exceptions:
+            for s, e in day_slots:
+                yield d, s, e
+        d += timedelta(days=1)
+
+
+def parse_form(form):
+    """
+    Read a recurring-schedule form into keyword args for generate().
+    Returns (template, errors); template is None when there are errors.
+    """
+    errors = []
+    try:
+        start_date = datetime.strptime(form.get('start_date', ''), "%Y-%m-%d").date()
+        end_date = datetime.strptime(form.get('end_date', ''), "%Y-%m-%d").date()
+        day_start = datetime.strptime(form.get('day_start', ''), "%H:%M").time()
+        day_end = datetime.strptime(form.get('day_end', ''), "%H:%M").time()
+    except ValueError:
+        return None, ['Start/end date and working hours are required']
+
+    weekdays = [int(w) for w in form.getlist('weekdays') if w.isdigit() and 0 <= int(w) <= 6]
+    slot = form.get('slot_minutes', '').strip()
+    slot_minutes = int(slot) if slot.isdigit() else 0
+
+    breaks = []
+    for part in filter(None, (p.strip() for p in form.get('breaks', '').split(','))):
+        try:
+            a, b = part.split('-')
+            breaks.append((datetime.strptime(a.strip(), "%H:%M").time(),
+                           datetime.strptime(b.strip(), "%H:%M").time()))
+        except ValueError:
+            errors.append(f'Invalid break "{part}", use HH:MM-HH:MM')
+    exceptions = []
+    for part in filter(None, (p.strip() for p in form.get('exceptions', '').split(','))):
+        try:
+            exceptions.append(datetime.strptime(part, "%Y-%m-%d").date())
+        except ValueError:
+            errors.append(f'Invalid exception date "{part}", use YYYY-MM-DD')
+
+    if end_date < start_date:
+        errors.append('End date must be on or after start date')
+    elif (end_date - start_date).days >= MAX_DAYS:
+        errors.append(f'Schedule can cover at most {MAX_DAYS} days')
+    if day_end <= day_start:
+        errors.append('Working hours must end after they start')
+    if not weekdays:
+        errors.append('Choose at least one day of the week')
+    if not MIN_SLOT_MINUTES <= slot_minutes <= MAX_SLOT_MINUTES:
+        errors.append(f'Slot length must be {MIN_SLOT_MINUTES}-{MAX_SLOT_MINUTES} minutes')
+    if errors:
+        return None, errors
+    return dict(start_date=start_date, end_date=end_date, weekdays=weekdays,
+                day_start=day_start, day_end=day_end, slot_minutes=slot_minutes,
+                breaks=breaks, exceptions=exceptions), []
+
+
+def generate(doctor_ids, start_date, end_date, weekdays, day_start, day_end, slot_minutes,
+             breaks=(), exceptions=()):
+    """
+    Create the template's slots for every doctor in `doctor_ids`.
+    Returns (created, skipped) where skipped counts slots that overlapped
+    availability the doctor already had. Commits.
+    """
+    candidates = list(expand(start_date, end_date, weekdays, day_start, day_end,
+                             slot_minutes, breaks, exceptions))
+    if not candidates or not doctor_ids:
+        return 0, 0
+
+    # one range query for everything already published in the window
+    existing = defaultdict(list)
+    rows = db.session.execute(
+        select(Availability.doctor_id, Availability.date, Availability.start_time, Availability.end_time)
+        .where(Availability.doctor_id.in_(doctor_ids),
+               Availability.date >= start_date, Availability.date <= end_date)
+    )
+    for doc_id, d, s, e in rows:
+        if s is not None and e is not None:
+            existing[(doc_id, d)].append((s, e))
+    taken = {key: DayIntervals(intervals) for key, intervals in existing.items()}
+
+    kept = []
+    skipped = 0
+    for doc_id in doctor_ids:
+        for c in candidates:
+            day = taken.get((doc_id, c[0]))
+            if day and day.overlaps(c[1], c[2]):
+                skipped += 1
+                continue
+            kept.append((doc_id, c))
+
+    if kept:
+        _bulk_insert(kept)
+    cache.invalidate_on_commit(*[('doctor_slots', doc_id) for doc_id in doctor_ids])
+    db.session.commit()
+    return len(kept), skipped
+
+
+def _bulk_insert(kept):
+    conn = db.session.connection()
+    table = Availability.__table__
+    if conn.dialect.name != 'sqlite':
+        conn.execute(table.insert(), [{'doctor_id': doc_id, 'date': d, 'start_time': s, 'end_time': e,
+                                       'is_booked': False} for doc_id, (d, s, e) in kept])
+        return
+    # SQLite: convert each distinct (date, start, end) once with the column types'
+    # own bind processors and pass plain tuples to the driver; SQLAlchemy's
+    # per-row parameter handling is most of the cost at this volume
+    to_date = table.c.date.type.dialect_impl(conn.dialect).bind_processor(conn.dialect)
+    to_time = table.c.start_time.type.dialect_impl(conn.dialect).bind_processor(conn.dialect)
+    converted = {}
+    rows = []
+    for doc_id, c in kept:
+        v = converted.get(c)
+        if v is None:
+            v = converted[c] = (to_date(c[0]), to_time(c[1]), to_time(c[2]))
+        rows.append((doc_id, v[0], v[1], v[2], 0))
+    conn.exec_driver_sql(
+        "INSERT INTO availability (doctor_id, date, start_time, end_time, is_booked) VALUES (?, ?, ?, ?, ?)",
+        rows)
@@ -0,0 +1,183 @@
+from sqlalchemy import text
+from app import db
+
+# Full-text index used by the admin dashboard search box.
+# One row per searchable entity; `kind` is 'doctor', 'patient' or 'department'
+# and `ref_id` is Doctor.id / User.id / Department.id respectively.
+# The trigram tokenizer gives substring matching ("card" finds "Cardiology")
+# which is what the old in-template `q in name` filter did.
+# kind and ref_id are UNINDEXED, so filtering on them scans the whole table;
+# each row's rowid is derived from them instead (_rowid) and updates and
+# deletes go straight to the row.
+# On other database backends there is no index and search() falls back to
+# plain LIKE queries against the source tables.
+INDEX_TABLE = 'search_index'
+KIND_CODES = {'patient': 1, 'doctor': 2, 'department': 3}
+_KIND_SLOTS = 4
+_ROWID_SQL = ("ref_id * %d + CASE kind WHEN 'patient' THEN 1 WHEN 'doctor' THEN 2 WHEN 'department' THEN 3 END"
+              % _KIND_SLOTS)
+
+
+def _enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _rowid(kind, ref_id):
+    return int(ref_id) * _KIND_SLOTS + KIND_CODES[kind]
+
+
+def init_index():
+    """Create the FTS table if missing and fill it on first run."""
+    if not _enabled():
+        return
+    exists = db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:n"),
+        {'n': INDEX_TABLE}
+    ).first()
+    if exists:
+        # indexes built before rows were keyed by (kind, ref_id)
+        stale = db.session.execute(
+            text(f"SELECT 1 FROM {INDEX_TABLE} WHERE rowid != {_ROWID_SQL} LIMIT 1")).first()
+        if stale:
+            rebuild()
+        return
+    try:
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, username, email, specialization, department, "
+            "tokenize='trigram')"
+        ))
+    except Exception:
+        # older SQLite without the trigram tokenizer -> word based matching
+        db.session.rollback()
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, username, email, specialization, department)"
+        ))
+    rebuild()
+
+
+def rebuild():
+    """Re-populate the whole index from the source tables."""
+    db.session.execute(text(f"DELETE FROM {INDEX_TABLE}"))
+    db.session.execute(text(
+        f"INSERT INTO {INDEX_TABLE} (rowid, kind, ref_id, username, email, specialization, department) "
+        f"SELECT u.id * {_KIND_SLOTS} + 1, 'patient', u.id, u.username, u.email, '', '' "
+        "FROM user u WHERE u.role = 'patient'"
+    ))
+    db.session.execute(text(
+        f"INSERT INTO {INDEX_TABLE} (rowid, kind, ref_id, username, email, specialization, department) "
+        f"SELECT d.id * {_KIND_SLOTS} + 2, 'doctor', d.id, COALESCE(u.username, ''), COALESCE(u.email, ''), "
+        "COALESCE(d.specialization, ''), COALESCE(dep.name, '') "
+        "FROM doctor d LEFT JOIN user u ON u.id = d.user_id "
+        "LEFT JOIN department dep ON dep.id = d.department_id"
+    ))
+    db.session.execute(text(
+        f"INSERT INTO {INDEX_TABLE} (rowid, kind, ref_id, username, email, specialization, department) "
+        f"SELECT id * {_KIND_SLOTS} + 3, 'department', id, '', '', '', name FROM department"
+    ))
+    db.session.commit()
+
+
+def _put(kind, ref_id, username='', email='', specialization='', department=''):
+    if not _enabled():
+        return
+    remove(kind, ref_id)
+    db.session.execute(
+        text(f"INSERT INTO {INDEX_TABLE} (rowid, kind, ref_id, username, email, specialization, department) "
+             "VALUES (:rowid, :kind, :ref_id, :username, :email, :spec, :dept)"),
+        {'rowid': _rowid(kind, ref_id), 'kind': kind, 'ref_id': ref_id, 'username': username or '',
+         'email': email or '', 'spec': specialization or '', 'dept': department or ''}
+    )
+
+
+def put_many(kind, rows):
+    """Index many new entities at once; rows are dicts with ref_id and any of the text columns."""
+    if not _enabled() or not rows:
+        return
+    db.session.execute(
+        text(f"INSERT INTO {INDEX_TABLE} (rowid, kind, ref_id, username, email, specialization, department) "
+             "VALUES (:rowid, :kind, :ref_id, :username, :email, :spec, :dept)"),
+        [{'rowid': _rowid(kind, r['ref_id']), 'kind': kind, 'ref_id': r['ref_id'],
+          'username': r.get('username') or '', 'email': r.get('email') or '',
+          'spec': r.get('specialization') or '', 'dept': r.get('department') or ''} for r in rows]
+    )
+
+
+def remove(kind, ref_id):
+    if not _enabled():
+        return
+    db.session.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"), {'rowid': _rowid(kind, ref_id)})
+
+
+# The index_* helpers only stage the change on the current session;
+# callers commit together with the row they changed.
+def index_patient(user):
+    _put('patient', user.id, user.username, user.email)
+
+
+def index_doctor(doctor):
+    from app.models import User, Department
+    user = db.session.get(User, doctor.user_id) if doctor.user_id else None
+    dept = db.session.get(Department, doctor.department_id) if doctor.department_id else None
+    _put('doctor', doctor.id,
+         user.username if user else '',
+         user.email if user else '',
+         doctor.specialization,
+         dept.name if dept else '')
+
+
+def index_department(dept):
+    _put('department', dept.id, department=dept.name)
+
+
+def search(q, kind, page=1, per_page=20):
+    """
+    Ranked search for one kind of entity.
+    Returns (ids, has_next) where ids are ordered best match first.
+    """
+    q = (q or '').strip()
+    page = max(page, 1)
+    if not _enabled():
+        return _search_like(q, kind, page, per_page)
+    params = {'kind': kind, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if len(q) >= 3:
+        # quote as a phrase so user input can't inject FTS query syntax
+        params['q'] = '"' + q.replace('"', '""') + '"'
+        sql = (f"SELECT ref_id FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :q AND kind = :kind "
+               "ORDER BY rank LIMIT :limit OFFSET :offset")
+    else:
+        # trigram MATCH needs 3+ chars; short terms fall back to LIKE on the same table
+        params['q'] = '%' + q + '%'
+        sql = (f"SELECT ref_id FROM {INDEX_TABLE} WHERE kind = :kind AND "
+               "(username LIKE :q OR email LIKE :q OR specialization LIKE :q OR department LIKE :q) "
+               "ORDER BY ref_id LIMIT :limit OFFSET :offset")
+    ids = [int(r[0]) for r in db.session.execute(text(sql), params)]
+    return ids[:per_page], len(ids) > per_page
+
+
+def _search_like(q, kind, page, per_page):
+    from app.models import User, Doctor, Department
+    pattern = '%' + q + '%'
+    if kind == 'patient':
+        query = (db.session.query(User.id).filter(User.role == 'patient')
+                 .filter(User.username.ilike(pattern) | User.email.ilike(pattern)).order_by(User.id))
+    elif kind == 'doctor':
+        query = (db.session.query(Doctor.id)
+                 .outerjoin(User, User.id == Doctor.user_id)
+                 .outerjoin(Department, Department.id == Doctor.department_id)
+                 .filter(User.username.ilike(pattern) | User.email.ilike(pattern)
+                         | Doctor.specialization.ilike(pattern) | Department.name.ilike(pattern))
+                 .order_by(Doctor.id))
+    else:
+        query = db.session.query(Department.id).filter(Department.name.ilike(pattern)).order_by(Department.id)
+    ids = [r[0] for r in query.offset((page - 1) * per_page).limit(per_page + 1)]
+    return ids[:per_page], len(ids) > per_page
+
+
+def load_ordered(model, ids, *options):
+    """Fetch rows for `ids` in one query, keeping the given order."""
+    if not ids:
+        return []
+    rows = {r.id: r for r in model.query.options(*options).filter(model.id.in_(ids)).all()}
+    return [rows[i] for i in ids if i in rows]
@@ -0,0 +1,89 @@
+import heapq
+from datetime import datetime
+from itertools import groupby, islice
+
+from sqlalchemy import select, tuple_, func, bindparam, Date, Time
+from sqlalchemy.orm import aliased
+
+from app import db, cache
+from app.models import Availability, Doctor, User
+
+# "Next available slot": the earliest open slots from a given time on,
+# across a department, a specialization or the whole hospital, so a patient
+# can book from one list instead of walking department -> doctor -> slots.
+#
+# With a department or specialization filter, one statement walks the
+# matching doctors and takes each one's first `limit` open slots with a
+# correlated LIMIT subquery -- a short range scan of ix_availability_open
+# (doctor_id, is_booked, date, start_time) -- and a heap merges those k
+# sorted runs. Without a filter one ordered scan of
+# ix_availability_open_time (is_booked, date, start_time) stops after
+# `limit` rows. Doctor names come back in the same round trip.
+#
+# Results are cached for SLOT_SEARCH_CACHE_SECONDS per filter, minute and
+# limit (cache.slot_search_cache).
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+SLOT_COLUMNS = (Availability.id, Availability.doctor_id, Availability.date,
+                Availability.start_time, Availability.end_time)
+DOCTOR_COLUMNS = (User.username, Doctor.department_id, Doctor.specialization)
+# (date, start_time) of the search start, bound at execution so the
+# statements compile once
+FROM_KEY = tuple_(bindparam('from_date', type_=Date), bindparam('from_time', type_=Time))
+
+
+def _filtered(department_id, specialization):
+    """Earliest `limit` open slots of every matching doctor, one sorted run per doctor."""
+    first = aliased(Availability)
+    firsts = (select(first.id)
+              .where(first.doctor_id == Doctor.id, first.is_booked.is_(False),
+                     tuple_(first.date, first.start_time) >= FROM_KEY)
+              .order_by(first.date, first.start_time, first.id)
+              .limit(bindparam('limit')))
+    q = (select(*SLOT_COLUMNS, *DOCTOR_COLUMNS)
+         .select_from(Doctor)
+         .join(Availability, Availability.id.in_(firsts))
+         .outerjoin(User, User.id == Doctor.user_id)
+         .order_by(Availability.doctor_id, Availability.date, Availability.start_time, Availability.id))
+    if department_id is not None:
+        q = q.where(Doctor.department_id == department_id)
+    if specialization:
+        q = q.where(func.lower(Doctor.specialization) == specialization)
+    return q
+
+
+def _search(department_id, specialization, after, limit):
+    params = {'from_date': after.date(), 'from_time': after.time(), 'limit': limit}
+    if department_id is not None or specialization:
+        runs = [list(run) for _, run in groupby(
+            db.session.execute(_filtered(department_id, specialization), params), key=lambda r: r.doctor_id)]
+        rows = list(islice(heapq.merge(*runs, key=lambda r: (r.date, r.start_time, r.id)), limit))
+    else:
+        rows = db.session.execute(
+            select(*SLOT_COLUMNS, *DOCTOR_COLUMNS)
+            .outerjoin(Doctor, Doctor.id == Availability.doctor_id)
+            .outerjoin(User, User.id == Doctor.user_id)
+            .where(Availability.is_booked.is_(False),
+                   tuple_(Availability.date, Availability.start_time) >= FROM_KEY)
+            .order_by(Availability.date, Availability.start_time, Availability.id)
+            .limit(bindparam('limit')), params).all()
+    return [{'id': r.id, 'doctor_id': r.doctor_id, 'doctor': r.username,
+             'department_id': r.department_id, 'specialization': r.specialization,
+             'date': r.date.isoformat(), 'start_time': r.start_time.strftime('%H:%M'),
+             'end_time': r.end_time.strftime('%H:%M') if r.end_time else None}
+            for r in rows]
+
+
+def next_open(after=None, limit=DEFAULT_LIMIT, department_id=None, specialization=None):
+    """
+    (body, etag) JSON cache entry listing the earliest `limit` open slots
+    starting at or after `after` (never before now).
+    """
+    now = datetime.now()
+    after = max(after or now, now).replace(second=0, microsecond=0)
+    spec = (specialization or '').strip().lower()
+    key = ('next_slots', department_id, spec, after, limit)
+    return cache.slot_search_cache.get_or_set(
+        key, lambda: cache.json_entry(_search(department_id, spec, after, limit)))
@@ -0,0 +1,69 @@
+"""
+Admin list pages at different table sizes.
+
+    python -m bench.bench_admin_lists --appointments 10000 100000 1000000
+
+For each size: first page and a page deep into the table (keyset cursor near
+the end) of /admin/appointments, a doctor's appointment list, the dashboard
+sorted by username, the edit form and the typeahead lookup. With keyset
+queries every number should stay roughly flat as the table grows.
+"""
+import argparse
+import json
+import os
+from urllib.parse import quote
+
+from bench.common import scratch_app, login_as, time_get
+from bench.datagen import seed
+
+
+def run(size, repeat):
+    app, db_path = scratch_app()
+    info = seed(db_path, appointments=size, slots=1000, histories=1000,
+                patients=max(1000, size // 50))
+    client = app.test_client()
+    login_as(client, 1)  # seeded admin
+    with app.app_context():
+        from app import pagination, search
+        search.rebuild()  # seed() writes the tables directly
+        from app.models import Appointment, Doctor
+        doc = Doctor.query.filter_by(user_id=info['doctor_user_ids'][0]).first()
+        # the row 50 from the end in the default (date desc, id desc) order
+        deep = (Appointment.query.order_by(Appointment.date, Appointment.id)
+                .offset(50).limit(1).first())
+        cursor = pagination.encode_cursor((deep.date, deep.id))
+        appt_id = deep.id
+    routes = {
+        'GET /admin/appointments': time_get(client, '/admin/appointments', repeat),
+        'GET /admin/appointments (deep page)': time_get(
+            client, '/admin/appointments?after=' + quote(cursor), repeat),
+        'GET /admin/doctors/<id>/appointments': time_get(
+            client, f'/admin/doctors/{doc.id}/appointments', repeat),
+        'GET /admin/?sort=username': time_get(client, '/admin/?sort=username', repeat),
+        'GET /admin/appointments/<id>/edit': time_get(client, f'/admin/appointments/{appt_id}/edit', repeat),
+        'GET /admin/lookup/patient': time_get(client, '/admin/lookup/patient?q=patient12', repeat),
+    }
+    assert client.get('/admin/lookup/patient?q=patient12').get_json()
+    with app.app_context():
+        from app import db
+        db.engine.dispose()
+    os.remove(db_path)
+    return routes
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--appointments', type=int, nargs='+', default=[10000, 100000, 1000000])
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--out', help='write results as JSON')
+    args = ap.parse_args()
+
+    result = {str(n): run(n, args.repeat) for n in args.appointments}
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Analytics rollups: report latency over a year of data, refresh cost, and
+what the change-tracking triggers add to bookings.
+
+    python -m bench.bench_analytics --doctors 200 --appointments 1000000 --slots 200000
+
+Seeds a year of appointments and slots (the triggers queue every doctor-day),
+times the first full refresh, then times /admin/analytics/data for a whole
+year grouped by department, doctor and day -- against the same aggregate run
+straight over the appointment and availability tables for comparison.
+Finally books --bookings slots through POST /api/appointments with and
+without the triggers, and times the incremental refresh that follows.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import timedelta
+
+from bench.common import scratch_app, login_as, percentiles, time_get
+from bench.datagen import seed, START_DATE
+
+# what a report without rollups has to do: scan both base tables for the range
+DIRECT_QUERY = """
+SELECT d.department_id, COUNT(*), SUM(a.status = 'cancelled'), SUM(a.status = 'completed')
+FROM appointment a JOIN doctor d ON d.id = a.doctor_id
+WHERE a.date BETWEEN :f AND :t GROUP BY d.department_id
+"""
+DIRECT_SLOTS = """
+SELECT d.department_id, SUM(NOT av.is_booked), SUM(av.is_booked)
+FROM availability av JOIN doctor d ON d.id = av.doctor_id
+WHERE av.date BETWEEN :f AND :t GROUP BY d.department_id
+"""
+
+
+def _book(client, slots, patients, rnd):
+    samples = []
+    for slot in slots:
+        t0 = time.perf_counter()
+        r = client.post('/api/appointments', json={'patient_id': rnd.choice(patients), 'availability_id': slot})
+        samples.append(time.perf_counter() - t0)
+        assert r.status_code == 201, r.get_json()
+    return percentiles(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--doctors', type=int, default=200)
+    ap.add_argument('--appointments', type=int, default=1000000)
+    ap.add_argument('--slots', type=int, default=200000)
+    ap.add_argument('--bookings', type=int, default=1000)
+    ap.add_argument('--repeat', type=int, default=20)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_ENABLED=False)
+    t0 = time.perf_counter()
+    info = seed(db_path, doctors=args.doctors, patients=20000, appointments=args.appointments,
+                slots=args.slots, histories=0, days=365)
+    result = {'doctors': args.doctors, 'appointments': args.appointments, 'slots': args.slots,
+              'days': info['days'], 'seed_seconds': round(time.perf_counter() - t0, 1)}
+    rnd = random.Random(1)
+    with app.app_context():
+        from app import db, analytics
+        from app.models import Availability, Patient, DailyStats
+        result['dirty_doctor_days'] = analytics.pending()
+        t0 = time.perf_counter()
+        while analytics.refresh(app.config['ANALYTICS_REFRESH_BATCH']):
+            pass
+        seconds = time.perf_counter() - t0
+        result['full_refresh'] = {'seconds': round(seconds, 1),
+                                  'doctor_days_per_sec': round(result['dirty_doctor_days'] / seconds),
+                                  'rollup_rows': DailyStats.query.count()}
+        date_from, date_to = START_DATE, START_DATE + timedelta(days=364)
+        direct = []
+        for _ in range(max(3, args.repeat // 4)):
+            t0 = time.perf_counter()
+            db.session.execute(db.text(DIRECT_QUERY), {'f': date_from, 't': date_to}).all()
+            db.session.execute(db.text(DIRECT_SLOTS), {'f': date_from, 't': date_to}).all()
+            direct.append(time.perf_counter() - t0)
+        result['year_by_department_base_tables'] = percentiles(direct)
+        free = [i for (i,) in db.session.query(Availability.id).filter(Availability.is_booked.is_(False))]
+        patients = [i for (i,) in db.session.query(Patient.id)]
+        db.session.commit()
+
+    admin = app.test_client()
+    login_as(admin, 1)
+    span = f'from={date_from.isoformat()}&to={date_to.isoformat()}'
+    for group in ('department', 'doctor', 'day'):
+        result[f'year_by_{group}_rollups'] = time_get(admin, f'/admin/analytics/data?{span}&group={group}',
+                                                      args.repeat)
+    result['dashboard_page'] = time_get(admin, f'/admin/analytics?{span}', args.repeat)
+
+    rnd.shuffle(free)
+    client = app.test_client()
+    result['booking_with_triggers'] = _book(client, free[:args.bookings], patients, rnd)
+    with app.app_context():
+        t0 = time.perf_counter()
+        n = analytics.refresh()
+        result['incremental_refresh'] = {'doctor_days': n, 'ms': round((time.perf_counter() - t0) * 1000, 1)}
+        for name in analytics.TRIGGERS:
+            db.session.execute(db.text(f'DROP TRIGGER {name}'))
+        db.session.commit()
+    result['booking_without_triggers'] = _book(client, free[args.bookings:2 * args.bookings], patients, rnd)
+
+    with app.app_context():
+        db.engine.dispose()
+    os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Hot-path queries before and after archiving old appointments and slots.
+
+    python -m bench.bench_archive --appointments 6000000 --slots 1000000 --archive-share 0.85
+
+Seeds --appointments appointments and --slots slots spread over --days days
+from bench.datagen.START_DATE (with enough doctors to hold them all), then
+sets ARCHIVE_AFTER_DAYS so that the first --archive-share of those days falls
+behind the horizon (with the arguments above, about 5M appointments). Times the hot pages and APIs, runs the
+archive pass (`flask archive`), catches the analytics rollups up, and times
+them again. The pass rate and the rollup refresh after it are reported too.
+Admin lists and /api/appointments read live and archived rows together, so
+their numbers show the cost of the union; the rest read the hot tables only.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from urllib.parse import quote
+
+from bench.common import scratch_app, login_as, percentiles, time_get
+from bench.datagen import seed, START_DATE, SLOT_TIMES
+
+
+def _raw(app, queries, repeat):
+    from app import db
+    from sqlalchemy import text
+    out = {}
+    with app.app_context():
+        for name, (sql, params) in queries.items():
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                db.session.execute(text(sql), params).all()
+                samples.append(time.perf_counter() - t0)
+            out[name] = percentiles(samples)
+        db.session.rollback()
+    return out
+
+
+def _measure(app, fx, repeat):
+    admin, doctor, patient = app.test_client(), app.test_client(), app.test_client()
+    login_as(admin, 1)
+    login_as(doctor, fx['doctor_user'])
+    login_as(patient, fx['patient_user'])
+    today = date.today().isoformat()
+    result = {
+        'GET /patient/': time_get(patient, '/patient/', repeat),
+        'GET /doctor/': time_get(doctor, '/doctor/', repeat),
+        'GET /doctor/availability': time_get(doctor, '/doctor/availability', repeat),
+        'GET /api/slots/next': time_get(patient, '/api/slots/next?limit=20', repeat),
+        'GET /api/doctors/<id>/availability': time_get(patient, f"/api/doctors/{fx['doctor_id']}/availability",
+                                                       repeat),
+        'GET /admin/appointments': time_get(admin, '/admin/appointments', repeat),
+        'GET /admin/appointments (deep page)': time_get(admin, '/admin/appointments?after=' + quote(fx['cursor']),
+                                                        repeat),
+        'GET /admin/doctors/<id>/appointments': time_get(admin, f"/admin/doctors/{fx['doctor_id']}/appointments",
+                                                         repeat),
+        'GET /api/appointments?date_from=today': time_get(admin, f'/api/appointments?date_from={today}&limit=50',
+                                                          repeat),
+    }
+    result.update(_raw(app, {
+        'patient appointments': ("SELECT * FROM appointment WHERE patient_id = :p", {'p': fx['patient_id']}),
+        'doctor open slots': ("SELECT * FROM availability WHERE doctor_id = :d AND is_booked = 0",
+                              {'d': fx['doctor_id']}),
+        'scheduled appointments (status scan)': ("SELECT COUNT(*) FROM appointment WHERE status = 'scheduled'", {}),
+    }, repeat))
+    return result
+
+
+def _sizes(app):
+    from app import db
+    from sqlalchemy import text
+    with app.app_context():
+        return {t: db.session.execute(text(f"SELECT COUNT(*) FROM {t}")).scalar()
+                for t in ('appointment', 'appointment_archive', 'availability', 'availability_archive')}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--appointments', type=int, default=1000000)
+    ap.add_argument('--slots', type=int, default=500000)
+    ap.add_argument('--days', type=int, default=1000, help='must end before today')
+    ap.add_argument('--archive-share', type=float, default=0.85,
+                    help='share of the seeded days that falls behind the archive horizon')
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--out', help='write results as JSON')
+    args = ap.parse_args()
+
+    horizon = START_DATE + timedelta(days=int(args.days * args.archive_share))
+    if horizon >= date.today():
+        ap.error('the archive horizon must be in the past: lower --days or --archive-share')
+    # datagen keeps the calendar at most 80% full and adds days rather than doctors
+    doctors = max(200, -(-(args.appointments + args.slots) * 5 // (4 * len(SLOT_TIMES) * args.days)))
+    app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_ENABLED=False, FRAGMENT_CACHE_SECONDS=0,
+                               ARCHIVE_AFTER_DAYS=(date.today() - horizon).days, ARCHIVE_BATCH_SIZE=20000)
+    info = seed(db_path, doctors=doctors, patients=max(1000, args.appointments // 50),
+                appointments=args.appointments, slots=args.slots, histories=0, days=args.days)
+    rnd = random.Random(1)
+    with app.app_context():
+        from app import db, analytics, pagination
+        from app.models import Appointment, Doctor, Patient
+        doctor = db.session.get(Doctor, 1)
+        patient = Patient.query.filter_by(user_id=rnd.choice(info['patient_user_ids'])).first()
+        # 50 rows from the end of the default (date desc, id desc) order: an old page
+        deep = Appointment.query.order_by(Appointment.date, Appointment.id).offset(50).limit(1).first()
+        fx = {'doctor_id': doctor.id, 'doctor_user': doctor.user_id, 'patient_id': patient.id,
+              'patient_user': patient.user_id, 'cursor': pagination.encode_cursor((deep.date, deep.id))}
+        while analytics.refresh(50000):
+            pass
+        db.engine.dispose()
+
+    result = {'horizon': horizon.isoformat(), 'doctors': doctors,
+              'before': {'rows': _sizes(app), 'timings': _measure(app, fx, args.repeat)}}
+
+    with app.app_context():
+        from app import archive, analytics
+        t0 = time.perf_counter()
+        appointments, slots = archive.run()
+        archive_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        keys = 0
+        while True:
+            n = analytics.refresh(50000)
+            if not n:
+                break
+            keys += n
+        result['archive_pass'] = {'appointments': appointments, 'slots': slots, 'seconds': round(archive_s, 1),
+                                  'rows_per_second': round((appointments + slots) / archive_s),
+                                  'rollup_refresh_seconds': round(time.perf_counter() - t0, 1),
+                                  'rollup_doctor_days': keys}
+        from app import db
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        db.engine.dispose()
+
+    result['after'] = {'rows': _sizes(app), 'timings': _measure(app, fx, args.repeat)}
+    os.remove(db_path)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Nightly-sync shape: N single API calls versus one batch call.
+
+    python -m bench.bench_batch --items 10000
+
+Books N free slots through POST /api/appointments one at a time, then N other
+slots through POST /api/appointments/batch (batch.MAX_BATCH_ITEMS per call);
+then cancels the first set with N PUTs versus batches of status updates.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from bench.common import scratch_app, login_as
+from bench.datagen import seed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--items', type=int, default=1000)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app(METRICS_ENABLED=False)
+    seed(db_path, doctors=50, patients=5000, appointments=50000, slots=args.items * 5, histories=0)
+    with app.app_context():
+        from app import db
+        from app.models import Availability, Patient
+        free = [i for (i,) in db.session.query(Availability.id).filter(Availability.is_booked.is_(False))]
+        patients = [i for (i,) in db.session.query(Patient.id)]
+        db.engine.dispose()
+    rnd = random.Random(1)
+    rnd.shuffle(free)
+    single_slots, batch_slots = free[:args.items], free[args.items:2 * args.items]
+    assert len(batch_slots) == args.items, 'not enough free slots'
+    client = app.test_client()
+    login_as(client, 1)
+    from app.batch import MAX_BATCH_ITEMS
+
+    def in_batches(key, items):
+        results = []
+        for i in range(0, len(items), MAX_BATCH_ITEMS):
+            r = client.post('/api/appointments/batch', json={key: items[i:i + MAX_BATCH_ITEMS]})
+            assert r.status_code == 200, r.status_code
+            results += r.get_json()['results'][key]
+        return results
+
+    t0 = time.perf_counter()
+    single_ids = []
+    for slot in single_slots:
+        r = client.post('/api/appointments', json={'patient_id': rnd.choice(patients), 'availability_id': slot})
+        assert r.status_code == 201, r.get_json()
+        single_ids.append(r.get_json()['id'])
+    single_create = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    created = in_batches('create', [{'patient_id': rnd.choice(patients), 'availability_id': slot}
+                                    for slot in batch_slots])
+    batch_create = time.perf_counter() - t0
+    assert all(x['ok'] for x in created)
+
+    t0 = time.perf_counter()
+    for appt_id in single_ids:
+        assert client.put(f'/api/appointments/{appt_id}', json={'status': 'cancelled'}).status_code == 200
+    single_cancel = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    in_batches('update', [{'id': x['id'], 'status': 'cancelled'} for x in created])
+    batch_cancel = time.perf_counter() - t0
+
+    os.remove(db_path)
+    print(json.dumps({
+        'items': args.items,
+        'create': {'single_calls_seconds': round(single_create, 2), 'batch_seconds': round(batch_create, 2),
+                   'speedup': round(single_create / batch_create, 1)},
+        'cancel': {'single_calls_seconds': round(single_cancel, 2), 'batch_seconds': round(batch_cancel, 2),
+                   'speedup': round(single_cancel / batch_cancel, 1)},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
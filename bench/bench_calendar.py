@@ -0,0 +1,97 @@
+"""
+Doctor calendar: page and API cost against the length of a doctor's history.
+
+    python -m bench.bench_calendar --years 1,5,10
+
+For each history length, seeds one doctor with 16 slots a day from that many
+years back to --ahead days ahead, half of them booked. Then times the doctor
+dashboard and availability page (fragment cache off) and
+/api/doctors/<id>/calendar for the default window, next to the two
+whole-history queries those pages used to run. The windowed numbers should
+stay flat as the history grows.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from bench.common import scratch_app, login_as, percentiles, time_get
+from bench.datagen import seed
+
+
+def _history(app, years, ahead, rnd):
+    from app import db
+    from app.models import Appointment, Availability, Doctor, Patient
+    with app.app_context():
+        doctor = db.session.get(Doctor, 1)
+        patients = [i for (i,) in db.session.query(Patient.id)]
+        start = date.today() - timedelta(days=365 * years)
+        days = (date.today() + timedelta(days=ahead) - start).days
+        slots = [{'doctor_id': doctor.id, 'date': start + timedelta(days=d), 'is_booked': i % 2 == 0,
+                  'start_time': (datetime(2000, 1, 1, 9) + timedelta(minutes=30 * i)).time(),
+                  'end_time': (datetime(2000, 1, 1, 9, 30) + timedelta(minutes=30 * i)).time()}
+                 for d in range(days) for i in range(16)]
+        ids = []
+        for i in range(0, len(slots), 20000):
+            ids += db.session.execute(db.insert(Availability).returning(Availability.id, sort_by_parameter_order=True),
+                                      slots[i:i + 20000]).scalars().all()
+        appts = [{'doctor_id': doctor.id, 'department_id': doctor.department_id, 'patient_id': rnd.choice(patients),
+                  'date': s['date'], 'start_time': s['start_time'], 'end_time': s['end_time'],
+                  'status': 'scheduled' if s['date'] >= date.today() else rnd.choice(('completed', 'cancelled')),
+                  'availability_id': slot_id}
+                 for s, slot_id in zip(slots, ids) if s['is_booked']]
+        for i in range(0, len(appts), 20000):
+            db.session.execute(db.insert(Appointment), appts[i:i + 20000])
+        db.session.commit()
+        return doctor.user_id, len(slots), len(appts)
+
+
+def _whole_history(app, repeat):
+    """What the dashboard and availability page used to load."""
+    from app import db
+    from app.models import Appointment, Availability, Patient
+    from sqlalchemy.orm import joinedload
+    samples = []
+    with app.app_context():
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            (Appointment.query.options(joinedload(Appointment.patient).joinedload(Patient.user))
+             .filter_by(doctor_id=1).order_by(Appointment.date.desc(), Appointment.start_time).all())
+            Availability.query.filter_by(doctor_id=1).order_by(Availability.date, Availability.start_time).all()
+            samples.append(time.perf_counter() - t0)
+            db.session.rollback()
+    return percentiles(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--years', default='1,5,10', help='comma-separated history lengths')
+    ap.add_argument('--ahead', type=int, default=60)
+    ap.add_argument('--repeat', type=int, default=20)
+    args = ap.parse_args()
+
+    result = {}
+    for years in [int(y) for y in args.years.split(',')]:
+        app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_ENABLED=False, FRAGMENT_CACHE_SECONDS=0)
+        seed(db_path, doctors=20, patients=2000, appointments=0, slots=0, histories=0)
+        user_id, n_slots, n_appts = _history(app, years, args.ahead, random.Random(years))
+        client = app.test_client()
+        login_as(client, user_id)
+        result[f'{years}y'] = {
+            'slots': n_slots, 'appointments': n_appts,
+            'whole_history_queries': _whole_history(app, max(3, args.repeat // 4)),
+            'doctor_dashboard': time_get(client, '/doctor/', args.repeat),
+            'availability_page': time_get(client, '/doctor/availability', args.repeat),
+            'calendar_api': time_get(client, '/api/doctors/1/calendar', args.repeat),
+        }
+        with app.app_context():
+            from app import db
+            db.engine.dispose()
+        os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
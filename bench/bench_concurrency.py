@@ -0,0 +1,115 @@
+"""
+Booking + dashboard throughput with N worker processes sharing one SQLite file.
+
+    python -m bench.bench_concurrency --workers 8 --seconds 10
+
+Runs the same workload twice: once with SQLite's stock settings (rollback
+journal, synchronous=FULL, no busy_timeout pragma) and once with the app's
+defaults from app/config.py (WAL, synchronous=NORMAL, busy_timeout). Each
+worker is a separate process with its own app + engine, like a gunicorn worker,
+and loops over one booking POST followed by --reads doctor dashboard GETs.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+from bench.common import scratch_app, login_as, percentiles
+from bench.datagen import seed
+
+MODES = {
+    'sqlite-default': {'SQLITE_WAL': False, 'SQLITE_BUSY_TIMEOUT_MS': None, 'SQLITE_SYNCHRONOUS': None},
+    'wal': {},   # app/config.py defaults
+}
+
+
+def _worker(n, db_path, mode_cfg, seconds, reads, slot_ids, patient_ids, doctor_user_ids, out):
+    app, _ = scratch_app(db_path, **mode_cfg)
+    client = app.test_client()
+    rnd = random.Random(n)
+    login_as(client, rnd.choice(doctor_user_ids))
+    book, dash = [], []
+    conflicts = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        r = client.post('/api/appointments', json={'patient_id': rnd.choice(patient_ids),
+                                                   'availability_id': rnd.choice(slot_ids)})
+        book.append(time.perf_counter() - t0)
+        if r.status_code == 409:
+            if 'busy' in r.get_json().get('error', ''):
+                errors += 1
+            else:
+                conflicts += 1
+        elif r.status_code != 201:
+            errors += 1
+        for _ in range(reads):
+            t0 = time.perf_counter()
+            r = client.get('/doctor/')
+            dash.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                errors += 1
+    out.put({'book': book, 'dash': dash, 'conflicts': conflicts, 'errors': errors})
+
+
+def run_mode(name, mode_cfg, args):
+    app, db_path = scratch_app(None, **mode_cfg)
+    info = seed(db_path, doctors=20, patients=2000, appointments=args.appointments,
+                slots=args.slots, histories=0)
+    with app.app_context():
+        from app import db
+        from app.models import Availability, Patient
+        slot_ids = [i for (i,) in db.session.query(Availability.id).filter(Availability.is_booked.is_(False))]
+        patient_ids = [i for (i,) in db.session.query(Patient.id)]
+        db.engine.dispose()
+
+    out = mp.Queue()
+    procs = [mp.Process(target=_worker, args=(n, db_path, mode_cfg, args.seconds, args.reads, slot_ids,
+                                              patient_ids, info['doctor_user_ids'], out))
+             for n in range(args.workers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    book = [s for r in results for s in r['book']]
+    dash = [s for r in results for s in r['dash']]
+    return {
+        'workers': args.workers,
+        'seconds': args.seconds,
+        'bookings_per_sec': round(len(book) / args.seconds, 1),
+        'dashboards_per_sec': round(len(dash) / args.seconds, 1),
+        'booking_latency': percentiles(book) if book else None,
+        'dashboard_latency': percentiles(dash) if dash else None,
+        'slot_conflicts': sum(r['conflicts'] for r in results),
+        'errors': sum(r['errors'] for r in results),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--workers', type=int, default=8)
+    ap.add_argument('--seconds', type=float, default=10)
+    ap.add_argument('--reads', type=int, default=4, help='dashboard GETs per booking')
+    ap.add_argument('--appointments', type=int, default=4000)
+    ap.add_argument('--slots', type=int, default=50000)
+    ap.add_argument('--mode', choices=sorted(MODES), action='append',
+                    help='run only these modes (default: all)')
+    ap.add_argument('--out', help='write results as JSON')
+    args = ap.parse_args()
+
+    result = {name: run_mode(name, MODES[name], args) for name in (args.mode or MODES)}
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
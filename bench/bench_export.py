@@ -0,0 +1,82 @@
+"""
+Full PatientHistory export while other requests keep coming in.
+
+    python -m bench.bench_export --histories 1000000
+
+Streams /admin/history/export (CSV and NDJSON) through the test client,
+reading the body chunk by chunk, and reports rows/second and how much the
+process RSS grew (--heap adds the tracemalloc peak, which slows the export).
+Meanwhile a second thread keeps hitting /api/appointments so its latency
+during the export can be compared with the idle numbers.
+"""
+import argparse
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+from bench.common import scratch_app, login_as, percentiles, time_get
+from bench.datagen import seed
+
+
+def _export(app, fmt, heap):
+    client = app.test_client()
+    login_as(client, 1)
+    if heap:
+        tracemalloc.start()
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    resp = client.get(f'/admin/history/export?format={fmt}', buffered=False)
+    size = lines = 0
+    for chunk in resp.response:
+        size += len(chunk)
+        lines += chunk.count(b'\n') if isinstance(chunk, bytes) else chunk.count('\n')
+    resp.close()
+    seconds = time.perf_counter() - t0
+    rows = lines - (1 if fmt == 'csv' else 0)
+    out = {'rows': rows, 'mb': round(size / 1e6, 1), 'seconds': round(seconds, 2),
+           'rows_per_sec': round(rows / seconds),
+           'max_rss_growth_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0) / 1024, 1)}
+    if heap:
+        out['peak_heap_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        tracemalloc.stop()
+    return out
+
+
+def _background(app, doctor_user, stop, samples):
+    client = app.test_client()
+    login_as(client, doctor_user)
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        client.get('/api/appointments?limit=50')
+        samples.append(time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--histories', type=int, default=1000000)
+    ap.add_argument('--heap', action='store_true', help='also trace the Python heap peak')
+    args = ap.parse_args()
+
+    app, db_path = scratch_app(METRICS_ENABLED=False)
+    info = seed(db_path, doctors=50, patients=20000, appointments=10000, slots=1000, histories=args.histories)
+    idle_client = app.test_client()
+    idle = time_get(idle_client, '/api/appointments?limit=50', 200)
+
+    result = {'histories': args.histories, 'idle_api_latency': idle}
+    for fmt in ('csv', 'ndjson'):
+        stop, samples = threading.Event(), []
+        bg = threading.Thread(target=_background, args=(app, info['doctor_user_ids'][0], stop, samples))
+        bg.start()
+        result[fmt] = _export(app, fmt, args.heap)
+        stop.set()
+        bg.join()
+        result[fmt]['api_latency_during_export'] = percentiles(samples)
+    os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Patient history: page, API and completion-form cost against the number of
+visits a patient has.
+
+    python -m bench.bench_history --visits 50,500,2000
+
+For each count, seeds one chronic patient with that many visits (about 2 KB
+of notes each) and times the old whole-history load (every row, every text
+column) next to the patient's history page, the doctor's view of it, the
+history and summary APIs, one full record, and the appointment completion
+form. Then saves --saves visits through record_visit() and times that
+against rebuilding the summary from scratch. The paginated numbers should
+stay flat as the visit count grows.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from bench.common import scratch_app, login_as, percentiles, time_get
+from bench.datagen import seed
+
+DIAGNOSES = ['Type 2 diabetes, poorly controlled', 'Hypertension', 'Chronic kidney disease stage 3',
+             'Diabetic neuropathy', 'Seasonal flu', 'Hyperlipidaemia']
+MEDICINES = ['Metformin 500mg 1-0-1', 'Amlodipine 5mg 1-0-0', 'Atorvastatin 20mg 0-0-1',
+             'Insulin glargine 10u 0-0-1', 'Paracetamol 500mg SOS', 'Pregabalin 75mg 0-0-1']
+
+
+def _chronic_patient(app, visits, rnd):
+    from app import db
+    from app.models import Appointment, Doctor, Patient, PatientHistory
+    with app.app_context():
+        patient = db.session.get(Patient, 1)
+        doctor = db.session.get(Doctor, 1)
+        start = datetime.now() - timedelta(days=3 * visits)
+        db.session.execute(db.insert(PatientHistory), [
+            {'patient_id': patient.id, 'doctor_id': rnd.randint(1, 20),
+             'visit_date': start + timedelta(days=3 * i, hours=10), 'visit_type': 'follow-up',
+             'diagnosis': rnd.choice(DIAGNOSES) + '. ' + 'Reviewed labs and symptoms. ' * 10,
+             'prescription': 'Continue current regimen. ' * 8, 'tests_done': 'HbA1c, lipid profile, eGFR',
+             'medicines': ', '.join(rnd.sample(MEDICINES, 3)), 'notes': 'Counselled on diet and exercise. ' * 40}
+            for i in range(visits)])
+        appt = Appointment(patient_id=patient.id, doctor_id=doctor.id, department_id=doctor.department_id,
+                           date=datetime.now().date(), status='scheduled')
+        db.session.add(appt)
+        db.session.commit()
+        return patient.id, patient.user_id, doctor.user_id, appt.id
+
+
+def _whole_history(app, patient_id, repeat):
+    """What the history pages used to load."""
+    from app import db
+    from app.models import PatientHistory
+    from sqlalchemy.orm import undefer_group
+    samples = []
+    with app.app_context():
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            (PatientHistory.query.options(undefer_group('detail'))
+             .filter_by(patient_id=patient_id).order_by(PatientHistory.visit_date.desc()).all())
+            samples.append(time.perf_counter() - t0)
+            db.session.rollback()
+    return percentiles(samples)
+
+
+def _summary_upkeep(app, patient_id, saves, rnd):
+    from app import db, history
+    from app.models import PatientHistory
+    incremental, rebuild = [], []
+    with app.app_context():
+        history.summary(patient_id)
+        for i in range(saves):
+            h = PatientHistory(patient_id=patient_id, doctor_id=1, visit_date=datetime.now() + timedelta(minutes=i),
+                               visit_type='follow-up', diagnosis=rnd.choice(DIAGNOSES),
+                               medicines=', '.join(rnd.sample(MEDICINES, 2)))
+            db.session.add(h)
+            t0 = time.perf_counter()
+            history.record_visit(h)
+            db.session.commit()
+            incremental.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            history.rebuild(patient_id)
+            db.session.commit()
+            rebuild.append(time.perf_counter() - t0)
+    return {'record_visit': percentiles(incremental), 'rebuild': percentiles(rebuild)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--visits', default='50,500,2000', help='comma-separated visit counts')
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--saves', type=int, default=20)
+    args = ap.parse_args()
+
+    result = {}
+    for visits in [int(v) for v in args.visits.split(',')]:
+        rnd = random.Random(visits)
+        app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_ENABLED=False)
+        seed(db_path, doctors=20, patients=200, appointments=0, slots=0, histories=0)
+        patient_id, patient_user, doctor_user, appt_id = _chronic_patient(app, visits, rnd)
+        patient, doctor = app.test_client(), app.test_client()
+        login_as(patient, patient_user)
+        login_as(doctor, doctor_user)
+        with app.app_context():
+            from app import db
+            from app.models import PatientHistory
+            record_id = db.session.query(db.func.max(PatientHistory.id)).scalar()
+        result[str(visits)] = {
+            'whole_history_query': _whole_history(app, patient_id, max(3, args.repeat // 4)),
+            'patient_history_page': time_get(patient, '/patient/history', args.repeat),
+            'doctor_history_page': time_get(doctor, f'/doctor/patients/{patient_id}/history', args.repeat),
+            'complete_form': time_get(doctor, f'/doctor/appointments/{appt_id}/complete', args.repeat),
+            'history_api': time_get(doctor, f'/api/patients/{patient_id}/history', args.repeat),
+            'summary_api': time_get(doctor, f'/api/patients/{patient_id}/summary', args.repeat),
+            'record_api': time_get(doctor, f'/api/history/{record_id}', args.repeat),
+            'summary_upkeep': _summary_upkeep(app, patient_id, args.saves, rnd),
+        }
+        with app.app_context():
+            from app import db
+            db.engine.dispose()
+        os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
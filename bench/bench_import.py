@@ -0,0 +1,91 @@
+"""
+Bulk CSV import throughput (app/importer.py).
+
+    python -m bench.bench_import --patients 100000 --appointments 100000 --plaintext 200
+
+Writes CSVs of patients (pre-hashed passwords, as exported from another
+system), doctors and appointments, imports them into an empty database and
+reports rows/second per file. --plaintext adds that many patients with
+plaintext passwords, imported separately, to show the hashing rate of the
+process pool on this machine.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+from datetime import date, time, timedelta, datetime
+
+from werkzeug.security import generate_password_hash
+
+from bench.common import scratch_app
+
+SLOT_TIMES = [time(h, m) for h in range(9, 17) for m in (0, 30)]
+
+
+def _write(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--patients', type=int, default=100000)
+    ap.add_argument('--doctors', type=int, default=200)
+    ap.add_argument('--appointments', type=int, default=100000)
+    ap.add_argument('--plaintext', type=int, default=200)
+    ap.add_argument('--workers', type=int, default=0, help='hashing processes (default: one per CPU)')
+    args = ap.parse_args()
+
+    rnd = random.Random(1)
+    tmp = tempfile.mkdtemp(prefix='hms-bench-import-')
+    pw_hash = generate_password_hash('pass')
+    files = {}
+    files['patients'] = os.path.join(tmp, 'patients.csv')
+    _write(files['patients'], ('username', 'email', 'password_hash', 'age', 'gender'),
+           ((f'patient{i}', f'patient{i}@example.com', pw_hash, rnd.randint(1, 90), rnd.choice(['male', 'female']))
+            for i in range(args.patients)))
+    files['doctors'] = os.path.join(tmp, 'doctors.csv')
+    _write(files['doctors'], ('username', 'email', 'password_hash', 'department', 'specialization'),
+           ((f'doctor{i}', f'doctor{i}@example.com', pw_hash, rnd.choice(['Cardiology', 'Oncology', 'General']),
+             'General practice') for i in range(args.doctors)))
+    # one appointment per (day, doctor, slot time) cell so none of them overlap
+    cells = ((day, d, t) for day in range(10 ** 6) for d in range(args.doctors) for t in SLOT_TIMES)
+    files['appointments'] = os.path.join(tmp, 'appointments.csv')
+    _write(files['appointments'], ('patient', 'doctor', 'date', 'start_time', 'end_time', 'status'),
+           ((f'patient{rnd.randrange(args.patients)}', f'doctor{d}', (date(2023, 1, 1) + timedelta(days=day)).isoformat(),
+             t.strftime('%H:%M'), (datetime.combine(date.min, t) + timedelta(minutes=30)).strftime('%H:%M'), 'completed')
+            for (day, d, t), _ in zip(cells, range(args.appointments))))
+    plain_path = os.path.join(tmp, 'plaintext.csv')
+    _write(plain_path, ('username', 'email', 'password'),
+           ((f'new{i}', f'new{i}@example.com', f'secret{i}') for i in range(args.plaintext)))
+
+    app, db_path = scratch_app(METRICS_ENABLED=False)
+    result = {}
+    with app.app_context():
+        from app import db, importer
+        with importer.Importer(hash_workers=args.workers or None) as run:
+            for kind in ('patients', 'doctors', 'appointments'):
+                with open(files[kind], newline='') as f:
+                    report = run.run(kind, f)
+                result[kind] = {'rows': report.rows, 'created': report.created, 'failed': report.failed,
+                                'seconds': round(report.seconds, 2),
+                                'rows_per_minute': round(report.rows / report.seconds * 60)}
+            with open(plain_path, newline='') as f:
+                report = run.run('patients', f)
+            result['plaintext_passwords'] = {'rows': report.rows, 'created': report.created,
+                                             'workers': run.hash_workers, 'seconds': round(report.seconds, 2),
+                                             'rows_per_second': round(report.rows / report.seconds, 1)}
+        db.engine.dispose()
+    os.remove(db_path)
+    for path in list(files.values()) + [plain_path]:
+        os.remove(path)
+    os.rmdir(tmp)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
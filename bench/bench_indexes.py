@@ -0,0 +1,96 @@
+"""
+Index benchmark: EXPLAIN QUERY PLAN for the hot lookups plus per-route latency.
+
+    python -m bench.bench_indexes                      # 1M appointments
+    python -m bench.bench_indexes --appointments 100000 --no-indexes
+
+--no-indexes drops the ix_* indexes after seeding to get the "before" numbers.
+"""
+import argparse
+import json
+import os
+import sqlite3
+
+from bench.common import scratch_app, login_as, time_get
+from bench.datagen import seed
+
+# raw equivalents of the queries the routes issue (see app/routes/*.py)
+HOT_QUERIES = {
+    'doctor.dashboard': "SELECT * FROM appointment WHERE doctor_id = ? ORDER BY date DESC, start_time",
+    'patient.dashboard': "SELECT * FROM appointment WHERE patient_id = ?",
+    'api.appointments(date keyset)': "SELECT id FROM appointment WHERE date > ? OR (date = ? AND id > ?) "
+                                     "ORDER BY date, id LIMIT 50",
+    'api.doctor_availability': "SELECT * FROM availability WHERE doctor_id = ? AND is_booked = 0",
+    'doctor.availability': "SELECT * FROM availability WHERE doctor_id = ? ORDER BY date, start_time",
+    'patient.reschedule(prev slot)': "SELECT * FROM availability WHERE doctor_id = ? AND date = ? AND start_time = ?",
+    'doctor.patient_history': "SELECT * FROM patient_history WHERE patient_id = ? ORDER BY visit_date DESC",
+    'doctor_required lookup': "SELECT * FROM doctor WHERE user_id = ?",
+    'patient_required lookup': "SELECT * FROM patient WHERE user_id = ?",
+    'api.dept_doctors': "SELECT * FROM doctor WHERE department_id = ?",
+}
+PARAMS = {
+    'api.appointments(date keyset)': ('2024-06-01', '2024-06-01', 0),
+    'patient.reschedule(prev slot)': (1, '2024-06-01', '09:00:00.000000'),
+}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--appointments', type=int, default=1000000)
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--no-indexes', action='store_true')
+    ap.add_argument('--out', help='write results as JSON')
+    args = ap.parse_args()
+
+    app, db_path = scratch_app()
+    info = seed(db_path, appointments=args.appointments,
+                slots=args.appointments // 5, histories=args.appointments // 10)
+
+    con = sqlite3.connect(db_path)
+    if args.no_indexes:
+        for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'ix_%'").fetchall():
+            con.execute(f"DROP INDEX {name}")
+        con.commit()
+
+    plans = {}
+    for label, sql in HOT_QUERIES.items():
+        params = PARAMS.get(label, (1,) * sql.count('?'))
+        plans[label] = [row[-1] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    con.close()
+
+    client = app.test_client()
+    routes = {}
+    doc_user, pat_user = info['doctor_user_ids'][0], info['patient_user_ids'][0]
+    with app.app_context():
+        from app.models import Doctor, Patient
+        doc = Doctor.query.filter_by(user_id=doc_user).first()
+        pat = Patient.query.filter_by(user_id=pat_user).first()
+    login_as(client, doc_user)
+    routes['GET /doctor/'] = time_get(client, '/doctor/', args.repeat)
+    routes['GET /doctor/availability'] = time_get(client, '/doctor/availability', args.repeat)
+    login_as(client, pat_user)
+    routes['GET /patient/'] = time_get(client, '/patient/', args.repeat)
+    routes['GET /patient/history'] = time_get(client, '/patient/history', args.repeat)
+    login_as(client, 1)  # seeded admin
+    routes['GET /admin/doctors/<id>/appointments'] = time_get(
+        client, f'/admin/doctors/{doc.id}/appointments', args.repeat)
+    routes['GET /api/appointments?doctor_id'] = time_get(
+        client, f'/api/appointments?doctor_id={doc.id}&limit=50', args.repeat)
+    routes['GET /api/appointments?patient_id'] = time_get(
+        client, f'/api/appointments?patient_id={pat.id}&limit=50', args.repeat)
+    routes['GET /api/doctors/<id>/availability'] = time_get(
+        client, f'/api/doctors/{doc.id}/availability', args.repeat)
+    routes['GET /api/departments/<id>/doctors'] = time_get(client, '/api/departments/1/doctors', args.repeat)
+
+    os.remove(db_path)
+
+    result = {'appointments': args.appointments, 'indexes': not args.no_indexes,
+              'query_plans': plans, 'routes': routes}
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Overlap check cost for a doctor with a very full calendar.
+
+    python -m bench.bench_intervals --slots 100000
+
+Gives one doctor --slots back-to-back 15-minute slots, then times
+intervals.slot_conflict() for random candidate intervals against the naive
+approach of loading the doctor's slots for that day and scanning them.
+"""
+import argparse
+import json
+import os
+import random
+import time as clock
+from datetime import date, time, timedelta
+
+from bench.common import scratch_app, percentiles
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--slots', type=int, default=100000)
+    ap.add_argument('--checks', type=int, default=1000)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app()
+    with app.app_context():
+        from app import db, intervals, schedule
+        from app.models import User, Doctor, Availability
+        u = User(username='busydoc', email='busydoc@example.com', role='doctor', password_hash='x')
+        db.session.add(u)
+        db.session.flush()
+        doc = Doctor(user_id=u.id, department_id=1)
+        db.session.add(doc)
+        db.session.commit()
+
+        per_day = 24 * 4
+        days = -(-args.slots // per_day)
+        start = date(2030, 1, 1)
+        created, _ = schedule.generate([doc.id], start, start + timedelta(days=days - 1), range(7),
+                                       time(0), time(23, 59), 15)
+
+        rnd = random.Random(1)
+        candidates = []
+        for _ in range(args.checks):
+            m = rnd.randrange(0, 23 * 60)
+            candidates.append((start + timedelta(days=rnd.randrange(days)),
+                               time(m // 60, m % 60), time((m + 20) // 60, (m + 20) % 60)))
+
+        indexed, naive = [], []
+        for d, s, e in candidates:
+            t0 = clock.perf_counter()
+            hit = intervals.slot_conflict(doc.id, d, s, e)
+            indexed.append(clock.perf_counter() - t0)
+            t0 = clock.perf_counter()
+            rows = Availability.query.filter_by(doctor_id=doc.id, date=d).all()
+            hit2 = next((r for r in rows if r.start_time < e and r.end_time > s), None)
+            naive.append(clock.perf_counter() - t0)
+            assert (hit is None) == (hit2 is None)
+        db.engine.dispose()
+    os.remove(db_path)
+
+    print(json.dumps({
+        'slots': created,
+        'indexed_predecessor': percentiles(indexed),
+        'load_day_and_scan': percentiles(naive),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
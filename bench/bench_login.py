@@ -0,0 +1,132 @@
+"""
+Login throughput under concurrency, and what a login burst does to other pages.
+
+    python -m bench.bench_login --concurrency 16 --seconds 10
+
+Serves the app from a real threaded server. --concurrency threads post the
+login form in a loop (real passwords, distinct users) while one more thread
+keeps fetching a cheap page (/api/departments/1/doctors). Runs once with
+hashing inline on the request threads (PASSWORD_HASH_WORKERS=0) and once
+with the hashing pool (app/config.py defaults), reporting logins/s and the
+other page's latency for both.
+
+A last phase replays credential stuffing -- wrong passwords for a handful of
+usernames from one address -- with the default per-username/IP limits on,
+and reports how many attempts were shed (429) before any hashing.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from bench.common import scratch_app, percentiles
+from bench.datagen import seed, PASSWORD
+
+MODES = {
+    'inline': {'PASSWORD_HASH_WORKERS': 0},
+    'pool': {},     # app/config.py defaults
+}
+NO_LIMITS = {'LOGIN_RATE_PER_USERNAME': 0, 'LOGIN_RATE_PER_IP': 0}
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _post_login(opener, base, username, password):
+    data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    try:
+        with opener.open(urllib.request.Request(base + '/auth/login', data=data, method='POST')) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def _get(base, url):
+    with urllib.request.urlopen(base + url) as resp:
+        resp.read()
+        return resp.status
+
+
+def _serve(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def _run(db_path, mode_cfg, usernames, concurrency, seconds, password):
+    app, _ = scratch_app(db_path, METRICS_ENABLED=False, **mode_cfg)
+    server, base = _serve(app)
+    statuses, latencies, other = [], [], []
+    stop = time.perf_counter() + seconds
+
+    def login_loop(n):
+        opener = urllib.request.build_opener(_NoRedirect())
+        i = n
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            status = _post_login(opener, base, usernames[i % len(usernames)], password)
+            latencies.append(time.perf_counter() - t0)
+            statuses.append(status)
+            i += concurrency
+
+    def other_loop():
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            _get(base, '/api/departments/1/doctors')
+            other.append(time.perf_counter() - t0)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login_loop, args=(n,)) for n in range(concurrency)]
+    threads.append(threading.Thread(target=other_loop))
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+    with app.app_context():
+        from app import db
+        db.engine.dispose()
+    counts = {str(s): statuses.count(s) for s in sorted(set(statuses))}
+    return {'attempts_per_sec': round(len(statuses) / elapsed, 1), 'statuses': counts,
+            'login_latency': percentiles(latencies), 'other_page_latency': percentiles(other)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--concurrency', type=int, default=16)
+    ap.add_argument('--seconds', type=float, default=10)
+    ap.add_argument('--users', type=int, default=500)
+    args = ap.parse_args()
+
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app, db_path = scratch_app(METRICS_ENABLED=False)
+    info = seed(db_path, doctors=10, patients=args.users, appointments=0, slots=0, histories=0)
+    with app.app_context():
+        from app import db
+        from app.models import User
+        usernames = [u for (u,) in db.session.query(User.username).filter(User.id.in_(info['patient_user_ids']))]
+        db.engine.dispose()
+
+    result = {'cpus': os.cpu_count(), 'concurrency': args.concurrency}
+    for mode, cfg in MODES.items():
+        result[mode] = _run(db_path, {**cfg, **NO_LIMITS}, usernames, args.concurrency, args.seconds, PASSWORD)
+    # credential stuffing: 5 usernames, wrong passwords, default limits
+    result['stuffing'] = _run(db_path, {}, usernames[:5], args.concurrency, args.seconds, 'wrong')
+    os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Overhead of the request metrics.
+
+    python -m bench.bench_metrics --repeat 500
+
+Times the same pages with METRICS_ENABLED off, on with full sampling and on
+with METRICS_SAMPLE_RATE=0.1, against one seeded database.
+"""
+import argparse
+import json
+import os
+
+from bench.common import scratch_app, login_as, time_get
+from bench.datagen import seed
+
+MODES = {
+    'off': {'METRICS_ENABLED': False},
+    'on, sample 1.0': {'METRICS_SAMPLE_RATE': 1.0},
+    'on, sample 0.1': {'METRICS_SAMPLE_RATE': 0.1},
+    'on, sample 1.0 + Server-Timing': {'METRICS_SAMPLE_RATE': 1.0, 'METRICS_SERVER_TIMING': True},
+}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--appointments', type=int, default=100000)
+    ap.add_argument('--repeat', type=int, default=500)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app()
+    info = seed(db_path, appointments=args.appointments, slots=10000, histories=1000)
+    results = {}
+    for label, cfg in MODES.items():
+        app, _ = scratch_app(db_path, **cfg)
+        client = app.test_client()
+        login_as(client, info['doctor_user_ids'][0])
+        client.get('/doctor/')    # warm up
+        results[label] = {
+            'GET /doctor/': time_get(client, '/doctor/', args.repeat),
+            'GET /api/departments/1/doctors': time_get(client, '/api/departments/1/doctors', args.repeat),
+        }
+    os.remove(db_path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
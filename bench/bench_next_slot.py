@@ -0,0 +1,90 @@
+"""
+Next-available-slot search versus the old department -> doctor -> slots walk.
+
+    python -m bench.bench_next_slot --doctors 200 --days 60
+
+Seeds a year of past slots plus --days of future ones (16 per doctor per
+day, a third already booked). The old flow is what book.html used to do to
+find the earliest opening in a department: one /api/departments/<id>/doctors
+call, one /api/doctors/<id>/availability per doctor, then sort everything
+client side. The new flow is a single /api/slots/next call. Both are timed
+with every cache off (cold) and with the default caches (warm).
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from bench.common import scratch_app, percentiles
+from bench.datagen import seed
+
+COLD = {'CACHE_TTL_SECONDS': 0, 'SLOT_SEARCH_CACHE_SECONDS': 0}
+
+
+def _old_flow(client, dept_id):
+    doctors = client.get(f'/api/departments/{dept_id}/doctors').get_json()
+    slots = []
+    for d in doctors:
+        slots.extend(client.get(f'/api/doctors/{d["id"]}/availability').get_json())
+    slots.sort(key=lambda s: (s['date'], s['start_time'] or ''))
+    return slots[:10], 1 + len(doctors)
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return percentiles(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--doctors', type=int, default=200)
+    ap.add_argument('--days', type=int, default=60)
+    ap.add_argument('--past-slots', type=int, default=200000)
+    ap.add_argument('--repeat', type=int, default=20)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app(METRICS_ENABLED=False)
+    seed(db_path, doctors=args.doctors, patients=1000, appointments=0, slots=args.past_slots, histories=0)
+    rnd = random.Random(1)
+    with app.app_context():
+        from app import db
+        from app.models import Availability, Doctor
+        doctor_ids = [i for (i,) in db.session.query(Doctor.id)]
+        today = date.today()
+        rows = [{'doctor_id': d, 'date': today + timedelta(days=day), 'is_booked': rnd.random() < 0.33,
+                 'start_time': (datetime(2000, 1, 1, 9) + timedelta(minutes=30 * i)).time(),
+                 'end_time': (datetime(2000, 1, 1, 9, 30) + timedelta(minutes=30 * i)).time()}
+                for day in range(args.days) for d in doctor_ids for i in range(16)]
+        for i in range(0, len(rows), 50000):
+            db.session.execute(db.insert(Availability), rows[i:i + 50000])
+        db.session.commit()
+        dept_sizes = dict(db.session.query(Doctor.department_id, db.func.count()).group_by(Doctor.department_id).all())
+        db.engine.dispose()
+    dept = max(dept_sizes, key=dept_sizes.get)
+    result = {'doctors': args.doctors, 'doctors_in_department': dept_sizes[dept],
+              'future_slots': len(rows), 'past_slots': args.past_slots}
+
+    for label, cfg in (('cold', COLD), ('warm', {})):
+        app, _ = scratch_app(db_path, METRICS_ENABLED=False, **cfg)
+        client = app.test_client()
+        _, requests = _old_flow(client, dept)
+        result[f'old_flow_{label}'] = dict(_timed(lambda: _old_flow(client, dept), max(3, args.repeat // 4)),
+                                           requests=requests)
+        result[f'next_slots_department_{label}'] = _timed(
+            lambda: client.get(f'/api/slots/next?department_id={dept}'), args.repeat)
+        result[f'next_slots_any_doctor_{label}'] = _timed(lambda: client.get('/api/slots/next'), args.repeat)
+        with app.app_context():
+            from app import db
+            db.engine.dispose()
+    os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Notification queue: booking latency with and without a delivery backlog,
+and how fast a worker drains the queue.
+
+    python -m bench.bench_notify --bookings 2000 --backlog 200000
+
+Books --bookings slots through POST /api/appointments three times: with
+notifications off, with them on and an empty queue, and with --backlog
+undelivered jobs already queued. Then runs the worker (file sink) over the
+whole queue and reports jobs/second.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from bench.common import scratch_app, percentiles
+from bench.datagen import seed
+
+
+def _book(client, slots, patients, rnd):
+    samples = []
+    for slot in slots:
+        t0 = time.perf_counter()
+        r = client.post('/api/appointments', json={'patient_id': rnd.choice(patients), 'availability_id': slot})
+        samples.append(time.perf_counter() - t0)
+        assert r.status_code == 201, r.get_json()
+    return percentiles(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--bookings', type=int, default=2000)
+    ap.add_argument('--backlog', type=int, default=200000)
+    args = ap.parse_args()
+
+    notes = tempfile.mktemp(prefix='hms-bench-notify-', suffix='.jsonl')
+    app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_FILE=notes)
+    seed(db_path, doctors=50, patients=5000, appointments=0, slots=0, histories=0)
+    rnd = random.Random(1)
+    with app.app_context():
+        from app import db, jobs, notify
+        from app.models import Availability, Patient
+        # future slots so every booking queues a confirmation and a reminder
+        start = date.today() + timedelta(days=7)
+        db.session.execute(db.insert(Availability), [
+            {'doctor_id': d, 'date': start + timedelta(days=i // 16), 'is_booked': False,
+             'start_time': (datetime(2000, 1, 1, 9) + timedelta(minutes=30 * (i % 16))).time(),
+             'end_time': (datetime(2000, 1, 1, 9, 30) + timedelta(minutes=30 * (i % 16))).time()}
+            for d in range(1, 51) for i in range(3 * args.bookings // 50 + 16)])
+        db.session.commit()
+        free = [i for (i,) in db.session.query(Availability.id)]
+        patients = [i for (i,) in db.session.query(Patient.id)]
+    rnd.shuffle(free)
+    client = app.test_client()
+    result = {'bookings': args.bookings, 'backlog': args.backlog}
+
+    app.config['NOTIFY_ENABLED'] = False
+    result['notify_off'] = _book(client, free[:args.bookings], patients, rnd)
+    app.config['NOTIFY_ENABLED'] = True
+    result['notify_on'] = _book(client, free[args.bookings:2 * args.bookings], patients, rnd)
+    with app.app_context():
+        jobs.enqueue_many(notify.KIND, [
+            ({'event': 'booked', 'appointment_id': 1, 'patient_id': rnd.choice(patients), 'doctor_id': 1,
+              'at': '2099-01-01T10:00'}, None) for _ in range(args.backlog)])
+        db.session.commit()
+    result['notify_on_with_backlog'] = _book(client, free[2 * args.bookings:3 * args.bookings], patients, rnd)
+
+    with app.app_context():
+        queued = jobs.stats().get('pending', 0)
+        t0 = time.perf_counter()
+        jobs.work(once=True)
+        seconds = time.perf_counter() - t0
+        result['worker'] = {'due_jobs': queued, 'seconds': round(seconds, 1),
+                            'jobs_per_sec': round(queued / seconds), 'queue_after': jobs.stats()}
+        db.engine.dispose()
+    os.remove(db_path)
+    if os.path.exists(notes):
+        os.remove(notes)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+SQL statements per request for the list views, against growing row counts.
+
+    python -m bench.bench_query_counts --rows 5,50,300
+
+For each count, seeds that many doctors and patients, gives one doctor and
+one patient that many appointments inside the dashboard window (each with a
+different patient / doctor, so every row has its own relations to load) and
+counts the statements each view sends (before_cursor_execute on the engine)
+on its second request, after the caches are warm. The views eager-load what
+their templates show, so every count has to come out at the number in VIEWS
+at every size; the script exits non-zero and names the view when one does
+not. A count that grows with the rows is an N+1 query creeping back in; one
+that moves at every size is a changed view, and VIEWS is updated with it.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from bench.common import scratch_app, login_as
+from bench.datagen import seed, SLOT_TIMES
+
+# name: (role, url, statements expected on a warm request)
+VIEWS = {
+    'admin dashboard': ('admin', '/admin/', 4),
+    'admin appointments': ('admin', '/admin/appointments', 1),
+    'admin doctor appointments': ('admin', '/admin/doctors/1/appointments', 6),
+    'doctor dashboard': ('doctor', '/doctor/', 3),
+    'patient dashboard': ('patient', '/patient/', 1),
+}
+
+
+def _appointments(app, rows):
+    """`rows` appointments for doctor 1 (one patient each) and for patient 1 (one doctor each)."""
+    from app import db
+    from app.models import Appointment, Doctor, Patient
+    with app.app_context():
+        doctors = db.session.query(Doctor.id, Doctor.department_id).order_by(Doctor.id).all()
+        patients = [p for (p,) in db.session.query(Patient.id).order_by(Patient.id)]
+        first = date.today() - timedelta(days=2)
+        values = []
+        for i in range(rows):
+            day = first + timedelta(days=i // len(SLOT_TIMES))
+            start = SLOT_TIMES[i % len(SLOT_TIMES)]
+            end = (datetime.combine(day, start) + timedelta(minutes=30)).time()
+            values.append({'doctor_id': doctors[0].id, 'department_id': doctors[0].department_id,
+                           'patient_id': patients[i % len(patients)], 'date': day, 'start_time': start,
+                           'end_time': end, 'status': 'scheduled'})
+            doctor = doctors[i % len(doctors)]
+            values.append({'doctor_id': doctor.id, 'department_id': doctor.department_id,
+                           'patient_id': patients[0], 'date': day + timedelta(days=1), 'start_time': start,
+                           'end_time': end, 'status': 'scheduled'})
+        db.session.execute(db.insert(Appointment), values)
+        db.session.commit()
+        return db.session.get(Doctor, doctors[0].id).user_id, db.session.get(Patient, patients[0]).user_id
+
+
+def _count(rows):
+    from app import db
+    app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_ENABLED=False, FRAGMENT_CACHE_SECONDS=0)
+    seed(db_path, doctors=rows, patients=rows, appointments=0, slots=0, histories=0)
+    doctor_user, patient_user = _appointments(app, rows)
+    clients = {role: app.test_client() for role in ('admin', 'doctor', 'patient')}
+    login_as(clients['admin'], 1)
+    login_as(clients['doctor'], doctor_user)
+    login_as(clients['patient'], patient_user)
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def on_execute(*args):
+        statements.append(args[2])
+
+    counts = {}
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        for name, (role, url, _) in VIEWS.items():
+            clients[role].get(url)
+            statements.clear()
+            r = clients[role].get(url)
+            assert r.status_code == 200, (url, r.status_code)
+            counts[name] = len(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+    engine.dispose()
+    os.remove(db_path)
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', default='5,50,300', help='comma-separated row counts (at least two)')
+    ap.add_argument('--out', help='write results as JSON')
+    args = ap.parse_args()
+
+    result = {}
+    for rows in [int(n) for n in args.rows.split(',')]:
+        result[str(rows)] = _count(rows)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    wrong = [f'{name} ({counts[name]} at {rows} rows, expected {expected})'
+             for rows, counts in result.items()
+             for name, (_, _, expected) in VIEWS.items() if counts[name] != expected]
+    if wrong:
+        sys.exit('unexpected query counts: ' + ', '.join(wrong))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Template rendering: compile cost with and without the bytecode cache, and
+render time of the fragment-cached pages.
+
+    python -m bench.bench_render --doctors 10000 --busy-appointments 2000
+
+Seeds --doctors doctors, then gives one of them --busy-appointments
+appointments. Compiling every template is timed in a fresh app without a
+bytecode cache, with an empty one (compile + write) and with a populated one.
+Then the admin dashboard (first page and a later one), the admin view of the
+busy doctor's appointments and that doctor's own dashboard are requested
+with the fragment cache off and on. Render time is the template time from
+the Server-Timing header (app/metrics.py); the request time includes the
+queries, which an unexecuted query passed to a cached block also skips.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+from bench.common import scratch_app, login_as, percentiles
+from bench.datagen import seed
+
+TIMING = {'METRICS_ENABLED': True, 'METRICS_SAMPLE_RATE': 1.0, 'METRICS_SERVER_TIMING': True}
+
+
+def _compile_all(app):
+    t0 = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def _timed(client, url, repeat):
+    request, render = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = client.get(url)
+        request.append(time.perf_counter() - t0)
+        assert r.status_code == 200, (url, r.status_code)
+        render.append(float(re.search(r'tpl;dur=([\d.]+)', r.headers['Server-Timing']).group(1)) / 1000)
+    return {'request': percentiles(request), 'render': percentiles(render)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--doctors', type=int, default=10000)
+    ap.add_argument('--busy-appointments', type=int, default=2000)
+    ap.add_argument('--repeat', type=int, default=30)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app(METRICS_ENABLED=False, NOTIFY_ENABLED=False)
+    seed(db_path, doctors=args.doctors, patients=5000, appointments=0, slots=0, histories=0)
+    rnd = random.Random(1)
+    with app.app_context():
+        from app import db
+        from app.models import Appointment, Doctor, Patient
+        busy = db.session.get(Doctor, 1)
+        busy_user = busy.user_id
+        patients = [i for (i,) in db.session.query(Patient.id)]
+        start = date.today() - timedelta(days=args.busy_appointments // 8)
+        db.session.execute(db.insert(Appointment), [
+            {'patient_id': rnd.choice(patients), 'doctor_id': busy.id, 'department_id': busy.department_id,
+             'date': start + timedelta(days=i // 8), 'start_time': dtime(9 + i % 8),
+             'end_time': dtime(9 + i % 8, 30), 'status': rnd.choice(('scheduled', 'completed', 'cancelled'))}
+            for i in range(args.busy_appointments)])
+        db.session.commit()
+        db.engine.dispose()
+    result = {'doctors': args.doctors, 'busy_doctor_appointments': args.busy_appointments}
+
+    bytecode_dir = tempfile.mkdtemp(prefix='hms-bench-jinja-')
+    compile_ms = {}
+    for label, cfg in (('no_bytecode_cache', {'TEMPLATE_BYTECODE_CACHE': False}),
+                       ('bytecode_cache_empty', {'TEMPLATE_CACHE_DIR': bytecode_dir}),
+                       ('bytecode_cache_warm', {'TEMPLATE_CACHE_DIR': bytecode_dir})):
+        app, _ = scratch_app(db_path, **cfg)
+        compile_ms[label] = _compile_all(app)
+    result['compile_all_templates_ms'] = compile_ms
+
+    admin = None
+    for label, cfg in (('before', {'FRAGMENT_CACHE_SECONDS': 0, 'TEMPLATE_BYTECODE_CACHE': False}),
+                       ('after', {'TEMPLATE_CACHE_DIR': bytecode_dir})):
+        app, _ = scratch_app(db_path, **TIMING, **cfg)
+        admin = app.test_client()
+        login_as(admin, 1)
+        doctor = app.test_client()
+        login_as(doctor, busy_user)
+        page = admin.get('/admin/').data.decode()
+        later = re.findall(r'href="([^"]*doctors_after[^"]*)"', page)[0].replace('&amp;', '&')
+        for name, client, url in (('admin_dashboard', admin, '/admin/'),
+                                  ('admin_dashboard_page_2', admin, later),
+                                  ('admin_doctor_appointments', admin, '/admin/doctors/1/appointments'),
+                                  ('doctor_dashboard', doctor, '/doctor/')):
+            result.setdefault(name, {})[label] = _timed(client, url, args.repeat)
+        with app.app_context():
+            from app import db
+            db.engine.dispose()
+
+    shutil.rmtree(bytecode_dir)
+    os.remove(db_path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
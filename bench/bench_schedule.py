@@ -0,0 +1,57 @@
+"""
+Recurring schedule generation for a whole department.
+
+    python -m bench.bench_schedule --doctors 10
+
+Generates a year of 15-minute weekday slots (09:00-17:00, lunch 12:00-13:00)
+for every doctor in one department, then runs the same template again so every
+slot hits the overlap check instead of being inserted.
+"""
+import argparse
+import json
+import os
+import time as clock
+from datetime import date, time
+
+from bench.common import scratch_app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--doctors', type=int, default=10)
+    ap.add_argument('--slot-minutes', type=int, default=15)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app()
+    with app.app_context():
+        from app import db, schedule
+        from app.models import User, Doctor
+        for i in range(args.doctors):
+            u = User(username=f'schedoc{i}', email=f'schedoc{i}@example.com', role='doctor', password_hash='x')
+            db.session.add(u)
+            db.session.flush()
+            db.session.add(Doctor(user_id=u.id, department_id=1))
+        db.session.commit()
+        doctor_ids = [d.id for d in Doctor.query.filter_by(department_id=1)]
+
+        template = dict(start_date=date(2030, 1, 1), end_date=date(2030, 12, 31), weekdays=[0, 1, 2, 3, 4],
+                        day_start=time(9), day_end=time(17), slot_minutes=args.slot_minutes,
+                        breaks=[(time(12), time(13))], exceptions=[date(2030, 12, 25)])
+        t0 = clock.perf_counter()
+        created, skipped = schedule.generate(doctor_ids, **template)
+        first = clock.perf_counter() - t0
+        t0 = clock.perf_counter()
+        created2, skipped2 = schedule.generate(doctor_ids, **template)
+        second = clock.perf_counter() - t0
+        db.engine.dispose()
+    os.remove(db_path)
+
+    print(json.dumps({
+        'doctors': args.doctors,
+        'first_run': {'created': created, 'skipped': skipped, 'seconds': round(first, 3)},
+        'rerun_all_overlapping': {'created': created2, 'skipped': skipped2, 'seconds': round(second, 3)},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
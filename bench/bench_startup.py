@@ -0,0 +1,92 @@
+"""
+Cold start: `import app`, create_app() and the first request, each in a
+fresh interpreter.
+
+    python -m bench.bench_startup --runs 10 --budget-ms 750
+
+Bootstraps one scratch database, then starts --runs child processes per mode
+and times the three phases in each:
+
+    bootstrap_on_start  the old create_app(): schema check, migrations and
+                        seeding on every start (BOOTSTRAP_ON_START)
+    lean                create_app() with no database I/O (the default)
+    lazy_blueprints     lean, routes imported on the first request
+    preload_templates   lean, every template compiled in create_app()
+
+Reports the median per phase and whether the lean start (import + factory +
+first request) fits in --budget-ms; exits 1 if it doesn't.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = {
+    'bootstrap_on_start': {'BOOTSTRAP_ON_START': True},
+    'lean': {},
+    'lazy_blueprints': {'LAZY_BLUEPRINTS': True},
+    'preload_templates': {'PRELOAD_TEMPLATES': True},
+}
+PHASES = ('import_ms', 'factory_ms', 'first_request_ms', 'total_ms')
+
+
+def _child(db_path, mode):
+    t0 = time.perf_counter()
+    from app import create_app
+    t1 = time.perf_counter()
+    cfg = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path, 'TESTING': True, 'METRICS_ENABLED': False}
+    cfg.update(MODES[mode])
+    app = create_app(cfg)
+    t2 = time.perf_counter()
+    r = app.test_client().get('/auth/login')
+    t3 = time.perf_counter()
+    assert r.status_code == 200, r.status_code
+    ms = lambda a, b: round((b - a) * 1000, 1)
+    # create_app() prints the database path; keep the result on its own last line
+    print(json.dumps({'import_ms': ms(t0, t1), 'factory_ms': ms(t1, t2),
+                      'first_request_ms': ms(t2, t3), 'total_ms': ms(t0, t3)}))
+
+
+def _run(db_path, mode):
+    out = subprocess.run([sys.executable, '-m', 'bench.bench_startup', '--child', mode, db_path],
+                         capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--runs', type=int, default=10)
+    ap.add_argument('--budget-ms', type=float, default=750)
+    ap.add_argument('--child', nargs=2, metavar=('MODE', 'DB'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return _child(args.child[1], args.child[0])
+
+    # not at module level: the children must not import app before timing it
+    from bench.common import scratch_app
+    app, db_path = scratch_app(METRICS_ENABLED=False)
+    with app.app_context():
+        from app import db
+        db.engine.dispose()
+    db_path = os.path.abspath(db_path)
+
+    result = {'runs': args.runs}
+    for mode in MODES:
+        _run(db_path, mode)   # warm the OS file cache and __pycache__
+        samples = [_run(db_path, mode) for _ in range(args.runs)]
+        result[mode] = {p: round(statistics.median(s[p] for s in samples), 1) for p in PHASES}
+    result['budget_ms'] = args.budget_ms
+    result['within_budget'] = result['lean']['total_ms'] <= args.budget_ms
+    for name in os.listdir(os.path.dirname(db_path)):
+        if name.startswith(os.path.basename(db_path)):
+            os.remove(os.path.join(os.path.dirname(db_path), name))
+    print(json.dumps(result, indent=2))
+    return 0 if result['within_budget'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
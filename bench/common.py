@@ -0,0 +1,47 @@
+"""Small helpers shared by the benchmark scripts."""
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app
+from app.bootstrap import bootstrap
+
+
+def scratch_app(db_path=None, **config):
+    """create_app() + bootstrap() against a throwaway SQLite file instead of instance/hospital.db."""
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(prefix='hms-bench-', suffix='.db')
+        os.close(fd)
+        os.remove(db_path)
+    cfg = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path), 'TESTING': True}
+    cfg.update(config)
+    app = create_app(cfg)
+    with app.app_context():
+        bootstrap()
+    return app, db_path
+
+
+def login_as(client, user_id):
+    """Log a test client in without going through the password check."""
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+
+def percentiles(samples):
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds."""
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] * 1000
+    return {'n': len(s), 'p50_ms': round(pick(0.50), 3), 'p95_ms': round(pick(0.95), 3),
+            'p99_ms': round(pick(0.99), 3), 'mean_ms': round(statistics.fmean(s) * 1000, 3)}
+
+
+def time_get(client, url, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = client.get(url)
+        samples.append(time.perf_counter() - t0)
+        assert r.status_code == 200, (url, r.status_code)
+    return percentiles(samples)
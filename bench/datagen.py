@@ -0,0 +1,181 @@
+"""
+Bulk synthetic data for the benchmark scripts.
+
+Writes straight through sqlite3 with executemany() so millions of rows load
+in seconds; the schema itself comes from bootstrap() (create_all + migrations).
+Run it directly to build a database to keep around (every account's password
+is "pass"):
+
+    python -m bench.datagen bench.db --doctors 200 --patients 500000 --appointments 5000000
+"""
+import argparse
+import json
+import os
+import random
+import time as clock
+import sqlite3
+from datetime import date, time, timedelta, datetime
+
+from werkzeug.security import generate_password_hash
+
+# every seeded account shares one hash so seeding doesn't pay for hashing
+PASSWORD = 'pass'
+_PASSWORD_HASH = generate_password_hash(PASSWORD)
+
+START_DATE = date(2024, 1, 1)
+SLOT_TIMES = [time(h, m) for h in range(9, 17) for m in (0, 30)]
+SPECIALIZATIONS = ['General practice', 'Cardiologist', 'Oncologist', 'Neurologist', 'Pediatrician',
+                   'Dermatologist', 'Orthopedic surgeon', 'Radiologist']
+
+
+def _chunks(it, size=50000):
+    buf = []
+    for row in it:
+        buf.append(row)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+# same text formats SQLAlchemy's SQLite dialect writes, so equality lookups still match
+def _t(t):
+    return t.strftime('%H:%M:%S.%f')
+
+
+def _end(t):
+    return _t((datetime.combine(START_DATE, t) + timedelta(minutes=30)).time())
+
+
+def seed(db_path, doctors=200, patients=20000, appointments=1000000,
+         slots=200000, histories=100000, days=365, rng_seed=1):
+    """Fill an app-created database. Returns a dict of row counts."""
+    rnd = random.Random(rng_seed)
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA synchronous = OFF")
+    cur = con.cursor()
+    # building each index once at the end is much cheaper than keeping it
+    # up to date through millions of inserts
+    indexes = cur.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND tbl_name IN ('user', 'doctor', 'patient', 'appointment', 'availability', 'patient_history')"
+    ).fetchall()
+    for name, _ in indexes:
+        cur.execute(f"DROP INDEX {name}")
+
+    dept_ids = [r[0] for r in cur.execute("SELECT id FROM department")]
+    next_user = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM user").fetchone()[0]) + 1
+    next_doc = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM doctor").fetchone()[0]) + 1
+    next_pat = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM patient").fetchone()[0]) + 1
+
+    doc_users = list(range(next_user, next_user + doctors))
+    pat_users = list(range(next_user + doctors, next_user + doctors + patients))
+    for chunk in _chunks(
+            (uid, f'doctor{uid}', f'doctor{uid}@example.com', _PASSWORD_HASH, 'doctor') for uid in doc_users):
+        cur.executemany("INSERT INTO user (id, username, email, password_hash, role) VALUES (?,?,?,?,?)", chunk)
+    for chunk in _chunks(
+            (uid, f'patient{uid}', f'patient{uid}@example.com', _PASSWORD_HASH, 'patient') for uid in pat_users):
+        cur.executemany("INSERT INTO user (id, username, email, password_hash, role) VALUES (?,?,?,?,?)", chunk)
+
+    doc_ids = list(range(next_doc, next_doc + doctors))
+    doc_dept = {d: rnd.choice(dept_ids) for d in doc_ids}
+    cur.executemany(
+        "INSERT INTO doctor (id, user_id, specialization, experience_years, department_id) VALUES (?,?,?,?,?)",
+        [(d, u, rnd.choice(SPECIALIZATIONS), rnd.randint(1, 30), doc_dept[d]) for d, u in zip(doc_ids, doc_users)])
+    pat_ids = list(range(next_pat, next_pat + patients))
+    for chunk in _chunks((p, u, rnd.randint(1, 90), rnd.choice(['male', 'female']))
+                         for p, u in zip(pat_ids, pat_users)):
+        cur.executemany("INSERT INTO patient (id, user_id, age, gender) VALUES (?,?,?,?)", chunk)
+
+    # appointments and slots share one calendar: each (day, doctor, slot time)
+    # cell holds at most one of them, so nothing overlaps (see app/intervals.py).
+    # Cells are picked by selection sampling -- exact counts, one pass, in date
+    # order like a real table that grew over time.
+    cells_per_day = doctors * len(SLOT_TIMES)
+    wanted = appointments + slots
+    days = max(days, -(-wanted * 5 // (cells_per_day * 4)))     # keep the calendar <= 80% full
+    appt_left, slot_left = appointments, slots
+    remaining = days * cells_per_day
+    appt_buf, slot_buf = [], []
+
+    def flush():
+        cur.executemany(
+            "INSERT INTO appointment (patient_id, doctor_id, department_id, date, start_time, end_time, mode, status) "
+            "VALUES (?,?,?,?,?,?,?,?)", appt_buf)
+        cur.executemany(
+            "INSERT INTO availability (doctor_id, date, start_time, end_time, is_booked) VALUES (?,?,?,?,?)", slot_buf)
+        appt_buf.clear()
+        slot_buf.clear()
+
+    times = [(_t(t), _end(t)) for t in SLOT_TIMES]
+    for day in range(days):
+        if not appt_left + slot_left:
+            break
+        d_str = (START_DATE + timedelta(days=day)).isoformat()
+        for doc in doc_ids:
+            for start, end in times:
+                left = appt_left + slot_left
+                if rnd.random() * remaining < left:
+                    if rnd.random() * left < appt_left:
+                        appt_left -= 1
+                        appt_buf.append((rnd.choice(pat_ids), doc, doc_dept[doc], d_str, start, end, 'in-person',
+                                         rnd.choices(['scheduled', 'completed', 'cancelled'], [3, 6, 1])[0]))
+                    else:
+                        slot_left -= 1
+                        slot_buf.append((doc, d_str, start, end, rnd.random() < 0.5))
+                remaining -= 1
+        if len(appt_buf) + len(slot_buf) >= 50000:
+            flush()
+    flush()
+
+    def history_rows():
+        for _ in range(histories):
+            yield (rnd.choice(pat_ids), rnd.choice(doc_ids),
+                   datetime.combine(START_DATE + timedelta(days=rnd.randrange(days)), time(10))
+                   .strftime('%Y-%m-%d %H:%M:%S.%f'),
+                   'follow-up', 'Seasonal flu', 'Rest and fluids', 'CBC', 'Paracetamol 500mg', None)
+    for chunk in _chunks(history_rows()):
+        cur.executemany(
+            "INSERT INTO patient_history (patient_id, doctor_id, visit_date, visit_type, diagnosis, "
+            "prescription, tests_done, medicines, notes) VALUES (?,?,?,?,?,?,?,?,?)", chunk)
+
+    for _, sql in indexes:
+        cur.execute(sql)
+    con.commit()
+    cur.execute("ANALYZE")
+    con.close()
+    return {'doctors': doctors, 'patients': patients, 'appointments': appointments,
+            'slots': slots, 'days': days, 'histories': histories,
+            'doctor_user_ids': doc_users, 'patient_user_ids': pat_users}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('db_path')
+    ap.add_argument('--doctors', type=int, default=200)
+    ap.add_argument('--patients', type=int, default=500000)
+    ap.add_argument('--appointments', type=int, default=5000000)
+    ap.add_argument('--slots', type=int, default=500000)
+    ap.add_argument('--histories', type=int, default=1000000)
+    ap.add_argument('--seed', type=int, default=1)
+    args = ap.parse_args()
+    if os.path.exists(args.db_path):
+        ap.error(f'{args.db_path} already exists')
+
+    from bench.common import scratch_app
+    app, db_path = scratch_app(args.db_path)
+    t0 = clock.perf_counter()
+    info = seed(db_path, doctors=args.doctors, patients=args.patients, appointments=args.appointments,
+                slots=args.slots, histories=args.histories, rng_seed=args.seed)
+    with app.app_context():
+        from app import db, search
+        search.rebuild()
+        db.engine.dispose()
+    info = {k: v for k, v in info.items() if not k.endswith('_ids')}
+    info['seconds'] = round(clock.perf_counter() - t0, 1)
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == '__main__':
+    main()
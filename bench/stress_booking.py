@@ -0,0 +1,104 @@
+"""
+Booking stress test: many threads book the same few slots at once.
+
+    python -m bench.stress_booking --threads 32 --attempts 4000 --slots 50
+
+Every attempt POSTs /api/appointments with a random slot id. At the end each
+slot must back at most one live appointment, every booked slot exactly one,
+and the number of 201 responses must equal the number of booked slots.
+Exits non-zero on any double booking.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from datetime import date, time
+
+from bench.common import scratch_app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--threads', type=int, default=32)
+    ap.add_argument('--attempts', type=int, default=4000)
+    ap.add_argument('--slots', type=int, default=50)
+    args = ap.parse_args()
+
+    app, db_path = scratch_app()
+    with app.app_context():
+        from app import db
+        from app.models import User, Doctor, Patient, Availability, Appointment
+        du = User(username='stressdoc', email='stressdoc@example.com', role='doctor', password_hash='x')
+        db.session.add(du)
+        db.session.flush()
+        doc = Doctor(user_id=du.id, department_id=1)
+        db.session.add(doc)
+        patients = []
+        for i in range(args.threads):
+            u = User(username=f'stresspat{i}', email=f'stresspat{i}@example.com', role='patient', password_hash='x')
+            db.session.add(u)
+            db.session.flush()
+            p = Patient(user_id=u.id)
+            db.session.add(p)
+            patients.append(p)
+        db.session.flush()
+        slot_ids = []
+        for i in range(args.slots):
+            s = Availability(doctor_id=doc.id, date=date(2030, 1, 1 + i % 28),
+                             start_time=time(9 + i // 28), end_time=time(10 + i // 28))
+            db.session.add(s)
+            db.session.flush()
+            slot_ids.append(s.id)
+        patient_ids = [p.id for p in patients]
+        db.session.commit()
+
+    statuses = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+    per_thread = args.attempts // args.threads
+
+    def worker(n):
+        client = app.test_client()
+        rnd = random.Random(n)
+        barrier.wait()
+        local = Counter()
+        for _ in range(per_thread):
+            r = client.post('/api/appointments', json={'patient_id': patient_ids[n],
+                                                       'availability_id': rnd.choice(slot_ids)})
+            local[r.status_code] += 1
+        with lock:
+            statuses.update(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        per_slot = Counter(a for (a,) in db.session.query(Appointment.availability_id)
+                           .filter(Appointment.availability_id.isnot(None)))
+        booked = {i for (i,) in db.session.query(Availability.id).filter(Availability.is_booked.is_(True))}
+        total_appts = db.session.query(Appointment).count()
+    os.remove(db_path)
+
+    doubles = {k: v for k, v in per_slot.items() if v > 1}
+    result = {
+        'attempts': per_thread * args.threads,
+        'responses': dict(statuses),
+        'appointments': total_appts,
+        'booked_slots': len(booked),
+        'double_booked_slots': len(doubles),
+    }
+    print(json.dumps(result, indent=2))
+    ok = (not doubles and set(per_slot) == booked
+          and statuses[201] == len(booked) == total_appts)
+    print('OK: no double bookings' if ok else 'FAIL')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+End-to-end benchmark suite over the real routes.
+
+    python -m bench.suite --out bench-results.json
+    python -m bench.suite --db bench.db --http --concurrency 16 --out new.json --compare old.json
+
+Drives booking, rescheduling, the doctor dashboard, the admin appointment list
+and every /api/* endpoint, first sequentially through the Flask test client,
+then (with --http) from --concurrency threads against a real threaded server
+over HTTP. Reports p50/p95/p99 latency and requests/second per scenario.
+
+Without --db a scratch database is seeded (bench/datagen.py) and removed
+afterwards; pass --db to reuse one built with `python -m bench.datagen`.
+The JSON output records the git commit and sizes, and --compare prints the
+p50/p95 change against an earlier result file.
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.common import scratch_app, login_as, percentiles
+from bench.datagen import seed, PASSWORD
+
+
+# ---------- fixtures pulled from the database ----------
+
+class Fixtures:
+    """Ids the scenarios need, plus a pool of free slots handed out once each."""
+
+    def __init__(self, app, rnd, reserve):
+        from app import db
+        from app.models import User, Doctor, Patient, Availability, Appointment
+        with app.app_context():
+            self.doctors = [(d.id, d.user_id, d.department_id) for d in Doctor.query.limit(50)]
+            self.patients = [(p.id, p.user_id) for p in Patient.query.limit(200)]
+            self.departments = sorted({d[2] for d in self.doctors if d[2]})
+            self.admin_user = User.query.filter_by(role='admin').first().id
+            free = (db.session.query(Availability.id, Availability.doctor_id, Doctor.department_id)
+                    .join(Doctor, Doctor.id == Availability.doctor_id)
+                    .filter(Availability.is_booked.is_(False)).limit(reserve).all())
+            self.appointments = [a for (a,) in db.session.query(Appointment.id).limit(1000)]
+            db.engine.dispose()
+        rnd.shuffle(free)
+        self.free_slots = free
+        self._lock = threading.Lock()
+        self.rnd = rnd
+
+    def slot(self):
+        with self._lock:
+            if not self.free_slots:
+                raise RuntimeError('out of free slots; seed more with --slots')
+            return self.free_slots.pop()
+
+
+# ---------- scenarios ----------
+# each returns (method, url, kwargs, ok_statuses); role is who is logged in
+
+def _book(fx, rnd):
+    slot_id, doc_id, dept_id = fx.slot()
+    return 'POST', '/patient/book', {'data': {'department_id': dept_id, 'doctor_id': doc_id,
+                                              'availability_id': slot_id}}, (302,)
+
+
+def _api_book(fx, rnd):
+    slot_id, _, _ = fx.slot()
+    patient_id, _ = rnd.choice(fx.patients)
+    return 'POST', '/api/appointments', {'json': {'patient_id': patient_id, 'availability_id': slot_id}}, (201,)
+
+
+SCENARIOS = {
+    # name: (role, request builder)
+    'patient.book': ('patient', _book),
+    'patient.reschedule_appointment': ('patient', None),    # needs the patient's own appointment, see _reschedule
+    'doctor.dashboard': ('doctor', lambda fx, rnd: ('GET', '/doctor/', {}, (200,))),
+    'admin.appointments_list': ('admin', lambda fx, rnd: ('GET', '/admin/appointments', {}, (200,))),
+    'api GET /api/appointments': ('admin', lambda fx, rnd: (
+        'GET', f'/api/appointments?doctor_id={rnd.choice(fx.doctors)[0]}&limit=50', {}, (200,))),
+    'api GET /api/appointments (ndjson, one doctor)': ('admin', lambda fx, rnd: (
+        'GET', f'/api/appointments?doctor_id={rnd.choice(fx.doctors)[0]}&format=ndjson', {}, (200,))),
+    'api POST /api/appointments': ('admin', _api_book),
+    'api PUT /api/appointments/<id>': ('admin', lambda fx, rnd: (
+        'PUT', f'/api/appointments/{rnd.choice(fx.appointments)}', {'json': {'status': 'completed'}}, (200,))),
+    'api GET /api/departments/<id>/doctors': ('admin', lambda fx, rnd: (
+        'GET', f'/api/departments/{rnd.choice(fx.departments)}/doctors', {}, (200, 304))),
+    'api GET /api/doctors/<id>/availability': ('admin', lambda fx, rnd: (
+        'GET', f'/api/doctors/{rnd.choice(fx.doctors)[0]}/availability', {}, (200, 304))),
+}
+# DELETE /api/appointments/<id> runs last in the test-client phase, on appointments it created itself
+
+
+def _user_for(role, fx, rnd):
+    if role == 'admin':
+        return fx.admin_user
+    if role == 'doctor':
+        return rnd.choice(fx.doctors)[1]
+    return rnd.choice(fx.patients)[1]
+
+
+def _summary(samples, wall, errors):
+    out = percentiles(samples) if samples else {'n': 0}
+    out['req_per_sec'] = round(len(samples) / wall, 1) if wall else None
+    out['errors'] = errors
+    return out
+
+
+# ---------- phase 1: Flask test client, one request at a time ----------
+
+def run_testclient(app, fx, rnd, n):
+    client = app.test_client()
+    results = {}
+    for name, (role, build) in SCENARIOS.items():
+        if build is None:
+            continue
+        samples, errors = [], 0
+        user_id = _user_for(role, fx, rnd)
+        login_as(client, user_id)
+        start = time.perf_counter()
+        for _ in range(n):
+            method, url, kwargs, ok = build(fx, rnd)
+            t0 = time.perf_counter()
+            r = client.open(url, method=method, **kwargs)
+            samples.append(time.perf_counter() - t0)
+            errors += r.status_code not in ok
+        results[name] = _summary(samples, time.perf_counter() - start, errors)
+
+    # reschedule: book slots for one patient, then move each to another free slot
+    patient_id, patient_user = fx.patients[0]
+    with app.app_context():
+        from app import booking
+        own = []
+        for _ in range(n):
+            appt, error = booking.book_slot(patient_id, fx.slot()[0])
+            if appt is not None:
+                own.append(appt.id)
+    login_as(client, patient_user)
+    samples, errors = [], 0
+    start = time.perf_counter()
+    for appt_id in own:
+        t0 = time.perf_counter()
+        r = client.post(f'/patient/appointments/{appt_id}/reschedule', data={'availability_id': fx.slot()[0]})
+        samples.append(time.perf_counter() - t0)
+        errors += r.status_code != 302
+    results['patient.reschedule_appointment'] = _summary(samples, time.perf_counter() - start, errors)
+
+    # DELETE the appointments the reschedule step used
+    login_as(client, fx.admin_user)
+    samples, errors = [], 0
+    start = time.perf_counter()
+    for appt_id in own:
+        t0 = time.perf_counter()
+        r = client.delete(f'/api/appointments/{appt_id}')
+        samples.append(time.perf_counter() - t0)
+        errors += r.status_code != 200
+    results['api DELETE /api/appointments/<id>'] = _summary(samples, time.perf_counter() - start, errors)
+    return results
+
+
+# ---------- phase 2: concurrent clients over real HTTP ----------
+
+class _HttpClient:
+    """urllib opener with its own cookie jar, logged in through the real login form."""
+
+    def __init__(self, base, username, password=PASSWORD):
+        self.base = base
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        self.open('POST', '/auth/login', {'data': {'username': username, 'password': password}})
+
+    def open(self, method, url, kwargs):
+        data, headers = None, {}
+        if 'json' in kwargs:
+            data = json.dumps(kwargs['json']).encode()
+            headers['Content-Type'] = 'application/json'
+        elif 'data' in kwargs:
+            data = urllib.parse.urlencode(kwargs['data']).encode()
+        req = urllib.request.Request(self.base + url, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_http(app, fx, rnd, concurrency, seconds):
+    from werkzeug.serving import make_server
+    from app.models import User
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)     # no per-request access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    with app.app_context():
+        names = {u.id: u.username for u in User.query.filter(User.id.in_(
+            [fx.admin_user] + [d[1] for d in fx.doctors] + [p[1] for p in fx.patients]))}
+
+    results = {}
+    try:
+        for name, (role, build) in SCENARIOS.items():
+            if build is None:
+                continue
+            clients = []
+            for i in range(concurrency):
+                c_rnd = random.Random(rnd.random())
+                user = _user_for(role, fx, c_rnd)
+                # the admin account comes from bootstrap(), not datagen
+                password = 'adminpass' if role == 'admin' else PASSWORD
+                clients.append((_HttpClient(base, names[user], password), c_rnd))
+
+            def worker(client_and_rnd):
+                client, c_rnd = client_and_rnd
+                samples, errors = [], 0
+                deadline = time.perf_counter() + seconds
+                while time.perf_counter() < deadline:
+                    method, url, kwargs, ok = build(fx, c_rnd)
+                    t0 = time.perf_counter()
+                    status = client.open(method, url, kwargs)
+                    samples.append(time.perf_counter() - t0)
+                    errors += status not in ok
+                return samples, errors
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                parts = list(pool.map(worker, clients))
+            wall = time.perf_counter() - start
+            results[name] = _summary([s for p, _ in parts for s in p], wall, sum(e for _, e in parts))
+            results[name]['concurrency'] = concurrency
+    finally:
+        server.shutdown()
+    return results
+
+
+# ---------- results ----------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(new, old):
+    """Print p50/p95 change per scenario against an earlier result file."""
+    for phase in ('testclient', 'http'):
+        for name, cur in new.get(phase, {}).items():
+            prev = old.get(phase, {}).get(name)
+            if not prev or not prev.get('n') or not cur.get('n'):
+                continue
+            delta = lambda k: (cur[k] - prev[k]) / prev[k] * 100 if prev[k] else 0.0
+            print(f"{phase:10} {name:50} p50 {prev['p50_ms']:8.2f} -> {cur['p50_ms']:8.2f} ms ({delta('p50_ms'):+.0f}%)"
+                  f"  p95 {prev['p95_ms']:8.2f} -> {cur['p95_ms']:8.2f} ms ({delta('p95_ms'):+.0f}%)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--db', help='existing database from bench.datagen (default: seed a scratch one)')
+    ap.add_argument('--patients', type=int, default=20000)
+    ap.add_argument('--appointments', type=int, default=200000)
+    ap.add_argument('--slots', type=int, default=50000)
+    ap.add_argument('-n', '--requests', type=int, default=200, help='requests per scenario (test client)')
+    ap.add_argument('--http', action='store_true', help='also run the concurrent HTTP phase')
+    ap.add_argument('--concurrency', type=int, default=8)
+    ap.add_argument('--seconds', type=float, default=5, help='per scenario (HTTP phase)')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--out', help='write results as JSON')
+    ap.add_argument('--compare', help='earlier JSON result to compare against')
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    scratch = args.db is None
+    app, db_path = scratch_app(args.db, METRICS_ENABLED=False)
+    sizes = None
+    if scratch:
+        info = seed(db_path, patients=args.patients, appointments=args.appointments,
+                    slots=args.slots, histories=args.appointments // 10, rng_seed=args.seed)
+        sizes = {k: v for k, v in info.items() if not k.endswith('_ids')}
+        with app.app_context():
+            from app import search
+            search.rebuild()
+
+    try:
+        fx = Fixtures(app, rnd, reserve=args.requests * 4 + 200000)
+        result = {
+            'meta': {'commit': _git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'python': platform.python_version(), 'db': 'scratch' if scratch else args.db,
+                     'sizes': sizes, 'requests_per_scenario': args.requests},
+            'testclient': run_testclient(app, fx, rnd, args.requests),
+        }
+        if args.http:
+            result['http'] = run_http(app, fx, rnd, args.concurrency, args.seconds)
+    finally:
+        if scratch:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
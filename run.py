@@ -3,4 +3,9 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    # the development server sets up its own database; deployments run
+    # `flask --app run bootstrap` before starting the workers
+    from app.bootstrap import bootstrap
+    with app.app_context():
+        bootstrap()
     app.run(debug=True)